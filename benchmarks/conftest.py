@@ -0,0 +1,95 @@
+"""
+Benchmarks for the curation and catalogue hot paths, using pytest-benchmark.
+
+Usage: python -m pytest benchmarks [--scale 1000,10000,100000]
+       [--benchmark-json out.json]
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+import uproot
+import yaml
+
+from fasthep_curator import write
+
+NDATASETS = 100
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--scale",
+        default="1000",
+        help="Comma-separated numbers of files to benchmark with, e.g. 1000,10000,100000",
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if "scale" in metafunc.fixturenames:
+        scales = [int(s) for s in metafunc.config.getoption("scale").split(",")]
+        metafunc.parametrize("scale", scales, scope="session")
+
+
+@pytest.fixture(scope="session")
+def root_file_dir(tmp_path_factory, scale) -> Path:
+    """
+    Directory with ``scale`` small ROOT files, hard-linked from one template
+    """
+    directory = tmp_path_factory.mktemp(f"root_files_{scale}")
+    template = directory / "template.root.in"
+    with uproot.recreate(template) as f:
+        f["events"] = {"ev": np.arange(100), "pt": np.ones(100)}
+    for i in range(scale):
+        target = directory / f"tree_{i}.root"
+        try:
+            os.link(template, target)
+        except OSError:
+            shutil.copy(template, target)
+    return directory
+
+
+@pytest.fixture(scope="session")
+def root_files(root_file_dir) -> list[str]:
+    return sorted(str(f) for f in root_file_dir.glob("*.root"))
+
+
+def make_datasets(nfiles: int) -> list[dict]:
+    per_dataset = max(nfiles // NDATASETS, 1)
+    return [
+        {
+            "name": f"dataset_{i}",
+            "eventtype": "mc" if i % 4 else "data",
+            "tree": "events",
+            "prefix": [{"default": "root://host//"}],
+            "nevents": 100 * per_dataset,
+            "nfiles": per_dataset,
+            "files": [
+                f"{{prefix}}/store/dataset_{i}/tree_{j}.root"
+                for j in range(per_dataset)
+            ],
+        }
+        for i in range(min(NDATASETS, nfiles))
+    ]
+
+
+@pytest.fixture(scope="session")
+def datasets(scale) -> list[dict]:
+    """
+    Synthetic catalogue content with ``scale`` files spread over datasets
+    """
+    return make_datasets(scale)
+
+
+@pytest.fixture(scope="session")
+def catalogue_file(tmp_path_factory, datasets, scale) -> str:
+    path = tmp_path_factory.mktemp(f"catalogue_{scale}") / "catalogue.yml"
+    contents = write.prepare_contents([dict(d) for d in datasets])
+    path.write_text(
+        yaml.dump(contents, Dumper=write.CatalogueDumper, default_flow_style=False)
+    )
+    return str(path)
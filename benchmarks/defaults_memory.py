@@ -0,0 +1,64 @@
+"""
+Compare the memory used by datasets that each copy the catalogue defaults with
+datasets sharing a single defaults layer (see read.from_string).
+
+Usage: python benchmarks/defaults_memory.py [--ndatasets 10000] [--nkeys 50]
+"""
+
+from __future__ import annotations
+
+import argparse
+import tracemalloc
+from collections.abc import Callable
+from typing import Any
+
+from fasthep_curator import read
+
+
+def make_defaults(nkeys: int, nbranches: int) -> dict[str, Any]:
+    defaults: dict[str, Any] = {f"meta_{i}": f"value_{i}" for i in range(nkeys)}
+    defaults["tree"] = "Events"
+    defaults["branches"] = {f"branch_{i}": 1 for i in range(nbranches)}
+    return defaults
+
+
+def copied(name: str, defaults: dict[str, Any]) -> dict[str, Any]:
+    # what from_string did before datasets shared their defaults
+    dataset = defaults.copy()
+    dataset["name"] = name
+    return dataset
+
+
+def measure(
+    create: Callable[[str, dict[str, Any]], Any],
+    ndatasets: int,
+    defaults: dict[str, Any],
+) -> tuple[int, list[Any]]:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    datasets = [create(f"dataset_{i}", defaults) for i in range(ndatasets)]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used, datasets
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ndatasets", type=int, default=10_000)
+    parser.add_argument("--nkeys", type=int, default=50)
+    parser.add_argument("--nbranches", type=int, default=1500)
+    args = parser.parse_args()
+
+    defaults = make_defaults(args.nkeys, args.nbranches)
+    print(f"{args.ndatasets} datasets with {len(defaults)} default keys")
+    results = {}
+    for name, create in {"copied": copied, "shared": read.from_string}.items():
+        used, datasets = measure(create, args.ndatasets, defaults)
+        results[name] = used
+        print(f"  {name:>7}: {used / 2**20:8.2f} MiB")
+        assert datasets[-1]["tree"] == "Events"
+    print(f"  reduction: {results['copied'] / results['shared']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import shutil
+
+from fasthep_curator import read, write
+
+
+def test_prepare_contents(benchmark, datasets):
+    contents = benchmark(lambda: write.prepare_contents([dict(d) for d in datasets]))
+    assert len(contents["datasets"]) == len(datasets)
+
+
+def test_write_yaml(benchmark, datasets, tmp_path):
+    out_file = str(tmp_path / "catalogue.yml")
+
+    def write_all():
+        write.write_yaml(dict(datasets[0]), out_file, append=False)
+        for dataset in datasets[1:]:
+            write.write_yaml(dict(dataset), out_file)
+
+    benchmark.pedantic(write_all, rounds=3)
+    assert len(read.from_yaml(out_file)) == len(datasets)
+
+
+def test_write_yaml_append_one(benchmark, datasets, catalogue_file, tmp_path):
+    out_file = tmp_path / "catalogue.yml"
+
+    def setup():
+        shutil.copy(catalogue_file, out_file)
+
+    new = dict(datasets[0], name="appended")
+    benchmark.pedantic(
+        write.write_yaml, args=(new, str(out_file)), setup=setup, rounds=5
+    )
+
+
+def test_from_yaml(benchmark, catalogue_file, datasets):
+    result = benchmark(read.from_yaml, catalogue_file)
+    assert len(result) == len(datasets)
+
+
+def test_from_yaml_files(benchmark, catalogue_file, scale):
+    def load_files():
+        return sum(len(d.files) for d in read.from_yaml(catalogue_file))
+
+    assert benchmark(load_files) == scale
+
+
+def test_write_yaml_sharded(benchmark, datasets, tmp_path_factory):
+    def write_all():
+        out_dir = tmp_path_factory.mktemp("sharded")
+        for dataset in datasets:
+            write.write_yaml(dict(dataset), f"{out_dir}/")
+        return out_dir
+
+    out_dir = benchmark.pedantic(write_all, rounds=3)
+    assert len(read.from_yaml(str(out_dir))) == len(datasets)
@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+import glob
+
+from fasthep_curator.catalogues.common import (
+    check_entries_uproot,
+    expand_file_list_generic,
+)
+
+
+def test_expand_file_list_generic(benchmark, root_file_dir, scale):
+    files = [str(root_file_dir / "*.root")]
+    result = benchmark(expand_file_list_generic, files, None, glob.glob)
+    assert len(result) == scale
+
+
+def test_check_entries_uproot(benchmark, root_files, scale):
+    files, nevents, branches = benchmark.pedantic(
+        check_entries_uproot,
+        args=(root_files, "events"),
+        kwargs={"disallow_empty": True, "confirm_tree": False, "list_branches": True},
+        rounds=3,
+    )
+    assert len(files) == scale
+    assert nevents == 100 * scale
+    assert branches["events"]["ev"] == scale
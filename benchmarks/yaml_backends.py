@@ -0,0 +1,77 @@
+"""
+Compare the pure-Python and libyaml backends used to read and write catalogues.
+
+Usage: python benchmarks/yaml_backends.py [--nfiles 100000] [--ndatasets 10]
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from collections.abc import Callable
+from typing import Any
+
+import yaml
+
+from fasthep_curator import read, write
+
+
+def make_catalogue(nfiles: int, ndatasets: int) -> dict[str, Any]:
+    per_dataset = max(nfiles // ndatasets, 1)
+    datasets = [
+        {
+            "name": f"dataset_{i}",
+            "eventtype": "mc",
+            "nevents": 1000 * per_dataset,
+            "nfiles": per_dataset,
+            "files": [
+                f"{{prefix}}/store/mc/dataset_{i}/NANOAODSIM/tree_{j}.root"
+                for j in range(per_dataset)
+            ],
+        }
+        for i in range(ndatasets)
+    ]
+    return {
+        "defaults": {"tree": "Events", "prefix": [{"default": "root://host//"}]},
+        "datasets": datasets,
+    }
+
+
+def timed(func: Callable[[], Any]) -> tuple[float, Any]:
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--nfiles", type=int, default=100_000)
+    parser.add_argument("--ndatasets", type=int, default=10)
+    args = parser.parse_args()
+
+    contents = make_catalogue(args.nfiles, args.ndatasets)
+    dumpers = {
+        "pure-python": write._catalogue_dumper(yaml.Dumper),
+        "selected": write.CatalogueDumper,
+    }
+    loaders = {"pure-python": yaml.SafeLoader, "selected": read.SafeLoader}
+
+    print(f"libyaml available: {yaml.__with_libyaml__}")
+    print(f"catalogue with {args.nfiles} files in {args.ndatasets} datasets")
+    outputs = {}
+    for name, dumper in dumpers.items():
+        elapsed, outputs[name] = timed(
+            lambda d=dumper: yaml.dump(contents, Dumper=d, default_flow_style=False)
+        )
+        print(f"  dump {name:>12}: {elapsed:7.3f} s")
+    assert outputs["pure-python"] == outputs["selected"]
+
+    text = outputs["selected"]
+    for name, loader in loaders.items():
+        elapsed, loaded = timed(lambda ld=loader: yaml.load(text, Loader=ld))
+        print(f"  load {name:>12}: {elapsed:7.3f} s")
+        assert loaded == contents
+
+
+if __name__ == "__main__":
+    main()
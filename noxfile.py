@@ -44,6 +44,16 @@ def tests(session: nox.Session) -> None:
     session.run("pytest", *session.posargs)
 
 
+@nox.session
+def bench(session: nox.Session) -> None:
+    """
+    Run the benchmarks. Pass e.g. --scale=1000,10000,100000 to change the
+    number of files.
+    """
+    session.install("-e.[bench]")
+    session.run("pytest", "benchmarks", *session.posargs)
+
+
 @nox.session(reuse_venv=True)
 def docs(session: nox.Session) -> None:
     """
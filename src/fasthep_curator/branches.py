@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import sys
+from array import array
+from collections import Counter
+from collections.abc import Iterable
+from typing import Any
+
+#: number of distinct branch lists kept by share_branches
+_MAX_SHARED = 1024
+_shared: dict[tuple[str, ...], tuple[str, ...]] = {}
+
+
+def share_branches(branches: Iterable[str]) -> tuple[str, ...]:
+    """
+    The branch names of a file as a tuple that is shared with all other files
+    with the same branches, with interned names. Files of a dataset almost
+    always have the same branches, so this keeps one copy per dataset
+    instead of one per file.
+    """
+    branches = tuple(branches)
+    shared = _shared.get(branches)
+    if shared is None:
+        if len(_shared) >= _MAX_SHARED:
+            _shared.clear()
+        shared = _shared.setdefault(branches, tuple(map(sys.intern, branches)))
+    return shared
+
+
+class BranchCatalogue:
+    """
+    Branches of the files of one tree, stored compactly: each branch name is
+    kept once and numbered, each distinct set of branches (schema) once as a
+    bitset of those numbers, and for every file only the number of its schema.
+
+    Branch counts and the files with or without a branch are computed per
+    schema rather than per file.
+    """
+
+    def __init__(self) -> None:
+        self.names: list[str] = []
+        self._ids: dict[str, int] = {}
+        #: bitset of the branch numbers in each schema
+        self.schemas: list[int] = []
+        self._members: list[tuple[int, ...]] = []
+        self._schema_ids: dict[int, int] = {}
+        self._by_branches: dict[tuple[str, ...], int] = {}
+        #: schema number of each file
+        self.files = array("I")
+
+    @classmethod
+    def from_files(cls, branches: Iterable[Iterable[str]]) -> BranchCatalogue:
+        """A catalogue with the branch names of each file, in order"""
+        catalogue = cls()
+        for file_branches in branches:
+            catalogue.add(file_branches)
+        return catalogue
+
+    def add(self, branches: Iterable[str]) -> int:
+        """
+        Add a file with the given branches.
+
+        Returns:
+            int: The number of the file's schema.
+        """
+        key = tuple(branches)
+        schema = self._by_branches.get(key)
+        if schema is None:
+            schema = self._add_schema(key)
+            self._by_branches[key] = schema
+        self.files.append(schema)
+        return schema
+
+    def _add_schema(self, branches: tuple[str, ...]) -> int:
+        members = tuple(sorted({self._branch_id(name) for name in branches}))
+        bits = 0
+        for member in members:
+            bits |= 1 << member
+        schema = self._schema_ids.get(bits)
+        if schema is None:
+            schema = self._schema_ids[bits] = len(self.schemas)
+            self.schemas.append(bits)
+            self._members.append(members)
+        return schema
+
+    def _branch_id(self, name: str) -> int:
+        branch_id = self._ids.get(name)
+        if branch_id is None:
+            branch_id = self._ids[name] = len(self.names)
+            self.names.append(sys.intern(name))
+        return branch_id
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def schema(self, schema: int) -> tuple[str, ...]:
+        """The branch names of a schema, in the order of their numbers"""
+        return tuple(self.names[member] for member in self._members[schema])
+
+    def file_branches(self, index: int) -> tuple[str, ...]:
+        """
+        The branch names of the file with the given index.
+
+        Only the set of names is stored, so they are returned in the order in
+        which the catalogue first saw them: the order of the first file and
+        then that of new names as later files added them, not necessarily
+        the order within this file.
+        """
+        return self.schema(self.files[index])
+
+    def counts(self) -> dict[str, int]:
+        """The number of files with each branch"""
+        counts = dict.fromkeys(self.names, 0)
+        for schema, nfiles in Counter(self.files).items():
+            for member in self._members[schema]:
+                counts[self.names[member]] += nfiles
+        return counts
+
+    def _files_where(self, branch: str, present: bool) -> list[int]:
+        branch_id = self._ids.get(branch)
+        selected = {
+            schema
+            for schema, bits in enumerate(self.schemas)
+            if branch_id is not None and (bits >> branch_id) & 1
+        }
+        if not present:
+            selected = set(range(len(self.schemas))) - selected
+        return [index for index, schema in enumerate(self.files) if schema in selected]
+
+    def files_with(self, branch: str) -> list[int]:
+        """Indices of the files that have the given branch"""
+        return self._files_where(branch, True)
+
+    def files_without(self, branch: str) -> list[int]:
+        """Indices of the files that lack the given branch"""
+        return self._files_where(branch, False)
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Compact form for catalogues: the branch names, each schema as a
+        hexadecimal bitset over them and the schema of each file.
+        """
+        return {
+            "names": list(self.names),
+            "schemas": [format(bits, "x") for bits in self.schemas],
+            "files": self.files.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> BranchCatalogue:
+        """Inverse of to_dict"""
+        catalogue = cls()
+        for name in data["names"]:
+            catalogue._branch_id(name)
+        for encoded in data["schemas"]:
+            bits = int(encoded, 16)
+            members = tuple(i for i in range(bits.bit_length()) if (bits >> i) & 1)
+            catalogue._schema_ids[bits] = len(catalogue.schemas)
+            catalogue.schemas.append(bits)
+            catalogue._members.append(members)
+        catalogue.files.extend(data["files"])
+        return catalogue
@@ -2,10 +2,12 @@ from __future__ import annotations
 
 # from . import cms_das as CMSDASExpander
 from .common import Expander, LocalGlobExpander, XrootdExpander
+from .scandir import ScandirExpander
 
 known_expanders: dict[str, type[Expander]] = {
     "xrootd": XrootdExpander,
     "local": LocalGlobExpander,
+    "scandir": ScandirExpander,
     # "cmsdas": CMSDASExpander,
 }
 
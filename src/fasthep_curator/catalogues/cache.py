@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from typing import Any
+from urllib.parse import urlparse
+
+from .inspection import FileInfo, TreeInfo
+
+try:
+    from XRootD import client as xrd_client
+except ImportError:
+    xrd_client = None
+
+Signature = tuple[int, int]
+#: ``os.stat`` or a replacement for it, e.g. ScandirGlob.stat
+StatFunction = Callable[[str], os.stat_result]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    accessed REAL NOT NULL,
+    trees TEXT NOT NULL
+)
+"""
+
+
+def file_signature(path: str, stat: StatFunction | None = None) -> Signature | None:
+    """
+    Get the (size, modification time) of a file, used to tell if cached
+    information is still valid.
+
+    Args:
+        path (str): Path or URL of the file.
+        stat (StatFunction | None): Function to stat local files with, e.g.
+            one answering from the directory listings of the file expansion;
+            ``os.stat`` by default.
+
+    Returns:
+        Signature | None: The signature, or None if it cannot be determined.
+    """
+    url = urlparse(path)
+    if url.scheme in ("", "file"):
+        try:
+            result = (stat or os.stat)(url.path if url.scheme else path)
+        except OSError:
+            return None
+        return result.st_size, result.st_mtime_ns
+    if url.scheme in ("root", "roots") and xrd_client is not None:
+        filesystem = xrd_client.FileSystem(f"{url.scheme}://{url.netloc}")
+        status, info = filesystem.stat(url.path)
+        if not status.ok:
+            return None
+        return int(info.size), int(info.modtime)
+    return None
+
+
+def _encode_trees(
+    trees: dict[str, TreeInfo], list_branches: bool, list_clusters: bool = False
+) -> dict[str, Any]:
+    return {
+        name: [
+            info.exists,
+            info.entries,
+            list(info.branches) if list_branches else None,
+            list(info.clusters) if list_clusters else None,
+        ]
+        for name, info in trees.items()
+    }
+
+
+def _cached_clusters(encoded_tree: list[Any]) -> list[int] | None:
+    # entries written before cluster boundaries were recorded have no slot
+    return encoded_tree[3] if len(encoded_tree) > 3 else None
+
+
+class FileInfoCache:
+    """
+    On-disk (SQLite) cache of per-file inspection results.
+
+    Entries are keyed by path and are only used while the size and
+    modification time of the file are unchanged. When ``max_entries`` is
+    given, the least recently used files are evicted beyond that number.
+    """
+
+    def __init__(
+        self, path: str | os.PathLike[str], max_entries: int | None = None
+    ) -> None:
+        self.path = str(path)
+        self.max_entries = max_entries
+        # only ever used from one thread at a time, but not necessarily the
+        # thread that created it (e.g. by the asynchronous API)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute(_SCHEMA)
+        self._connection.commit()
+
+    # typing.Self needs Python 3.11
+    def __enter__(self) -> FileInfoCache:  # noqa: PYI034
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        (count,) = self._connection.execute("SELECT COUNT(*) FROM files").fetchone()
+        return int(count)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    @staticmethod
+    def _signatures(
+        files: Iterable[str],
+        executor: Executor | None,
+        stat: StatFunction | None,
+    ) -> dict[str, Signature | None]:
+        # taken afresh for every lookup and store, as the files may change
+        # while the cache is open
+        paths = list(dict.fromkeys(files))
+        # a custom stat function is not sent to other processes
+        if (
+            executor is not None
+            and len(paths) > 1
+            and (stat is None or isinstance(executor, ThreadPoolExecutor))
+        ):
+            signatures = executor.map(partial(file_signature, stat=stat), paths)
+            return dict(zip(paths, signatures))
+        return {path: file_signature(path, stat) for path in paths}
+
+    def _rows(self, files: list[str]) -> dict[str, tuple[int, int, str]]:
+        rows: dict[str, tuple[int, int, str]] = {}
+        unique = list(dict.fromkeys(files))
+        # stay well below SQLite's limit on the number of bound parameters
+        for start in range(0, len(unique), 500):
+            batch = unique[start : start + 500]
+            query = "SELECT path, size, mtime, trees FROM files WHERE path IN (%s)"
+            query %= ", ".join("?" * len(batch))
+            for path, size, mtime, trees in self._connection.execute(query, batch):
+                rows[path] = (size, mtime, trees)
+        return rows
+
+    def lookup(
+        self,
+        files: list[str],
+        tree_names: list[str],
+        list_branches: bool = False,
+        list_clusters: bool = False,
+        executor: Executor | None = None,
+        stat: StatFunction | None = None,
+    ) -> dict[str, FileInfo]:
+        """
+        Find the files whose cached information is still valid and covers all
+        requested trees (and branches and clusters, if requested).
+
+        Args:
+            files (list[str]): Paths or URLs of the files.
+            tree_names (list[str]): Names of the trees that are needed.
+            list_branches (bool): Flag indicating if branch names are needed.
+            list_clusters (bool): Flag indicating if cluster boundaries are needed.
+            executor (Executor | None): Pool in which to get the signatures
+                of the files, which are otherwise looked up one at a time.
+            stat (StatFunction | None): Function to stat local files with
+                (see file_signature).
+
+        Returns:
+            dict[str, FileInfo]: The cached information for each hit, by path.
+        """
+        hits: dict[str, FileInfo] = {}
+        rows = self._rows(files)
+        signatures = self._signatures(rows, executor, stat)
+        for path, (size, mtime, encoded) in rows.items():
+            if signatures[path] != (size, mtime):
+                continue
+            trees = json.loads(encoded)
+            if not all(name in trees for name in tree_names):
+                continue
+            if list_branches and any(trees[name][2] is None for name in tree_names):
+                continue
+            if list_clusters and any(
+                _cached_clusters(trees[name]) is None for name in tree_names
+            ):
+                continue
+            hits[path] = FileInfo(
+                path=path,
+                trees={
+                    name: TreeInfo(
+                        exists=trees[name][0],
+                        entries=trees[name][1],
+                        branches=tuple(trees[name][2] or ()),
+                        clusters=tuple(_cached_clusters(trees[name]) or ()),
+                    )
+                    for name in tree_names
+                },
+            )
+        if hits:
+            self._connection.executemany(
+                "UPDATE files SET accessed = ? WHERE path = ?",
+                ((time.time(), path) for path in hits),
+            )
+            self._connection.commit()
+        return hits
+
+    def store(
+        self,
+        infos: list[FileInfo],
+        list_branches: bool = False,
+        list_clusters: bool = False,
+        executor: Executor | None = None,
+        stat: StatFunction | None = None,
+    ) -> None:
+        """
+        Record freshly inspected files, merging with any still-valid trees
+        that were cached for the same file.
+        """
+        existing = self._rows([info.path for info in infos])
+        signatures = self._signatures((info.path for info in infos), executor, stat)
+        now = time.time()
+        rows = []
+        for info in infos:
+            signature = signatures[info.path]
+            if signature is None:
+                continue
+            trees: dict[str, Any] = {}
+            if info.path in existing:
+                size, mtime, encoded = existing[info.path]
+                if (size, mtime) == signature:
+                    trees = json.loads(encoded)
+            new_trees = _encode_trees(info.trees, list_branches, list_clusters)
+            for name, encoded_tree in new_trees.items():
+                if name in trees:
+                    # keep branch names and clusters recorded by an earlier inspection
+                    if encoded_tree[2] is None:
+                        encoded_tree[2] = trees[name][2]
+                    if encoded_tree[3] is None:
+                        encoded_tree[3] = _cached_clusters(trees[name])
+                trees[name] = encoded_tree
+            rows.append((info.path, *signature, now, json.dumps(trees)))
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", rows
+        )
+        self._connection.commit()
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Remove the least recently used entries beyond ``max_entries``
+        """
+        if self.max_entries is None:
+            return
+        self._connection.execute(
+            "DELETE FROM files WHERE path NOT IN "
+            "(SELECT path FROM files ORDER BY accessed DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+        self._connection.commit()
+
+    def clear(self) -> None:
+        self._connection.execute("DELETE FROM files")
+        self._connection.commit()
+
+
+def open_cache(
+    cache: FileInfoCache | str | os.PathLike[str] | None,
+) -> FileInfoCache | None:
+    if cache is None or isinstance(cache, FileInfoCache):
+        return cache
+    return FileInfoCache(cache)
@@ -1,20 +1,41 @@
 from __future__ import annotations
 
+import asyncio
 import glob as local_glob
-import operator
+import itertools
 import os
+import time
 from abc import ABC, abstractmethod
-from collections import Counter, defaultdict
-from functools import partial, reduce
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Executor
+from functools import partial
 from pathlib import Path
 from typing import Any, Callable
 from urllib.parse import urlparse
 
-import uproot
 from loguru import logger
 
+from fasthep_curator.branches import BranchCatalogue
+from fasthep_curator.metrics import (
+    CurationStats,
+    LatencyReport,
+    StageStats,
+    timed_iter,
+)
 from fasthep_curator.read import Prefix
 
+from .cache import FileInfoCache, StatFunction, open_cache
+from .inspection import (
+    DEFAULT_CONCURRENCY,
+    FileInfo,
+    failed_file_info,
+    gather_bounded,
+    inspect_files,
+    inspect_files_async,
+    iter_inspect_files,
+)
+
 try:
     from XRootD.client.glob_funcs import glob as xrd_glob
 except ImportError:
@@ -27,6 +48,10 @@ except ImportError:
 class Expander(ABC):
     """
     Base class for file list expanders
+
+    prepare_file_list uses a new instance for each expansion, so expanders
+    may keep state (e.g. directory listings) from expanding the file list to
+    normalising and checking the files.
     """
 
     @staticmethod
@@ -43,6 +68,56 @@ class Expander(ABC):
         *args: Any, **kwargs: Any
     ) -> tuple[list[str], dict[str, int] | int, dict[str, Any]]: ...
 
+    @classmethod
+    def iter_expand_file_list(
+        cls, files: list[str], prefix: Prefix = None
+    ) -> Iterator[str]:
+        """
+        Lazily expand ``files``, one entry at a time
+        """
+        for name in files:
+            yield from cls.expand_file_list([name], prefix=prefix)
+
+    @classmethod
+    def realpath(cls, path: str) -> str:
+        """
+        Resolve a local path when normalising the expanded file list
+        """
+        return os.path.realpath(path)
+
+    @classmethod
+    async def expand_file_list_async(
+        cls,
+        files: list[str],
+        prefix: Prefix = None,
+        limit: int = DEFAULT_CONCURRENCY,
+    ) -> list[str]:
+        """
+        Expand each entry of ``files`` concurrently, keeping their order
+        """
+        expanded = await gather_bounded(
+            partial(cls._expand_one, prefix=prefix), files, limit
+        )
+        return [path for paths in expanded for path in paths]
+
+    @classmethod
+    def _expand_one(cls, name: str, prefix: Prefix) -> list[str]:
+        return cls.expand_file_list([name], prefix=prefix)
+
+    @classmethod
+    async def check_files_async(
+        cls, *args: Any, **kwargs: Any
+    ) -> tuple[list[str], dict[str, int] | int, dict[str, Any]]:
+        """
+        Run check_files without blocking the event loop. Expanders that can
+        inspect files concurrently should override this.
+
+        The files are checked in a single worker thread, which is within any
+        ``limit``, so ``limit`` is not passed on to check_files.
+        """
+        kwargs.pop("limit", None)
+        return await asyncio.to_thread(cls.check_files, *args, **kwargs)
+
 
 class XrootdExpander(Expander):
     """
@@ -70,6 +145,12 @@ class XrootdExpander(Expander):
     ) -> tuple[list[str], dict[str, int] | int, dict[str, Any]]:
         return check_entries_uproot(*args, **kwargs)  # type: ignore[arg-type]
 
+    @classmethod
+    async def check_files_async(
+        cls, *args: Any, **kwargs: Any
+    ) -> tuple[list[str], dict[str, int] | int, dict[str, Any]]:
+        return await check_entries_uproot_async(*args, **kwargs)
+
 
 class LocalGlobExpander(Expander):
     """
@@ -86,97 +167,291 @@ class LocalGlobExpander(Expander):
     def expand_file_list(files: list[str], prefix: Prefix = None) -> list[str]:
         return expand_file_list_generic(files, prefix, glob=LocalGlobExpander.glob)
 
+    @classmethod
+    def iter_expand_file_list(
+        cls, files: list[str], prefix: Prefix = None
+    ) -> Iterator[str]:
+        return iter_expand_file_list(files, prefix, glob=local_glob.iglob)
+
     @staticmethod
     def check_files(
         *args: list[Any], **kwargs: dict[str, Any]
     ) -> tuple[list[str], dict[str, int] | int, dict[str, Any]]:
         return check_entries_uproot(*args, **kwargs)  # type: ignore[arg-type]
 
+    @classmethod
+    async def check_files_async(
+        cls, *args: Any, **kwargs: Any
+    ) -> tuple[list[str], dict[str, int] | int, dict[str, Any]]:
+        return await check_entries_uproot_async(*args, **kwargs)
+
 
 def expand_file_list_generic(
-    files: list[str], prefix: Prefix, glob: Callable[..., list[str]]
+    files: list[str], prefix: Prefix, glob: Callable[..., Iterable[str]]
 ) -> list[str]:
-    full_list: list[str] = []
+    return list(iter_expand_file_list(files, prefix, glob))
+
+
+def iter_expand_file_list(
+    files: list[str], prefix: Prefix, glob: Callable[..., Iterable[str]]
+) -> Iterator[str]:
+    """
+    Expand wild-carded paths, yielding matches as the glob produces them.
+
+    Args:
+        files (list[str]): Paths, URLs or patterns to expand.
+        prefix (Prefix): Prefix for relative paths.
+        glob (Callable[..., Iterable[str]]): Function expanding a single pattern.
+
+    Returns:
+        Iterator[str]: The matching paths.
+    """
     for name in files:
         path = str(name)
         scheme = urlparse(path).scheme
         if not scheme and not Path(path).is_absolute():
             path = str(Path(str(prefix)) / path) if prefix else os.path.relpath(path)
-        expanded = glob(path)
-        full_list += map(str, expanded)
-    return full_list
+        yield from map(str, glob(path))
 
 
-def _tree_exists(file: str, tree_name: str) -> bool:
-    with uproot.open(file) as f:
-        if tree_name in f:
-            return True
-    return False
+def uproot_num_entries(files: list[str], tree_name: str) -> dict[str, Any]:
+    return {
+        info.path: info.entries(tree_name) for info in inspect_files(files, [tree_name])
+    }
 
 
-def uproot_num_entries(files: list[str], tree_name: str) -> dict[str, Any]:
-    func = uproot.numentries if hasattr(uproot, "numentries") else uproot.num_entries
-    good_files = [f for f in files if _tree_exists(f, tree_name)]
-    missing_trees = [f for f in files if f not in good_files]
-    input_files = [f"{file}:{tree_name}" for file in good_files]
-    numentries = dict.fromkeys(missing_trees, 0)
-    if not input_files:
-        return numentries
-    for file, _, entries in func(input_files):
-        numentries[file] = entries
-    return numentries
+def _normalise_tree_names(tree_names: str | list[str]) -> list[str]:
+    if not isinstance(tree_names, (tuple, list)):
+        return [tree_names]
+    return list(tree_names)
 
 
-def check_entries_uproot(
-    files: list[str],
-    tree_names: str | list[str],
+def summarise_file_infos(
+    infos: list[FileInfo],
+    tree_names: list[str],
     disallow_empty: bool,
     confirm_tree: bool = True,
     list_branches: bool = False,
-    ignore_inaccessible: bool = False,
+    file_entries: dict[str, list[int]] | None = None,
+    file_clusters: dict[str, list[list[int]]] | None = None,
+    branch_schemas: dict[str, BranchCatalogue] | None = None,
 ) -> tuple[list[str], dict[str, Any] | int, dict[str, Any]]:
+    """
+    Turn per-file inspection results into the file list, entry counts and
+    branch counts reported by ``check_files``.
+
+    If ``file_entries`` is given, it is filled with the number of entries of
+    each returned file for every tree, in the order of the returned files.
+    ``file_clusters`` is filled the same way with the cluster boundaries, and
+    ``branch_schemas`` with the branches of the returned files (see
+    BranchCatalogue) if branches are listed.
+    """
     disallow_empty = disallow_empty or confirm_tree
-    if not isinstance(tree_names, (tuple, list)):
-        tree_names = [tree_names]
-
-    if ignore_inaccessible:
-        files = [f for f in files if os.access(f, os.R_OK)]
+    files = [info.path for info in infos]
 
+    n_entries: dict[str, Any]
     if not disallow_empty:
-        n_entries = {tree: uproot_num_entries(files, tree) for tree in tree_names}
+        n_entries = {
+            tree: {info.path: info.entries(tree) for info in infos}
+            for tree in tree_names
+        }
     else:
-        n_entries = dict.fromkeys(tree_names, 0)  # type: ignore[arg-type]
+        n_entries = dict.fromkeys(tree_names, 0)
         missing_trees = defaultdict(list)
+        keep = [True] * len(infos)
         for tree in tree_names:
-            totals = uproot_num_entries(files, tree)
-
-            for name, entries in totals.items():
-                n_entries[tree] += entries
-                if entries <= 0:
-                    files.remove(name)
-                if (confirm_tree and entries == 0) and tree not in uproot.open(name):
-                    missing_trees[tree].append(name)
+            for index, info in enumerate(infos):
+                if not keep[index]:
+                    continue
+                tree_info = info.trees[tree]
+                n_entries[tree] += tree_info.entries
+                if tree_info.entries <= 0:
+                    keep[index] = False
+                if confirm_tree and not tree_info.exists:
+                    missing_trees[tree].append(info.path)
         if missing_trees:
-            missing_files: set[str] = set(
-                reduce(operator.iadd, (list(v) for v in missing_trees.values()), [])
-            )
+            missing_files = {f for names in missing_trees.values() for f in names}
             msg = "Missing at least one tree (%s) for %d file(s): %s"
             msg = msg % (
                 ", ".join(missing_trees),
-                len(missing_trees),
-                ", ".join(missing_files),
+                len(missing_files),
+                ", ".join(sorted(missing_files)),
             )
             raise RuntimeError(msg)
+        infos = list(itertools.compress(infos, keep))
+        files = [info.path for info in infos]
 
     branches: dict[str, Any] = {}
     if list_branches:
         for tree in tree_names:
-            open_files = (uproot.open(f) for f in files)
-            all_branches = (
-                f[tree].keys(recursive=True) for f in open_files if tree in f
+            catalogue = BranchCatalogue.from_files(
+                info.trees[tree].branches for info in infos
             )
-            branches[tree] = dict(Counter(reduce(operator.iadd, all_branches, [])))
+            branches[tree] = catalogue.counts()
+            if branch_schemas is not None:
+                branch_schemas[tree] = catalogue
+
+    if file_entries is not None:
+        for tree in tree_names:
+            file_entries[tree] = [info.entries(tree) for info in infos]
+    if file_clusters is not None:
+        for tree in tree_names:
+            file_clusters[tree] = [list(info.trees[tree].clusters) for info in infos]
 
     if len(n_entries) == 1:
         n_entries = next(iter(n_entries.values()))
     return files, n_entries, branches
+
+
+def _add_failed_latency(
+    latency: LatencyReport, infos: list[FileInfo], error: BaseException
+) -> None:
+    # the files inspected before the failure, and the failed one itself
+    latency.add_file_infos(infos)
+    failed = failed_file_info(error)
+    if failed is not None:
+        latency.add_failure(failed)
+
+
+def check_entries_uproot(
+    files: Iterable[str],
+    tree_names: str | list[str],
+    disallow_empty: bool,
+    confirm_tree: bool = True,
+    list_branches: bool = False,
+    ignore_inaccessible: bool = False,
+    jobs: int = 1,
+    executor: str | Executor = "thread",
+    cache: FileInfoCache | str | None = None,
+    stats: CurationStats | None = None,
+    latency: LatencyReport | None = None,
+    file_entries: dict[str, list[int]] | None = None,
+    file_clusters: dict[str, list[list[int]]] | None = None,
+    branch_schemas: dict[str, BranchCatalogue] | None = None,
+    stat: StatFunction | None = None,
+) -> tuple[list[str], dict[str, Any] | int, dict[str, Any]]:
+    """
+    Inspect the files for the given trees and summarise the results, see
+    summarise_file_infos.
+
+    ``stats`` collects the time spent checking files; if ``latency`` is given,
+    the time taken to open each file and read its metadata is recorded there
+    to find slow files and storage endpoints. ``file_entries`` and
+    ``file_clusters`` receive the entries and cluster boundaries of each
+    returned file per tree; the latter are only read if requested.
+    ``branch_schemas`` receives the branches of each returned file per tree
+    when listing branches. ``stat`` is used to get the signatures of local
+    files for the cache (see cache.file_signature).
+    """
+    tree_names = _normalise_tree_names(tree_names)
+    # time spent waiting for (lazily expanded) paths is not spent checking them
+    waiting = StageStats()
+    if stats is not None:
+        files = timed_iter(files, waiting)
+    start = time.perf_counter()
+    if ignore_inaccessible:
+        files = (f for f in files if os.access(f, os.R_OK))
+
+    file_cache = open_cache(cache)
+    infos: list[FileInfo] = []
+    try:
+        infos.extend(
+            iter_inspect_files(
+                files,
+                tree_names,
+                list_branches=list_branches,
+                jobs=jobs,
+                executor=executor,
+                cache=file_cache,
+                list_clusters=file_clusters is not None,
+                stat=stat,
+            )
+        )
+    except Exception as error:
+        if latency is not None:
+            _add_failed_latency(latency, infos, error)
+        raise
+    finally:
+        if file_cache is not None and file_cache is not cache:
+            file_cache.close()
+    if stats is not None:
+        elapsed = time.perf_counter() - start - waiting.seconds
+        stats["check_entries"].add(elapsed, len(infos))
+        stats.add_file_infos(infos)
+    if latency is not None:
+        latency.add_file_infos(infos)
+    return summarise_file_infos(
+        infos,
+        tree_names,
+        disallow_empty,
+        confirm_tree,
+        list_branches,
+        file_entries,
+        file_clusters,
+        branch_schemas,
+    )
+
+
+async def check_entries_uproot_async(
+    files: list[str],
+    tree_names: str | list[str],
+    disallow_empty: bool,
+    confirm_tree: bool = True,
+    list_branches: bool = False,
+    ignore_inaccessible: bool = False,
+    limit: int = DEFAULT_CONCURRENCY,
+    executor: Executor | None = None,
+    cache: FileInfoCache | str | None = None,
+    stats: CurationStats | None = None,
+    latency: LatencyReport | None = None,
+    file_entries: dict[str, list[int]] | None = None,
+    file_clusters: dict[str, list[list[int]]] | None = None,
+    branch_schemas: dict[str, BranchCatalogue] | None = None,
+    stat: StatFunction | None = None,
+) -> tuple[list[str], dict[str, Any] | int, dict[str, Any]]:
+    """
+    Asynchronous version of check_entries_uproot, with at most ``limit`` files
+    being opened at any one time.
+    """
+    tree_names = _normalise_tree_names(tree_names)
+    start = time.perf_counter()
+    if ignore_inaccessible:
+        accessible = await gather_bounded(
+            partial(os.access, mode=os.R_OK), files, limit, executor
+        )
+        files = list(itertools.compress(files, accessible))
+
+    file_cache = open_cache(cache)
+    try:
+        infos = await inspect_files_async(
+            files,
+            tree_names,
+            list_branches=list_branches,
+            limit=limit,
+            executor=executor,
+            cache=file_cache,
+            list_clusters=file_clusters is not None,
+            stat=stat,
+        )
+    except Exception as error:
+        if latency is not None:
+            _add_failed_latency(latency, [], error)
+        raise
+    finally:
+        if file_cache is not None and file_cache is not cache:
+            file_cache.close()
+    if stats is not None:
+        stats["check_entries"].add(time.perf_counter() - start, len(infos))
+        stats.add_file_infos(infos)
+    if latency is not None:
+        latency.add_file_infos(infos)
+    return summarise_file_infos(
+        infos,
+        tree_names,
+        disallow_empty,
+        confirm_tree,
+        list_branches,
+        file_entries,
+        file_clusters,
+        branch_schemas,
+    )
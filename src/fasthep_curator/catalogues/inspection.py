@@ -0,0 +1,410 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import multiprocessing
+import time
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from functools import partial
+from typing import TYPE_CHECKING, Any, Callable, TypeVar
+
+import uproot
+
+from ..branches import share_branches
+
+if TYPE_CHECKING:
+    from .cache import FileInfoCache, StatFunction
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+#: default number of concurrent operations for the asynchronous API
+DEFAULT_CONCURRENCY = 32
+#: number of paths looked up in (and written to) the cache at once
+_BATCH_SIZE = 256
+
+
+def _thread_pool(jobs: int) -> Executor:
+    return ThreadPoolExecutor(max_workers=jobs)
+
+
+def _process_pool(jobs: int) -> Executor:
+    # XRootD and uproot's file sources are not fork-safe
+    return ProcessPoolExecutor(
+        max_workers=jobs, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+known_executors: dict[str, Callable[[int], Executor]] = {
+    "thread": _thread_pool,
+    "process": _process_pool,
+}
+
+
+@dataclass
+class TreeInfo:
+    """
+    What a single file knows about one of the requested trees
+    """
+
+    exists: bool = False
+    entries: int = 0
+    branches: tuple[str, ...] = ()
+    #: entry numbers at which all branches start a new basket, from 0 to entries
+    clusters: tuple[int, ...] = ()
+
+    def __post_init__(self) -> None:
+        # files with the same branches share a single tuple of interned names
+        if self.branches:
+            self.branches = share_branches(self.branches)
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        # results from worker processes are shared as well
+        self.__dict__.update(state)
+        self.__post_init__()
+
+
+@dataclass
+class FileInfo:
+    """
+    Result of inspecting a single file for all requested trees.
+
+    The timings and number of bytes read describe how the file was inspected;
+    they are zero for results taken from a cache and are ignored when comparing.
+    """
+
+    path: str
+    trees: dict[str, TreeInfo] = field(default_factory=dict)
+    #: time taken to open the file
+    open_seconds: float = field(default=0.0, compare=False)
+    #: time taken to read the tree metadata, including listing branches
+    read_seconds: float = field(default=0.0, compare=False)
+    #: part of read_seconds spent listing branches
+    branch_seconds: float = field(default=0.0, compare=False)
+    bytes_read: int = field(default=0, compare=False)
+
+    def entries(self, tree_name: str) -> int:
+        return self.trees[tree_name].entries
+
+
+def _inspect_tree(
+    handle: Any, tree_name: str, list_branches: bool, list_clusters: bool = False
+) -> tuple[TreeInfo, float]:
+    if tree_name not in handle:
+        return TreeInfo(), 0.0
+    tree = handle[tree_name]
+    entries = int(tree.num_entries)
+    clusters = _cluster_boundaries(tree, entries) if list_clusters else ()
+    if not list_branches:
+        return TreeInfo(exists=True, entries=entries, clusters=clusters), 0.0
+    start = time.perf_counter()
+    branches = tuple(tree.keys(recursive=True))
+    elapsed = time.perf_counter() - start
+    info = TreeInfo(exists=True, entries=entries, branches=branches, clusters=clusters)
+    return info, elapsed
+
+
+def _cluster_boundaries(tree: Any, entries: int) -> tuple[int, ...]:
+    # the basket boundaries are part of the branch metadata already read
+    offsets = [int(offset) for offset in tree.common_entry_offsets()]
+    if not offsets or offsets[0] != 0:
+        offsets.insert(0, 0)
+    if offsets[-1] != entries:
+        offsets.append(entries)
+    return tuple(offsets)
+
+
+def _bytes_read(handle: Any) -> int:
+    source = getattr(handle.file, "source", None)
+    return int(getattr(source, "num_requested_bytes", 0) or 0)
+
+
+def inspect_file(
+    path: str,
+    tree_names: list[str],
+    list_branches: bool = False,
+    list_clusters: bool = False,
+) -> FileInfo:
+    """
+    Open a file once and collect the entries, presence and (optionally) branch
+    names and cluster boundaries of all requested trees.
+
+    Args:
+        path (str): Path or URL of the file to inspect.
+        tree_names (list[str]): Names of the trees to look for.
+        list_branches (bool): Flag indicating if branch names should be collected.
+        list_clusters (bool): Flag indicating if the entries at which all
+            baskets of a tree start should be collected.
+
+    Returns:
+        FileInfo: The per-tree information for this file.
+    """
+    start = time.perf_counter()
+    try:
+        with uproot.open(path) as handle:
+            opened = time.perf_counter()
+            trees = {}
+            branch_seconds = 0.0
+            for tree_name in tree_names:
+                trees[tree_name], elapsed = _inspect_tree(
+                    handle, tree_name, list_branches, list_clusters
+                )
+                branch_seconds += elapsed
+            read_seconds = time.perf_counter() - opened
+            bytes_read = _bytes_read(handle)
+    except Exception as error:
+        # kept with the exception, also when it is sent back by a worker process
+        error.file_info = FileInfo(  # type: ignore[attr-defined]
+            path=path, open_seconds=time.perf_counter() - start
+        )
+        raise
+    return FileInfo(
+        path=path,
+        trees=trees,
+        open_seconds=opened - start,
+        read_seconds=read_seconds,
+        branch_seconds=branch_seconds,
+        bytes_read=bytes_read,
+    )
+
+
+def failed_file_info(error: BaseException) -> FileInfo | None:
+    """
+    The path and time until the failure of the inspect_file call that raised
+    ``error``, if it was raised there
+    """
+    info = getattr(error, "file_info", None)
+    return info if isinstance(info, FileInfo) else None
+
+
+def get_executor(executor: str, jobs: int) -> Executor:
+    if executor not in known_executors:
+        msg = "Unknown executor requested, '%s'. Valid options: %s"
+        raise RuntimeError(msg % (executor, ", ".join(known_executors.keys())))
+    return known_executors[executor](jobs)
+
+
+def inspect_files(
+    files: Iterable[str],
+    tree_names: list[str],
+    list_branches: bool = False,
+    jobs: int = 1,
+    executor: str | Executor = "thread",
+    cache: FileInfoCache | None = None,
+    list_clusters: bool = False,
+    stat: StatFunction | None = None,
+) -> list[FileInfo]:
+    """
+    Inspect each file exactly once, preserving the input order.
+
+    Args:
+        files (Iterable[str]): Paths or URLs of the files to inspect.
+        tree_names (list[str]): Names of the trees to look for.
+        list_branches (bool): Flag indicating if branch names should be collected.
+        jobs (int): Number of files to inspect concurrently.
+        executor (str | Executor): Either the name of a known executor
+            ("thread" or "process") or an existing executor to submit to.
+        cache (FileInfoCache | None): Cache to consult before opening files;
+            newly inspected files are added to it.
+        list_clusters (bool): Flag indicating if cluster boundaries should be
+            collected.
+        stat (StatFunction | None): Function with which the cache stats
+            local files, see cache.file_signature.
+
+    Returns:
+        list[FileInfo]: The information for each file, in the order given.
+    """
+    return list(
+        iter_inspect_files(
+            files,
+            tree_names,
+            list_branches,
+            jobs,
+            executor,
+            cache,
+            list_clusters,
+            stat,
+        )
+    )
+
+
+def iter_inspect_files(
+    files: Iterable[str],
+    tree_names: list[str],
+    list_branches: bool = False,
+    jobs: int = 1,
+    executor: str | Executor = "thread",
+    cache: FileInfoCache | None = None,
+    list_clusters: bool = False,
+    stat: StatFunction | None = None,
+) -> Iterator[FileInfo]:
+    """
+    Streaming version of inspect_files.
+
+    Paths are consumed from ``files`` as they are needed and handed to the
+    workers straight away, so that a lazily expanded file list is inspected
+    while it is still being produced. At most a few files per worker are in
+    flight at any time and results are yielded in input order.
+    """
+    inspect = partial(
+        inspect_file,
+        tree_names=tree_names,
+        list_branches=list_branches,
+        list_clusters=list_clusters,
+    )
+    with ExitStack() as stack:
+        pool: Executor | None = None
+        if isinstance(executor, Executor):
+            pool = executor
+        elif jobs > 1:
+            pool = stack.enter_context(get_executor(executor, jobs))
+        max_in_flight = 4 * max(jobs, 1)
+        # without a cache there is no need to read ahead more than the workers need
+        batch_size = _BATCH_SIZE if cache is not None else max_in_flight
+
+        pending: deque[FileInfo | Future[FileInfo]] = deque()
+        to_store: list[FileInfo] = []
+        for batch in _batched(files, batch_size):
+            cached = (
+                cache.lookup(
+                    batch, tree_names, list_branches, list_clusters, pool, stat
+                )
+                if cache is not None
+                else {}
+            )
+            for path in batch:
+                if path in cached:
+                    pending.append(cached[path])
+                elif pool is None:
+                    to_store.append(inspect(path))
+                    pending.append(to_store[-1])
+                else:
+                    pending.append(pool.submit(inspect, path))
+                while len(pending) > max_in_flight or (
+                    pending and not isinstance(pending[0], Future)
+                ):
+                    yield _resolve(pending.popleft(), to_store)
+            if cache is not None and len(to_store) >= _BATCH_SIZE:
+                cache.store(to_store, list_branches, list_clusters, pool, stat)
+                to_store = []
+        while pending:
+            yield _resolve(pending.popleft(), to_store)
+        if cache is not None and to_store:
+            cache.store(to_store, list_branches, list_clusters, pool, stat)
+
+
+def _batched(items: Iterable[str], size: int) -> Iterator[list[str]]:
+    iterator = iter(items)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def _resolve(item: FileInfo | Future[FileInfo], to_store: list[FileInfo]) -> FileInfo:
+    if isinstance(item, Future):
+        info = item.result()
+        to_store.append(info)
+        return info
+    return item
+
+
+def _merge_cached(
+    files: list[str],
+    cached: dict[str, FileInfo],
+    fresh: list[FileInfo],
+    cache: FileInfoCache | None,
+    list_branches: bool,
+    list_clusters: bool = False,
+    executor: Executor | None = None,
+    stat: StatFunction | None = None,
+) -> list[FileInfo]:
+    if cache is None:
+        return fresh
+    cache.store(fresh, list_branches, list_clusters, executor, stat)
+    inspected = iter(fresh)
+    return [cached[path] if path in cached else next(inspected) for path in files]
+
+
+async def gather_bounded(
+    func: Callable[[T], R],
+    items: list[T],
+    limit: int = DEFAULT_CONCURRENCY,
+    executor: Executor | None = None,
+) -> list[R]:
+    """
+    Run a blocking function over all items in worker threads, with at most
+    ``limit`` calls in flight at once. Results keep the order of ``items``.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(limit)
+    pool = executor if executor is not None else ThreadPoolExecutor(limit)
+
+    async def run(item: T) -> R:
+        async with semaphore:
+            return await loop.run_in_executor(pool, func, item)
+
+    try:
+        return list(await asyncio.gather(*(run(item) for item in items)))
+    finally:
+        if executor is None:
+            pool.shutdown(wait=False)
+
+
+async def inspect_files_async(
+    files: list[str],
+    tree_names: list[str],
+    list_branches: bool = False,
+    limit: int = DEFAULT_CONCURRENCY,
+    executor: Executor | None = None,
+    cache: FileInfoCache | None = None,
+    list_clusters: bool = False,
+    stat: StatFunction | None = None,
+) -> list[FileInfo]:
+    """
+    Asynchronous version of inspect_files, opening at most ``limit`` files at
+    any one time.
+
+    The cache is consulted and updated in a worker thread, so that getting
+    the signatures of the files does not block the event loop.
+    """
+    cached = (
+        await asyncio.to_thread(
+            cache.lookup,
+            files,
+            tree_names,
+            list_branches,
+            list_clusters,
+            executor,
+            stat,
+        )
+        if cache is not None
+        else {}
+    )
+    to_inspect = [path for path in files if path not in cached]
+
+    inspect = partial(
+        inspect_file,
+        tree_names=tree_names,
+        list_branches=list_branches,
+        list_clusters=list_clusters,
+    )
+    fresh = await gather_bounded(inspect, to_inspect, limit, executor)
+    return await asyncio.to_thread(
+        _merge_cached,
+        files,
+        cached,
+        fresh,
+        cache,
+        list_branches,
+        list_clusters,
+        executor,
+        stat,
+    )
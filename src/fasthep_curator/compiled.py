@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+import tempfile
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any
+
+#: bump when the layout of the compiled payload changes
+FORMAT_VERSION = 2
+
+Fingerprint = tuple[str, int, int, str]
+
+
+def cache_file(cache_dir: str | os.PathLike[str], *key: Any) -> Path:
+    """
+    Location of the compiled form of a catalogue inside ``cache_dir``.
+
+    Args:
+        cache_dir (str | os.PathLike[str]): Directory holding compiled catalogues.
+        key (Any): Everything that influences the result, e.g. the path of the
+            catalogue and the options used to read it.
+
+    Returns:
+        Path: The path of the compiled catalogue.
+    """
+    digest = hashlib.sha256(pickle.dumps((FORMAT_VERSION, *key))).hexdigest()
+    return Path(cache_dir) / f"{digest}.pkl"
+
+
+def _digest(path: str) -> str:
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def fingerprint(path: str) -> Fingerprint:
+    stat = Path(path).stat()
+    return path, stat.st_mtime_ns, stat.st_size, _digest(path)
+
+
+def _is_current(dependency: Fingerprint) -> bool:
+    path, mtime, size, digest = dependency
+    try:
+        stat = Path(path).stat()
+    except OSError:
+        return False
+    if (stat.st_mtime_ns, stat.st_size) == (mtime, size):
+        return True
+    # modified (or merely touched/copied): only stale if the content changed
+    return stat.st_size == size and _digest(path) == digest
+
+
+def load(path: str | os.PathLike[str]) -> Any | None:
+    """
+    Load a compiled catalogue, if it exists and none of the YAML files it was
+    built from have changed since.
+
+    Args:
+        path (str | os.PathLike[str]): Path of the compiled catalogue.
+
+    Returns:
+        Any | None: The compiled payload, or None if it is missing or stale.
+    """
+    try:
+        with Path(path).open("rb") as f:
+            version, dependencies, payload = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError):
+        return None
+    if version != FORMAT_VERSION or not all(map(_is_current, dependencies)):
+        return None
+    return payload
+
+
+def dump(
+    path: str | os.PathLike[str], payload: Any, dependencies: Iterable[str]
+) -> None:
+    """
+    Write a compiled catalogue together with the fingerprints of the YAML files
+    it depends on. The file is replaced atomically so concurrent readers never
+    see a partial write.
+    """
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fingerprints = [fingerprint(dependency) for dependency in dependencies]
+    with tempfile.NamedTemporaryFile(
+        "wb", dir=target.parent, prefix=target.name, delete=False
+    ) as f:
+        pickle.dump(
+            (FORMAT_VERSION, fingerprints, payload), f, protocol=pickle.HIGHEST_PROTOCOL
+        )
+    Path(f.name).replace(target)
@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import os
+from collections import defaultdict
+from collections.abc import Hashable, Iterable
+from pathlib import Path
+from typing import Any
+
+from . import compiled, read
+from .read import Dataset, LazyDataset, Prefix
+
+#: types of the values that can be looked up
+INDEXED_TYPES = (str, int, float, bool)
+
+
+class CatalogueIndex:
+    """
+    Index of a resolved catalogue that finds datasets by ``name``,
+    ``eventtype`` or any other scalar setting (e.g. those added with
+    write.add_meta), and only parses the YAML files defining the datasets
+    that are asked for.
+
+    Building the index reads the whole catalogue once; keep it in a compiled
+    cache (see from_yaml) so that later jobs only check the files for changes
+    and parse the ones they need.
+    """
+
+    def __init__(self, prefix: Prefix = None, selected_prefix: str | None = None):
+        self._prefix = prefix
+        self._selected_prefix = selected_prefix
+        # (source file, position in its datasets, snapshot of the defaults)
+        self._entries: list[tuple[str | None, int, int]] = []
+        self._defaults: list[dict[str, Any]] = []
+        # datasets of a configuration that is not read from a file
+        self._inline: dict[int, dict[str, Any]] = {}
+        # keyed by type and value, as e.g. True == 1
+        self._postings: dict[str, dict[tuple[type, Hashable], list[int]]] = defaultdict(
+            lambda: defaultdict(list)
+        )
+
+    @classmethod
+    def from_config(
+        cls,
+        config: dict[str, Any],
+        defaults: dict[str, Any] | None = None,
+        config_dir: Path | None = None,
+        prefix: Prefix = None,
+        expand_prefix: bool = True,
+        source: str | None = None,
+        imported_files: set[str] | None = None,
+    ) -> CatalogueIndex:
+        """
+        Index the datasets of a configuration and its imports, in the same
+        way read.get_datasets resolves them.
+
+        Args:
+            config (dict[str, Any]): The configuration dictionary.
+            source (str | None): The file ``config`` was read from, if any.
+
+        Returns:
+            CatalogueIndex: The index.
+        """
+        index = cls(
+            prefix if expand_prefix else None,
+            str(config_dir) if prefix and expand_prefix else None,
+        )
+        snapshots: dict[int, int] = {}
+        for (
+            dataset_source,
+            position,
+            dataset,
+            dataset_defaults,
+        ) in read.iter_dataset_configs(
+            config, defaults, imported_files, config_dir, source
+        ):
+            if id(dataset_defaults) not in snapshots:
+                snapshots[id(dataset_defaults)] = len(index._defaults)
+                index._defaults.append(dataset_defaults)
+            index._add(
+                dataset_source,
+                position,
+                dataset,
+                snapshots[id(dataset_defaults)],
+            )
+        return index
+
+    @classmethod
+    def from_yaml(
+        cls,
+        yaml_config: str,
+        defaults: dict[str, Any] | None = None,
+        prefix: Prefix = None,
+        expand_prefix: bool = True,
+        compiled_cache: str | os.PathLike[str] | None = None,
+    ) -> CatalogueIndex:
+        """
+        Index a YAML catalogue file or sharded directory (see read.from_yaml).
+
+        Args:
+            yaml_config (str): Path to the YAML configuration file or directory.
+            compiled_cache (str | os.PathLike[str] | None): Directory in which
+                to keep the index. It is reused until the content of any of the
+                YAML files changes.
+
+        Returns:
+            CatalogueIndex: The index.
+        """
+        shards = read._shard_paths(yaml_config)
+        compiled_file = None
+        if compiled_cache is not None:
+            compiled_file = compiled.cache_file(
+                compiled_cache,
+                "index",
+                str(Path(yaml_config).resolve()),
+                defaults,
+                prefix,
+                expand_prefix,
+                shards,
+            )
+            state = compiled.load(compiled_file)
+            if state is not None:
+                return cls._from_state(state)
+
+        config, this_dir = read._root_config(yaml_config, shards)
+        imported_files: set[str] = set()
+        index = cls.from_config(
+            config,
+            defaults,
+            this_dir,
+            prefix,
+            expand_prefix,
+            source=None if shards is not None else yaml_config,
+            imported_files=imported_files,
+        )
+
+        if compiled_file is not None:
+            dependencies = sorted(imported_files)
+            if shards is None:
+                dependencies.insert(0, yaml_config)
+            compiled.dump(
+                compiled_file,
+                index._state(),
+                (str(Path(f).resolve()) for f in dependencies),
+            )
+        return index
+
+    def _add(
+        self,
+        source: str | None,
+        position: int,
+        dataset: dict[str, Any],
+        defaults_id: int,
+    ) -> None:
+        entry = len(self._entries)
+        if source is not None:
+            # relative imports are read relative to the working directory
+            source = str(Path(source).resolve())
+        self._entries.append((source, position, defaults_id))
+        if source is None:
+            self._inline[entry] = dataset
+        for key, value in {**self._defaults[defaults_id], **dataset}.items():
+            if isinstance(value, INDEXED_TYPES):
+                self._postings[key][type(value), value].append(entry)
+
+    def _state(self) -> tuple[Any, ...]:
+        postings = {key: dict(values) for key, values in self._postings.items()}
+        return (
+            self._prefix,
+            self._selected_prefix,
+            self._entries,
+            self._defaults,
+            self._inline,
+            postings,
+        )
+
+    @classmethod
+    def _from_state(cls, state: tuple[Any, ...]) -> CatalogueIndex:
+        prefix, selected_prefix, entries, defaults, inline, postings = state
+        index = cls(prefix, selected_prefix)
+        index._entries = entries
+        index._defaults = defaults
+        index._inline = inline
+        for key, values in postings.items():
+            index._postings[key].update(values)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, name: object) -> bool:
+        # names are strings; anything else (e.g. unhashable values) is not one
+        return isinstance(name, str) and bool(self._matches({"name": name}))
+
+    def __getitem__(self, name: str) -> Dataset:
+        datasets = self.find(name=name)
+        if not datasets:
+            raise KeyError(name)
+        return datasets[0]
+
+    def fields(self) -> list[str]:
+        """The settings that can be used in find"""
+        return sorted(self._postings)
+
+    def distinct(self, key: str) -> list[Any]:
+        """The distinct values of a setting, e.g. all event types"""
+        return [value for _, value in self._postings.get(key, {})]
+
+    def find(self, **query: Any) -> list[Dataset]:
+        """
+        Datasets whose settings (own or from the defaults) equal all of the
+        given values, e.g. ``find(eventtype="mc", campaign="2018")``.
+
+        Only the YAML files defining the matching datasets are read.
+
+        Returns:
+            list[Dataset]: The matching datasets, in catalogue order.
+        """
+        return [self._load(entry) for entry in self._matches(query)]
+
+    def sources(self, **query: Any) -> list[str]:
+        """The YAML files that find would read for the same query"""
+        sources = (self._entries[entry][0] for entry in self._matches(query))
+        return list(dict.fromkeys(source for source in sources if source is not None))
+
+    def _matches(self, query: dict[str, Any]) -> list[int]:
+        if not query:
+            return list(range(len(self._entries)))
+        postings: list[Iterable[int]] = []
+        for key, value in query.items():
+            values = self._postings.get(key)
+            typed = (type(value), value)
+            if values is None or typed not in values:
+                return []
+            postings.append(values[typed])
+        postings.sort(key=len)  # type: ignore[arg-type]
+        selected = set(postings[0])
+        for entries in postings[1:]:
+            selected.intersection_update(entries)
+        return sorted(selected)
+
+    def _load(self, entry: int) -> Dataset:
+        source, position, defaults_id = self._entries[entry]
+        if source is None:
+            dataset = self._inline[entry]
+        else:
+            config = read.load_yaml_config_cached(source)
+            dataset = read._dataset_config(config["datasets"][position])
+        return LazyDataset(
+            dataset, self._defaults[defaults_id], self._prefix, self._selected_prefix
+        )
@@ -0,0 +1,428 @@
+from __future__ import annotations
+
+import bisect
+import heapq
+import itertools
+import json
+import math
+import os
+import tempfile
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, TypeVar
+from urllib.parse import urlparse
+
+T = TypeVar("T")
+
+#: stages of curating a dataset, in the order they are reported
+STAGES = ("glob", "realpath", "check_entries", "branches", "write_yaml")
+#: upper bounds, in seconds, of the buckets of the file latency histogram
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+@dataclass
+class StageStats:
+    """
+    Accumulated time and number of items processed by one stage
+    """
+
+    seconds: float = 0.0
+    count: int = 0
+
+    def add(self, seconds: float, count: int = 0) -> None:
+        self.seconds += seconds
+        self.count += count
+
+
+class CurationStats:
+    """
+    Wall time and counts for each stage of curating a dataset.
+
+    Pass an instance as ``stats`` to prepare_file_list and write_yaml, then
+    inspect it or export it with to_json or to_prometheus. Glob expansion and
+    file inspection are interleaved when the file list is streamed; time spent
+    waiting for the next path is booked to "glob" and "realpath", not to
+    "check_entries". Time spent listing branches is summed over all files, so
+    with several workers it can exceed the wall time of "check_entries".
+    """
+
+    def __init__(self) -> None:
+        self.stages: dict[str, StageStats] = {name: StageStats() for name in STAGES}
+        #: bytes requested from storage while inspecting files
+        self.bytes_read = 0
+        #: files that had to be opened, i.e. were not found in a cache
+        self.files_opened = 0
+
+    def __getitem__(self, name: str) -> StageStats:
+        if name not in self.stages:
+            self.stages[name] = StageStats()
+        return self.stages[name]
+
+    @contextmanager
+    def stage(self, name: str, count: int = 0) -> Iterator[StageStats]:
+        """
+        Time the body of the ``with`` block as part of stage ``name``
+        """
+        stage = self[name]
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.add(time.perf_counter() - start, count)
+
+    def timed_iter(self, name: str, items: Iterable[T]) -> Iterator[T]:
+        """
+        Yield from ``items``, booking the time taken to produce each item to
+        stage ``name``
+        """
+        return timed_iter(items, self[name])
+
+    def add_file_infos(self, infos: Iterable[Any]) -> None:
+        """
+        Add the branch listing time and bytes read of inspected files
+        """
+        branches = self["branches"]
+        for info in infos:
+            if info.open_seconds <= 0:
+                continue
+            self.files_opened += 1
+            self.bytes_read += info.bytes_read
+            if info.branch_seconds > 0:
+                branches.add(info.branch_seconds, 1)
+
+    @property
+    def files(self) -> int:
+        return self["check_entries"].count
+
+    @property
+    def files_per_second(self) -> float:
+        seconds = self["check_entries"].seconds
+        return self.files / seconds if seconds > 0 else 0.0
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(
+            stage.seconds for name, stage in self.stages.items() if name != "branches"
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "stages": {name: asdict(stage) for name, stage in self.stages.items()},
+            "files": self.files,
+            "files_opened": self.files_opened,
+            "files_per_second": self.files_per_second,
+            "bytes_read": self.bytes_read,
+            "total_seconds": self.total_seconds,
+        }
+
+    def to_json(self, indent: int | None = 2) -> str:
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_prometheus(
+        self, prefix: str = "fasthep_curator", labels: dict[str, str] | None = None
+    ) -> str:
+        """
+        Render the stats in the Prometheus text exposition format, e.g. for the
+        node exporter's textfile collector.
+
+        Args:
+            prefix (str): Prefix for all metric names.
+            labels (dict[str, str] | None): Labels added to every sample,
+                e.g. the name of the dataset.
+
+        Returns:
+            str: The metrics, one sample per line.
+        """
+        base = dict(labels or {})
+        lines: list[str] = []
+
+        def metric(name: str, kind: str, text: str, samples: list[Any]) -> None:
+            lines.append(f"# HELP {prefix}_{name} {text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for extra, value in samples:
+                lines.append(
+                    f"{prefix}_{name}{_format_labels({**base, **extra})} {value}"
+                )
+
+        stages = self.stages.items()
+        metric(
+            "stage_seconds",
+            "gauge",
+            "Time spent in each curation stage",
+            [({"stage": name}, stage.seconds) for name, stage in stages],
+        )
+        metric(
+            "stage_items",
+            "gauge",
+            "Number of items processed by each curation stage",
+            [({"stage": name}, stage.count) for name, stage in stages],
+        )
+        metric("files_opened", "gauge", "Files opened", [({}, self.files_opened)])
+        metric(
+            "files_per_second",
+            "gauge",
+            "Files checked per second",
+            [({}, self.files_per_second)],
+        )
+        metric("bytes_read", "gauge", "Bytes read", [({}, self.bytes_read)])
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path: str | os.PathLike[str]) -> None:
+        _write_atomic(path, self.to_json())
+
+    def write_prometheus(
+        self,
+        path: str | os.PathLike[str],
+        prefix: str = "fasthep_curator",
+        labels: dict[str, str] | None = None,
+    ) -> None:
+        """
+        Write the Prometheus metrics to ``path``, replacing it atomically so
+        that a textfile collector never reads a partial file
+        """
+        _write_atomic(path, self.to_prometheus(prefix, labels))
+
+
+@dataclass(order=True)
+class FileLatency:
+    """
+    Time taken to open a single file and read its metadata
+    """
+
+    seconds: float
+    path: str = field(compare=False)
+    endpoint: str = field(compare=False)
+    open_seconds: float = field(default=0.0, compare=False)
+    read_seconds: float = field(default=0.0, compare=False)
+
+
+@dataclass
+class EndpointStats:
+    """
+    Latency of all files read from one storage endpoint
+    """
+
+    files: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    #: number of the files that could not be opened or read
+    failures: int = 0
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.seconds / self.files if self.files else 0.0
+
+
+class LatencyReport:
+    """
+    Per-file latency of opening files and reading their metadata.
+
+    Pass an instance as ``latency`` to check_entries_uproot (or
+    prepare_file_list) to keep a histogram of the latencies, the ``slowest``
+    files and the latency per storage endpoint, i.e. the XRootD server or the
+    mount point of local files. Files taken from a cache are not included;
+    files that failed to open are included, with the time until the failure,
+    and counted as ``failures``.
+    """
+
+    def __init__(
+        self, slowest: int = 10, buckets: Iterable[float] = LATENCY_BUCKETS
+    ) -> None:
+        self.slowest = slowest
+        self.buckets = tuple(sorted(bound for bound in buckets if bound != math.inf))
+        #: number of files per bucket, the last one counting all slower files
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.files = 0
+        self.failures = 0
+        self.seconds = 0.0
+        self.endpoints: dict[str, EndpointStats] = {}
+        self._slowest: list[FileLatency] = []
+        self._mount_points: dict[str, str] = {}
+
+    def add(self, info: Any) -> None:
+        if info.open_seconds <= 0:
+            return
+        seconds = info.open_seconds + info.read_seconds
+        endpoint = self.endpoint(info.path)
+        self.files += 1
+        self.seconds += seconds
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+
+        stats = self.endpoints.setdefault(endpoint, EndpointStats())
+        stats.files += 1
+        stats.seconds += seconds
+        stats.max_seconds = max(stats.max_seconds, seconds)
+
+        if self.slowest <= 0:
+            return
+        latency = FileLatency(
+            seconds, info.path, endpoint, info.open_seconds, info.read_seconds
+        )
+        if len(self._slowest) < self.slowest:
+            heapq.heappush(self._slowest, latency)
+        elif latency > self._slowest[0]:
+            heapq.heapreplace(self._slowest, latency)
+
+    def add_file_infos(self, infos: Iterable[Any]) -> None:
+        for info in infos:
+            self.add(info)
+
+    def add_failure(self, info: Any) -> None:
+        """
+        Record a file that could not be opened or read, see
+        inspection.failed_file_info
+        """
+        self.add(info)
+        self.failures += 1
+        self.endpoints.setdefault(
+            self.endpoint(info.path), EndpointStats()
+        ).failures += 1
+
+    def endpoint(self, path: str) -> str:
+        """
+        Storage endpoint serving ``path``
+        """
+        url = urlparse(path)
+        if url.scheme and url.scheme != "file":
+            return f"{url.scheme}://{url.netloc}"
+        directory = str(Path(url.path if url.scheme else path).absolute().parent)
+        if directory not in self._mount_points:
+            mount_point = Path(directory)
+            while not mount_point.is_mount():
+                mount_point = mount_point.parent
+            self._mount_points[directory] = str(mount_point)
+        return self._mount_points[directory]
+
+    def slowest_files(self) -> list[FileLatency]:
+        return sorted(self._slowest, reverse=True)
+
+    def slowest_endpoints(
+        self, n: int | None = None
+    ) -> list[tuple[str, EndpointStats]]:
+        """
+        Endpoints ordered by their mean latency, slowest first
+        """
+        ordered = sorted(
+            self.endpoints.items(), key=lambda item: item[1].mean_seconds, reverse=True
+        )
+        return ordered[:n] if n is not None else ordered
+
+    def histogram(self) -> list[tuple[float, int]]:
+        """
+        Cumulative number of files with a latency up to each bucket bound
+        """
+        bounds = (*self.buckets, math.inf)
+        return list(zip(bounds, itertools.accumulate(self.counts)))
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "files": self.files,
+            "failures": self.failures,
+            "seconds": self.seconds,
+            "histogram": [[str(le), count] for le, count in self.histogram()],
+            "slowest_files": [asdict(latency) for latency in self.slowest_files()],
+            "endpoints": {
+                name: {**asdict(stats), "mean_seconds": stats.mean_seconds}
+                for name, stats in self.slowest_endpoints()
+            },
+        }
+
+    def format(self) -> str:
+        """
+        Human readable summary of the slowest files and endpoints
+        """
+        lines = [f"{self.files} file(s) opened in {self.seconds:.3f} s"]
+        if self.failures:
+            lines[0] += f", {self.failures} failed"
+        lines.append("Slowest files:")
+        lines.extend(
+            f"  {latency.seconds:8.3f} s  {latency.path} ({latency.endpoint})"
+            for latency in self.slowest_files()
+        )
+        lines.append("Slowest endpoints (mean / max over files):")
+        lines.extend(
+            f"  {stats.mean_seconds:8.3f} s / {stats.max_seconds:8.3f} s"
+            f"  {name} ({stats.files} file(s))"
+            for name, stats in self.slowest_endpoints(self.slowest)
+        )
+        return "\n".join(lines)
+
+    def to_prometheus(
+        self, prefix: str = "fasthep_curator", labels: dict[str, str] | None = None
+    ) -> str:
+        """
+        Render the latency histogram and the per-endpoint latencies in the
+        Prometheus text exposition format
+        """
+        base = dict(labels or {})
+        name = f"{prefix}_file_latency_seconds"
+        lines = [
+            f"# HELP {name} Time taken to open a file and read its metadata",
+            f"# TYPE {name} histogram",
+        ]
+        for le, count in self.histogram():
+            bound = "+Inf" if le == math.inf else str(le)
+            lines.append(
+                f"{name}_bucket{_format_labels({**base, 'le': bound})} {count}"
+            )
+        lines.append(f"{name}_sum{_format_labels(base)} {self.seconds}")
+        lines.append(f"{name}_count{_format_labels(base)} {self.files}")
+
+        name = f"{prefix}_file_failures_total"
+        lines.append(f"# HELP {name} Files that could not be opened or read")
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_format_labels(base)} {self.failures}")
+
+        name = f"{prefix}_endpoint_latency_seconds"
+        lines.append(f"# HELP {name} Mean file latency per storage endpoint")
+        lines.append(f"# TYPE {name} gauge")
+        for endpoint, stats in self.endpoints.items():
+            sample_labels = _format_labels({**base, "endpoint": endpoint})
+            lines.append(f"{name}{sample_labels} {stats.mean_seconds}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(
+        self,
+        path: str | os.PathLike[str],
+        prefix: str = "fasthep_curator",
+        labels: dict[str, str] | None = None,
+    ) -> None:
+        _write_atomic(path, self.to_prometheus(prefix, labels))
+
+
+def timed_iter(items: Iterable[T], stage: StageStats) -> Iterator[T]:
+    """
+    Yield from ``items``, adding the time taken to produce each item to ``stage``
+    """
+    iterator = iter(items)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            stage.add(time.perf_counter() - start)
+            return
+        stage.add(time.perf_counter() - start, 1)
+        yield item
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def _write_atomic(path: str | os.PathLike[str], text: str) -> None:
+    target = Path(path)
+    with tempfile.NamedTemporaryFile(
+        "w", dir=target.parent, prefix=target.name, delete=False, encoding="utf-8"
+    ) as f:
+        f.write(text)
+    Path(f.name).replace(target)
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import bisect
+import heapq
+import itertools
+import math
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass, field
+
+from .read import Dataset, as_dict, cluster_boundaries, entries_per_file
+
+
+@dataclass(frozen=True)
+class FileRange:
+    """
+    Entries ``[entry_start, entry_stop)`` of a single file
+    """
+
+    path: str
+    entry_start: int
+    entry_stop: int
+
+    @property
+    def entries(self) -> int:
+        return self.entry_stop - self.entry_start
+
+
+@dataclass
+class WorkUnit:
+    """
+    Ranges of one or more files that are processed together
+    """
+
+    ranges: list[FileRange] = field(default_factory=list)
+
+    @property
+    def entries(self) -> int:
+        return sum(r.entries for r in self.ranges)
+
+    @property
+    def nfiles(self) -> int:
+        return len(self.ranges)
+
+
+def partition(
+    dataset: Dataset,
+    events_per_unit: int | None = None,
+    files_per_unit: int | None = None,
+    tree: str | None = None,
+    snap_to_clusters: bool = True,
+) -> list[WorkUnit]:
+    """
+    Split a dataset into work units of roughly ``events_per_unit`` entries
+    and/or at most ``files_per_unit`` files, using the recorded per-file
+    entry counts (see read.entries_per_file).
+
+    Files with more than ``events_per_unit`` entries are split into equally
+    sized ranges, smaller files are grouped together without exceeding either
+    limit. Files without entries are skipped. If the dataset was curated with
+    cluster boundaries, files are only split at those, so that no basket is
+    read by two work units.
+
+    Args:
+        dataset (Dataset): The dataset to partition.
+        events_per_unit (int | None): Target number of entries per unit.
+        files_per_unit (int | None): Maximum number of files per unit.
+        tree (str | None): The tree to partition, if the dataset has several.
+        snap_to_clusters (bool): Flag indicating if the recorded cluster
+            boundaries should be used when splitting files.
+
+    Returns:
+        list[WorkUnit]: The work units, in the order of the dataset's files.
+    Raises:
+        RuntimeError: If neither limit is given or a limit is not positive.
+    """
+    entries = entries_per_file(dataset, tree)
+    clusters = None
+    if snap_to_clusters and "file_clusters" in as_dict(dataset):
+        clusters = [c.tolist() for c in cluster_boundaries(dataset, tree)]
+    return partition_files(
+        zip(dataset.files, entries.tolist()), events_per_unit, files_per_unit, clusters
+    )
+
+
+def partition_files(
+    files: Iterable[tuple[str, int]],
+    events_per_unit: int | None = None,
+    files_per_unit: int | None = None,
+    clusters: Iterable[Sequence[int] | None] | None = None,
+) -> list[WorkUnit]:
+    """
+    Same as partition, for ``(path, entries)`` pairs and optionally the
+    cluster boundaries of each file
+    """
+    if events_per_unit is None and files_per_unit is None:
+        msg = "Need at least one of events_per_unit and files_per_unit"
+        raise RuntimeError(msg)
+    if (events_per_unit is not None and events_per_unit <= 0) or (
+        files_per_unit is not None and files_per_unit <= 0
+    ):
+        msg = "events_per_unit and files_per_unit must be positive"
+        raise RuntimeError(msg)
+    max_events = events_per_unit if events_per_unit is not None else math.inf
+    max_files = files_per_unit if files_per_unit is not None else math.inf
+    units: list[WorkUnit] = []
+    current = WorkUnit()
+    current_entries = 0
+
+    def close() -> None:
+        nonlocal current, current_entries
+        if current.ranges:
+            units.append(current)
+        current = WorkUnit()
+        current_entries = 0
+
+    boundaries_per_file = clusters if clusters is not None else itertools.repeat(None)
+    for (path, entries), boundaries in zip(files, boundaries_per_file):
+        if entries <= 0:
+            continue
+        if entries > max_events:
+            close()
+            ranges = _split(path, entries, int(max_events), boundaries)
+            units.extend(WorkUnit([r]) for r in ranges)
+            continue
+        if current_entries + entries > max_events:
+            close()
+        current.ranges.append(FileRange(path, 0, entries))
+        current_entries += entries
+        if current.nfiles >= max_files or current_entries >= max_events:
+            close()
+    close()
+    return units
+
+
+def _split(
+    path: str, entries: int, max_events: int, boundaries: Sequence[int] | None = None
+) -> list[FileRange]:
+    nchunks = math.ceil(entries / max_events)
+    bounds = [entries * i // nchunks for i in range(nchunks + 1)]
+    if boundaries:
+        bounds = sorted({_nearest(boundaries, bound) for bound in bounds})
+    return [FileRange(path, start, stop) for start, stop in zip(bounds, bounds[1:])]
+
+
+def _nearest(boundaries: Sequence[int], entry: int) -> int:
+    index = bisect.bisect_left(boundaries, entry)
+    candidates = boundaries[max(index - 1, 0) : index + 1]
+    return min(candidates, key=lambda boundary: abs(boundary - entry))
+
+
+def balance(units: Iterable[WorkUnit], workers: int) -> list[list[WorkUnit]]:
+    """
+    Distribute work units over ``workers`` so that each gets a similar number
+    of entries, largest units first (longest-processing-time first).
+
+    Args:
+        units (Iterable[WorkUnit]): The work units to distribute.
+        workers (int): Number of workers.
+
+    Returns:
+        list[list[WorkUnit]]: The units assigned to each worker.
+    """
+    if workers <= 0:
+        msg = f"Need at least one worker, got {workers}"
+        raise RuntimeError(msg)
+    assigned: list[list[WorkUnit]] = [[] for _ in range(workers)]
+    loads = [(0, worker) for worker in range(workers)]
+    for unit in sorted(units, key=lambda u: u.entries, reverse=True):
+        load, worker = heapq.heappop(loads)
+        assigned[worker].append(unit)
+        heapq.heappush(loads, (load + unit.entries, worker))
+    return assigned
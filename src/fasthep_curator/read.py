@@ -1,15 +1,364 @@
 from __future__ import annotations
 
+import os
+import pickle
+import threading
+from collections import ChainMap
+from collections.abc import Iterator, Mapping, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from types import SimpleNamespace as Dataset
-from typing import Any, TypeAlias
+from typing import Any, ClassVar, NoReturn, TypeAlias, overload
 
+import numpy as np
 import yaml
 
+from . import compiled
+from .branches import BranchCatalogue
+
 Prefix: TypeAlias = str | list[dict[str, Any]] | None
 
+#: use libyaml for parsing when PyYAML was built with it
+SafeLoader: type[yaml.SafeLoader] = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+#: number of imported files read concurrently
+IMPORT_JOBS = 16
+
+
+#: settings stored in slots of a Dataset, others go to its overflow mapping
+DATASET_FIELDS = (
+    "name",
+    "eventtype",
+    "files",
+    "nevents",
+    "nfiles",
+    "tree",
+    "prefix",
+    "branches",
+)
+_FIELDS = frozenset(DATASET_FIELDS)
+
+
+class Dataset:
+    """
+    A dataset of a catalogue, with its settings as attributes.
+
+    The common settings (see DATASET_FIELDS) are kept in slots and any other
+    ones, e.g. added with write.add_meta, in an overflow mapping that is only
+    created when needed. ``to_dict`` (or ``vars``) returns all settings as a
+    new dictionary, so changing that dictionary does not change the dataset;
+    set attributes instead. Datasets are pickled as the mapping of their
+    settings.
+    """
+
+    __slots__ = (*DATASET_FIELDS, "_meta")
+    #: attributes used by the class itself rather than settings
+    _INTERNAL: ClassVar[frozenset[str]] = frozenset({"_meta"})
+
+    def __init__(self, **settings: Any) -> None:
+        self._meta: dict[str, Any] | None = None
+        self._update(settings)
+
+    def _update(self, settings: Mapping[str, Any]) -> None:
+        for key, value in settings.items():
+            setattr(self, key, value)
+
+    def __setattr__(self, key: str, value: Any) -> None:
+        if key in _FIELDS or key in self._INTERNAL:
+            object.__setattr__(self, key, value)
+        elif self._meta is None:
+            self._meta = {key: value}
+        else:
+            self._meta[key] = value
+
+    def __getattr__(self, key: str) -> Any:
+        # only called for settings that are not in a slot
+        if key not in self._INTERNAL and self._meta is not None and key in self._meta:
+            return self._meta[key]
+        msg = f"'{type(self).__name__}' object has no attribute '{key}'"
+        raise AttributeError(msg)
+
+    def __delattr__(self, key: str) -> None:
+        if key in _FIELDS or key in self._INTERNAL:
+            object.__delattr__(self, key)
+        elif self._meta is not None and key in self._meta:
+            del self._meta[key]
+        else:
+            raise AttributeError(key)
+
+    def _own_settings(self) -> dict[str, Any]:
+        settings = {}
+        for key in DATASET_FIELDS:
+            try:
+                settings[key] = object.__getattribute__(self, key)
+            except AttributeError:
+                continue
+        if self._meta:
+            settings.update(self._meta)
+        return settings
+
+    # keeps ``vars(dataset)`` working, as a copy
+    __dict__ = property(_own_settings)
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        All settings of this dataset
+        """
+        return self._own_settings()
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Dataset):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        items = ", ".join(f"{k}={v!r}" for k, v in self.to_dict().items())
+        return f"{type(self).__name__}({items})"
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return (type(self), (), self._own_settings())
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self._update(state)
+
+
+class LazyDataset(Dataset):
+    """
+    Dataset from a catalogue that resolves its defaults and prefixed file list
+    only when they are first accessed.
+
+    The dataset's own settings are available straight away; values coming
+    from the (shared) defaults and the ``files``, expanded (see expand_files)
+    and with the prefix applied, are computed on first access and then stored
+    on the instance. Use ``to_dict``
+    to get all settings, as ``vars`` only shows those resolved so far.
+    """
+
+    __slots__ = ("_defaults", "_prefix", "_raw_files", "_selected_prefix")
+    _INTERNAL = Dataset._INTERNAL | frozenset(__slots__)
+
+    def __init__(
+        self,
+        config: dict[str, Any],
+        defaults: Mapping[str, Any] | None = None,
+        prefix: Prefix = None,
+        selected_prefix: str | None = None,
+    ) -> None:
+        super().__init__(**config)
+        self._defaults = defaults if defaults is not None else {}
+        self._prefix = prefix
+        self._selected_prefix = selected_prefix
+        self._raw_files = config.get("files")
+        if self._raw_files is not None:
+            del self.files
+
+    def __getattr__(self, key: str) -> Any:
+        if key in self._INTERNAL:
+            raise AttributeError(key)
+        if self._meta is not None and key in self._meta:
+            return self._meta[key]
+        if key == "files":
+            files = self._raw_files
+            if files is None:
+                files = self._defaults.get("files")
+            if files is None:
+                raise AttributeError(key)
+            value = expand_files(files)
+            if self._prefix:
+                value = apply_prefix(
+                    self._prefix,
+                    value,
+                    self._selected_prefix,
+                    self._name(),
+                )
+        elif key in self._defaults:
+            value = self._defaults[key]
+        else:
+            msg = f"'{type(self).__name__}' object has no attribute '{key}'"
+            raise AttributeError(msg)
+        setattr(self, key, value)
+        return value
+
+    def _name(self) -> str | None:
+        try:
+            return object.__getattribute__(self, "name")  # type: ignore[no-any-return]
+        except AttributeError:
+            return None
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        All settings of this dataset, including defaults and prefixed files
+        """
+        result = dict(self._defaults)
+        result.update(self._own_settings())
+        if "files" in result or self._raw_files is not None:
+            result["files"] = self.files
+        return result
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return (type(self), (self.to_dict(),))
+
+    def prefixed_files(self, selected_prefix: str | None = None) -> PrefixedFiles:
+        """
+        The files of this dataset with the prefix kept apart (see
+        split_prefix), to switch between the prefixes of a dataset cheaply.
+
+        Args:
+            selected_prefix (str | None): Name of the prefix to start with,
+                by default the one the dataset was read with.
+        """
+        files = self._raw_files
+        if files is None:
+            files = self._defaults.get("files")
+        if files is None:
+            msg = f"Dataset '{self._name()}' has no files"
+            raise AttributeError(msg)
+        return split_prefix(
+            self._prefix,
+            expand_files(files),
+            selected_prefix or self._selected_prefix,
+            self._name(),
+        )
+
+
+def as_dict(dataset: Any) -> dict[str, Any]:
+    """
+    Get all settings of a dataset as a dictionary.
+
+    Args:
+        dataset (Any): The dataset, lazy or not, a mapping of its settings
+            (e.g. from from_dict) or any other namespace.
+
+    Returns:
+        dict[str, Any]: The settings of the dataset.
+    """
+    if isinstance(dataset, Dataset):
+        return dataset.to_dict()
+    if isinstance(dataset, Mapping):
+        return dict(dataset)
+    return dict(vars(dataset))
+
 
-def __load_yaml_config(yaml_config: str) -> dict[str, Any]:
+def entries_per_file(dataset: Dataset, tree: str | None = None) -> np.ndarray:
+    """
+    Get the number of entries of each file of a dataset.
+
+    Args:
+        dataset (Dataset): The dataset, curated with per-file entries.
+        tree (str | None): The tree to get the entries for; only needed if the
+            dataset was curated for several trees.
+
+    Returns:
+        np.ndarray: The entries of each file, in the order of ``dataset.files``.
+    Raises:
+        RuntimeError: If the per-file entries were not recorded, or not for
+            all files.
+    """
+    data = as_dict(dataset)
+    entries = data.get("file_entries")
+    nevents = data.get("nevents")
+    if entries is None and isinstance(nevents, dict):
+        # without disallowing empty files the counts are recorded per file path
+        if not isinstance(data.get("tree"), list):
+            return _entries_by_file(nevents, data)
+        if all(isinstance(counts, dict) for counts in nevents.values()):
+            return _entries_by_file(_select_tree(nevents, tree, data), data)
+    if entries is None:
+        msg = f"No per-file entries recorded for dataset '{data.get('name')}'"
+        raise RuntimeError(msg)
+    return np.asarray(_select_tree(entries, tree, data), dtype=np.int64)
+
+
+def cluster_boundaries(dataset: Dataset, tree: str | None = None) -> list[np.ndarray]:
+    """
+    Get the cluster boundaries of each file of a dataset, i.e. the entries at
+    which all baskets of the tree start, including 0 and the number of entries.
+
+    Args:
+        dataset (Dataset): The dataset, curated with cluster boundaries.
+        tree (str | None): The tree to get the boundaries for; only needed if
+            the dataset was curated for several trees.
+
+    Returns:
+        list[np.ndarray]: The boundaries of each file, in the order of
+        ``dataset.files``.
+    Raises:
+        RuntimeError: If the cluster boundaries were not recorded.
+    """
+    data = as_dict(dataset)
+    clusters = data.get("file_clusters")
+    if clusters is None:
+        msg = f"No cluster boundaries recorded for dataset '{data.get('name')}'"
+        raise RuntimeError(msg)
+    return [
+        np.asarray(boundaries, dtype=np.int64)
+        for boundaries in _select_tree(clusters, tree, data)
+    ]
+
+
+def branch_catalogue(dataset: Dataset, tree: str | None = None) -> BranchCatalogue:
+    """
+    Get the branches of each file of a dataset.
+
+    Args:
+        dataset (Dataset): The dataset, curated with branch schemas.
+        tree (str | None): The tree to get the branches for; only needed if
+            the dataset was curated for several trees.
+
+    Returns:
+        BranchCatalogue: The branches, with files in the order of
+        ``dataset.files``.
+    Raises:
+        RuntimeError: If the branch schemas were not recorded.
+    """
+    data = as_dict(dataset)
+    schemas = data.get("branch_schemas")
+    if schemas is None:
+        msg = f"No branch schemas recorded for dataset '{data.get('name')}'"
+        raise RuntimeError(msg)
+    return BranchCatalogue.from_dict(_select_tree(schemas, tree, data))
+
+
+def files_without_branch(
+    dataset: Dataset, branch: str, tree: str | None = None
+) -> list[str]:
+    """
+    Get the files of a dataset that lack a branch, see branch_catalogue.
+    """
+    files = dataset.files
+    return [files[i] for i in branch_catalogue(dataset, tree).files_without(branch)]
+
+
+def _entries_by_file(counts: dict[str, Any], data: dict[str, Any]) -> np.ndarray:
+    # the counts are keyed by the (prefixed) paths, not in the order of the files
+    files = data.get("files")
+    missing = [path for path in files or [] if path not in counts]
+    if files is None or missing:
+        name = data.get("name")
+        msg = (
+            f"No entries recorded for file '{missing[0]}' of dataset '{name}'"
+            if missing
+            else f"No files to get the per-file entries of dataset '{name}'"
+        )
+        raise RuntimeError(msg)
+    return np.asarray([counts[path] for path in files], dtype=np.int64)
+
+
+def _select_tree(values: Any, tree: str | None, data: dict[str, Any]) -> Any:
+    if not isinstance(values, dict):
+        return values
+    if tree is None and len(values) == 1:
+        tree = next(iter(values))
+    if tree not in values:
+        msg = (
+            f"No per-file information for tree '{tree}' in dataset '{data.get('name')}'"
+        )
+        raise RuntimeError(msg)
+    return values[tree]
+
+
+def _load_yaml_config(yaml_config: str) -> dict[str, Any]:
     """
     Load a YAML configuration file and return the datasets.
 
@@ -22,7 +371,7 @@ def __load_yaml_config(yaml_config: str) -> dict[str, Any]:
         RuntimeError: If the YAML configuration file is empty.
     """
     with Path(yaml_config).open("r", encoding="utf-8") as f:
-        config = yaml.safe_load(f)
+        config = yaml.load(f, Loader=SafeLoader)
     if not config:
         msg = f"Empty config file: {yaml_config}"
         raise RuntimeError(msg)
@@ -30,44 +379,216 @@ def __load_yaml_config(yaml_config: str) -> dict[str, Any]:
     return config  # type: ignore[no-any-return]
 
 
-def from_string(dataset: str, defaults: dict[str, str] | None = None) -> dict[str, Any]:
+#: number of files kept by load_yaml_config_cached
+MAX_PARSED_FILES = 4096
+#: total size of the pickled content kept by load_yaml_config_cached, which is
+#: usually a few times smaller than the parsed content
+MAX_PARSED_BYTES = 256 * 1024**2
+#: parsed catalogue files by resolved path, with the time and size of their
+#: last change; pickled so that every caller gets its own copy
+_parsed_files: dict[str, tuple[int, int, bytes]] = {}
+_parsed_bytes = 0
+_parsed_files_lock = threading.Lock()
+
+
+def load_yaml_config_cached(yaml_config: str) -> dict[str, Any]:
+    """
+    Same as loading a YAML configuration file, but each file is only parsed
+    once per process (until it changes), however many catalogues import it.
+
+    Each call returns a new copy of the content, which can be modified
+    freely. The content is kept pickled, for the most recently used files up
+    to MAX_PARSED_FILES files and MAX_PARSED_BYTES bytes in total.
+    """
+    global _parsed_bytes  # noqa: PLW0603
+    path = Path(yaml_config)
+    stat = path.stat()
+    key = str(path.resolve())
+    with _parsed_files_lock:
+        cached = _parsed_files.pop(key, None)
+        if cached is not None:
+            _parsed_bytes -= len(cached[2])
+            if cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                # reinserted to mark it as the most recently used
+                _parsed_files[key] = cached
+                _parsed_bytes += len(cached[2])
+                return pickle.loads(cached[2])  # type: ignore[no-any-return]
+    config = _load_yaml_config(yaml_config)
+    parsed = pickle.dumps(config, protocol=pickle.HIGHEST_PROTOCOL)
+    with _parsed_files_lock:
+        previous = _parsed_files.pop(key, None)
+        if previous is not None:
+            _parsed_bytes -= len(previous[2])
+        _parsed_files[key] = (stat.st_mtime_ns, stat.st_size, parsed)
+        _parsed_bytes += len(parsed)
+        while _parsed_files and (
+            len(_parsed_files) > MAX_PARSED_FILES or _parsed_bytes > MAX_PARSED_BYTES
+        ):
+            _parsed_bytes -= len(_parsed_files.pop(next(iter(_parsed_files)))[2])
+    return config
+
+
+def clear_parse_cache() -> None:
+    """Forget the files parsed by load_yaml_config_cached"""
+    global _parsed_bytes  # noqa: PLW0603
+    with _parsed_files_lock:
+        _parsed_files.clear()
+        _parsed_bytes = 0
+
+
+class FrozenDefaults(dict[str, Any]):
+    """
+    Defaults shared by many datasets, which therefore cannot be modified;
+    override values in a dataset's own settings instead.
+
+    The freeze is shallow: nested values (e.g. the dictionary of branches)
+    are the same objects for all datasets and must not be changed in place.
+    """
+
+    __slots__ = ()
+
+    def _read_only(self, *args: Any, **kwargs: Any) -> NoReturn:  # noqa: ARG002
+        msg = "Shared defaults cannot be modified, override them per dataset"
+        raise TypeError(msg)
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        # shared layers are pickled once thanks to pickle's memo
+        return (type(self), (dict(self),))
+
+
+class LayeredConfig(ChainMap[str, Any]):
+    """
+    Settings of a dataset: its own values on top of a shared, immutable
+    defaults layer. Changes are stored in the dataset's own layer.
+    """
+
+    def __init__(
+        self,
+        own: dict[str, Any] | None = None,
+        defaults: Mapping[str, Any] | None = None,
+    ) -> None:
+        super().__init__(own if own is not None else {}, shared_defaults(defaults))
+
+    def to_dict(self) -> dict[str, Any]:
+        """A plain dictionary with all settings"""
+        return {**self.maps[1], **self.maps[0]}
+
+
+_NO_DEFAULTS = FrozenDefaults()
+#: the last defaults frozen by shared_defaults in each thread, with their layer
+_last_layer = threading.local()
+
+
+def shared_defaults(defaults: Mapping[str, Any] | None) -> FrozenDefaults:
+    """
+    An immutable (shallow, see FrozenDefaults) snapshot of ``defaults``.
+    Consecutive calls in a thread with the same, unchanged defaults return
+    the same snapshot, so that datasets created one by one from them share a
+    single layer. Pass a FrozenDefaults to share it explicitly, as the
+    catalogue readers do.
+
+    Args:
+        defaults (Mapping[str, Any] | None): The defaults to freeze.
+
+    Returns:
+        FrozenDefaults: The shared snapshot.
+    """
+    if defaults is None:
+        return _NO_DEFAULTS
+    if isinstance(defaults, FrozenDefaults):
+        return defaults
+    last = getattr(_last_layer, "value", None)
+    # a cheap check: values are compared by identity first
+    if last is not None and last[0] is defaults and last[1] == defaults:
+        return last[1]  # type: ignore[no-any-return]
+    layer = FrozenDefaults(defaults)
+    _last_layer.value = (defaults, layer)
+    return layer
+
+
+def from_string(
+    dataset: str, defaults: Mapping[str, Any] | None = None
+) -> LayeredConfig:
     """
     Load a dataset from a string.
 
     Args:
         dataset (str): The dataset string.
-        defaults (dict[str, str] | None): Default values for the dataset.
+        defaults (Mapping[str, Any] | None): Default values for the dataset,
+            shared with other datasets instead of copied (see shared_defaults).
 
     Returns:
-        Dataset: The loaded dataset.
+        LayeredConfig: The loaded dataset. This is a mapping (a ChainMap of
+        the dataset's own settings and the defaults) rather than a dict; use
+        its to_dict method where a plain dict is needed.
     """
-    datasets = defaults.copy() if defaults else {}
-    datasets["name"] = dataset
-
-    return datasets
+    return LayeredConfig({"name": dataset}, defaults)
 
 
 def from_dict(
-    dataset: dict[str, Any], defaults: dict[str, Any] | None
-) -> dict[str, Any]:
+    dataset: dict[str, Any], defaults: Mapping[str, Any] | None
+) -> LayeredConfig:
     """
     Load a dataset from a dictionary.
 
     Args:
         dataset (dict[str, str]): The dataset dictionary.
-        defaults (dict[str, str] | None): Default values for the dataset.
+        defaults (Mapping[str, Any] | None): Default values for the dataset,
+            shared with other datasets instead of copied (see shared_defaults).
 
     Returns:
-        Dataset: The loaded dataset.
+        LayeredConfig: The loaded dataset, a mapping rather than a dict (see
+        from_string).
     """
     if "name" not in dataset:
         msg = "Dataset must contain a 'name' key"
         raise RuntimeError(msg)
 
-    datasets = defaults.copy() if defaults else {}
-    datasets.update(dataset)
+    return LayeredConfig(dict(dataset), defaults)
 
-    return datasets
+
+def catalogue_shards(directory: str | os.PathLike[str]) -> list[Path]:
+    """
+    The YAML files making up a sharded catalogue directory, in the order in
+    which their datasets are read.
+
+    Args:
+        directory (str | os.PathLike[str]): The catalogue directory.
+
+    Returns:
+        list[Path]: The shard files, sorted by name. Empty files, i.e. shards
+        that are still being written on file systems without hard links, are
+        skipped.
+    """
+    shards = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if (
+                entry.name.endswith((".yml", ".yaml"))
+                and not entry.name.startswith(".")
+                and entry.is_file()
+                and entry.stat().st_size > 0
+            ):
+                shards.append(Path(entry.path))
+    return sorted(shards)
+
+
+def _shard_paths(yaml_config: str) -> list[str] | None:
+    if not Path(yaml_config).is_dir():
+        return None
+    return [str(shard) for shard in catalogue_shards(yaml_config)]
+
+
+def _root_config(
+    yaml_config: str, shards: list[str] | None
+) -> tuple[dict[str, Any], Path]:
+    """The top-level configuration of a catalogue file or sharded directory"""
+    if shards is not None:
+        return {"import": shards}, Path(yaml_config)
+    return load_yaml_config_cached(yaml_config), Path(yaml_config).parent
 
 
 def from_yaml(
@@ -75,27 +596,77 @@ def from_yaml(
     defaults: dict[str, Any] | None = None,
     prefix: Prefix = None,
     expand_prefix: bool = True,
+    compiled_cache: str | os.PathLike[str] | None = None,
+    jobs: int = IMPORT_JOBS,
 ) -> list[Dataset]:
     """
     Load datasets from a YAML configuration file.
 
+    If ``yaml_config`` is a directory, it is read as a sharded catalogue: the
+    datasets of all YAML files in it (see catalogue_shards) are combined as if
+    they were imported by a single file.
+
     Args:
-        yaml_config (str): Path to the YAML configuration file.
+        yaml_config (str): Path to the YAML configuration file or directory.
+        compiled_cache (str | os.PathLike[str] | None): Directory in which to
+            keep a compiled (pickled) form of the resolved catalogue. It is
+            reused until the content of any of the YAML files changes.
+        jobs (int): Number of imported files read concurrently.
 
     Returns:
         dict[Dataset]: A dictionary containing the datasets.
     """
-    config = __load_yaml_config(yaml_config)
-    this_dir = Path(yaml_config).parent
+    shards = _shard_paths(yaml_config)
 
-    return get_datasets(
+    compiled_file = None
+    if compiled_cache is not None:
+        compiled_file = compiled.cache_file(
+            compiled_cache,
+            str(Path(yaml_config).resolve()),
+            defaults,
+            prefix,
+            expand_prefix,
+            # added or removed shards change the catalogue
+            shards,
+        )
+        states = compiled.load(compiled_file)
+        if states is not None:
+            return [LazyDataset(*state) for state in states]
+
+    config, this_dir = _root_config(yaml_config, shards)
+    imported_files: set[str] = set()
+
+    datasets = get_datasets(
         config=config,
         defaults=defaults,
+        imported_files=imported_files,
         config_dir=this_dir,
         prefix=prefix,
         expand_prefix=expand_prefix,
+        jobs=jobs,
     )
 
+    if compiled_file is not None:
+        dependencies = sorted(imported_files)
+        if shards is None:
+            dependencies.insert(0, yaml_config)
+        compiled.dump(
+            compiled_file,
+            [_lazy_state(dataset) for dataset in datasets],  # type: ignore[arg-type]
+            (str(Path(f).resolve()) for f in dependencies),
+        )
+    return datasets
+
+
+def _lazy_state(
+    dataset: LazyDataset,
+) -> tuple[dict[str, Any], Mapping[str, Any], Prefix, str | None]:
+    config = dataset._own_settings()
+    if dataset._raw_files is not None:
+        config["files"] = dataset._raw_files
+    # shared defaults are pickled once thanks to pickle's memo
+    return config, dataset._defaults, dataset._prefix, dataset._selected_prefix
+
 
 def get_datasets(
     config: dict[str, Any],
@@ -104,6 +675,7 @@ def get_datasets(
     config_dir: Path | None = None,
     prefix: Prefix = None,
     expand_prefix: bool = True,
+    jobs: int = IMPORT_JOBS,
 ) -> list[Dataset]:
     """
     Get datasets from a configuration dictionary.
@@ -113,48 +685,258 @@ def get_datasets(
         already_imported (bool): Flag indicating if the datasets have already been imported.
         prefix (Prefix): Prefix to be applied to the dataset names.
         expand_prefix (bool): Flag indicating if the prefix should be expanded.
+        jobs (int): Number of imported files read concurrently.
     Returns:
         list[Dataset]: A list of datasets.
     """
-    datasets = []
+    selected_prefix = str(config_dir) if prefix and expand_prefix else None
+    return [
+        LazyDataset(
+            dataset,
+            dataset_defaults,
+            prefix if expand_prefix else None,
+            selected_prefix,
+        )
+        for _, _, dataset, dataset_defaults in iter_dataset_configs(
+            config, defaults, imported_files, config_dir, jobs=jobs
+        )
+    ]
+
+
+def iter_dataset_configs(
+    config: dict[str, Any],
+    defaults: dict[str, Any] | None = None,
+    imported_files: set[str] | None = None,
+    config_dir: Path | None = None,
+    source: str | None = None,
+    jobs: int = IMPORT_JOBS,
+) -> Iterator[tuple[str | None, int, dict[str, Any], dict[str, Any]]]:
+    """
+    Walk a configuration and its imports in the order in which datasets are
+    read, without resolving them.
+
+    Imported files are read and parsed ahead of the walk by ``jobs`` threads,
+    as soon as the file importing them has been parsed, while the walk itself
+    (and so the order of datasets and defaults) stays depth-first.
 
+    Args:
+        config (dict[str, Any]): The configuration dictionary.
+        defaults (dict[str, Any] | None): Default values for the datasets,
+            updated with the defaults of each configuration visited.
+        imported_files (set[str] | None): Files imported so far.
+        config_dir (Path | None): Directory substituted for ``{this_dir}``.
+        source (str | None): The file ``config`` was read from.
+        jobs (int): Number of files read concurrently, 1 to read them one by
+            one as they are reached.
+
+    Yields:
+        tuple: The file a dataset is defined in (None for ``config`` itself
+        unless ``source`` is given), its position in that file's datasets, its
+        own settings and the defaults it sees.
+    """
     if defaults is None:
         defaults = {}
-    defaults.update(config.get("defaults", {}))
     if imported_files is None:
         imported_files = set()
+    if jobs <= 1 or not config.get("import"):
+        yield from _walk(config, defaults, imported_files, config_dir, source, None)
+        return
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        loader = _ImportLoader(pool, config_dir)
+        try:
+            loader.prefetch(config)
+            yield from _walk(
+                config, defaults, imported_files, config_dir, source, loader
+            )
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+
+def _import_paths(config: dict[str, Any], config_dir: Path | None) -> list[str]:
+    imports = config.get("import", [])
+    if not config_dir:
+        return list(imports)
+    return [path.replace("{this_dir}", str(config_dir)) for path in imports]
+
+
+def _walk(
+    config: dict[str, Any],
+    defaults: dict[str, Any],
+    imported_files: set[str],
+    config_dir: Path | None,
+    source: str | None,
+    loader: _ImportLoader | None,
+) -> Iterator[tuple[str | None, int, dict[str, Any], dict[str, Any]]]:
+    defaults.update(config.get("defaults", {}))
 
-    for import_str in config.get("import", []):
-        import_file = import_str
-        if config_dir:
-            import_file = import_file.replace("{this_dir}", str(config_dir))
+    for import_file in _import_paths(config, config_dir):
         if import_file in imported_files:
             continue
         imported_files.add(import_file)
-        content = __load_yaml_config(import_file)
-        datasets.extend(
-            get_datasets(
-                content, defaults, imported_files, config_dir, prefix, expand_prefix
-            )
+        if loader is not None:
+            content = loader.get(import_file)
+        else:
+            content = load_yaml_config_cached(import_file)
+        yield from _walk(
+            content, defaults, imported_files, config_dir, import_file, loader
         )
 
-    for dataset_cfg in config.get("datasets", []):
-        if isinstance(dataset_cfg, str):
-            dataset = from_string(dataset_cfg, defaults)
-        elif isinstance(dataset_cfg, dict):
-            dataset = from_dict(dataset_cfg, defaults)
-        else:
-            msg = f"Invalid dataset format: {dataset_cfg}"
+    # datasets share a snapshot of the defaults seen so far, instead of a copy each
+    dataset_defaults = FrozenDefaults(defaults)
+    for position, dataset_cfg in enumerate(config.get("datasets", [])):
+        yield source, position, _dataset_config(dataset_cfg), dataset_defaults
+
+
+class _ImportLoader:
+    """
+    Parses imported files in a pool, following their imports in turn, so
+    that the whole import tree is read concurrently ahead of the walk
+    """
+
+    def __init__(self, pool: ThreadPoolExecutor, config_dir: Path | None) -> None:
+        self._pool = pool
+        self._config_dir = config_dir
+        self._futures: dict[str, Future[dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def prefetch(self, config: dict[str, Any]) -> None:
+        for path in _import_paths(config, self._config_dir):
+            with self._lock:
+                if path not in self._futures:
+                    self._futures[path] = self._pool.submit(self._load, path)
+
+    def _load(self, path: str) -> dict[str, Any]:
+        content = load_yaml_config_cached(path)
+        self.prefetch(content)
+        return content
+
+    def get(self, path: str) -> dict[str, Any]:
+        with self._lock:
+            future = self._futures.get(path)
+        if future is None:
+            return load_yaml_config_cached(path)
+        return future.result()
+
+
+def _dataset_config(dataset_cfg: Any) -> dict[str, Any]:
+    """
+    The settings of a dataset entry, which is either a name or a mapping.
+
+    Raises:
+        RuntimeError: If the entry has no name or is of the wrong type.
+    """
+    if isinstance(dataset_cfg, str):
+        return {"name": dataset_cfg}
+    if isinstance(dataset_cfg, dict):
+        if "name" not in dataset_cfg:
+            msg = "Dataset must contain a 'name' key"
             raise RuntimeError(msg)
+        return dataset_cfg
+    msg = f"Invalid dataset format: {dataset_cfg}"
+    raise RuntimeError(msg)
+
+
+def expand_files(files: Any) -> Any:
+    """
+    Expand a file list written in compressed form (see write.encode_files).
+
+    Entries can be plain paths or mappings with a ``directory`` and either
+    the ``names`` of the files in it or a ``name`` containing ``{index}``
+    together with a ``range`` of indices ``[start, stop)`` and optionally the
+    ``width`` to which indices are padded with zeros.
+
+    Args:
+        files (Any): The file list, compressed or not.
 
-        if prefix and expand_prefix:
-            dataset["files"] = apply_prefix(
-                prefix, dataset_cfg["files"], str(config_dir)
+    Returns:
+        Any: The paths of all files, or ``files`` if there is nothing to expand.
+    """
+    if not isinstance(files, list) or not any(isinstance(f, dict) for f in files):
+        return files
+    expanded: list[str] = []
+    for entry in files:
+        if not isinstance(entry, dict):
+            expanded.append(entry)
+            continue
+        directory = entry.get("directory", "")
+        if "names" in entry:
+            expanded.extend(directory + name for name in entry["names"])
+        elif "name" in entry and "range" in entry:
+            head, _, tail = entry["name"].partition("{index}")
+            width = entry.get("width", 0)
+            start, stop = entry["range"]
+            expanded.extend(
+                f"{directory}{head}{str(index).zfill(width)}{tail}"
+                for index in range(start, stop)
             )
+        else:
+            msg = f"Invalid entry in compressed file list: {entry}"
+            raise RuntimeError(msg)
+    return expanded
 
-        datasets.append(Dataset(**dataset))
 
-    return datasets
+#: placeholder in file names that is replaced by the prefix
+PREFIX_PLACEHOLDER = "{prefix}"
+
+_LITERAL, _PREFIXED, _TEMPLATE = 0, 1, 2
+
+
+def _prefix_choices(
+    prefix: Prefix, dataset: str | None
+) -> list[tuple[str | None, str]]:
+    """The (name, value) pairs of a prefix; a plain string has no name"""
+    if isinstance(prefix, str):
+        return [(None, prefix)]
+    if isinstance(prefix, list):
+        if not all(isinstance(p, dict) and len(p) == 1 for p in prefix):  # type: ignore[redundant-expr]
+            msg = "'prefix' is a list, but not all elements are single-length dicts"
+            raise ValueError(msg)
+        return [next(iter(p.items())) for p in prefix]
+    msg = f"'prefix' for dataset '{dataset}' is type {type(prefix)}. Need a string or a list of single-length dicts"
+    raise ValueError(msg)
+
+
+def _select_prefix(
+    choices: list[tuple[str | None, str]],
+    selected_prefix: str | None,
+    dataset: str | None,
+) -> int:
+    if not selected_prefix:
+        return 0
+    matched = [i for i, (name, _) in enumerate(choices) if name == selected_prefix]
+    if len(matched) > 1:
+        msg = f"Prefix '{selected_prefix}' is defined {len(matched)} times, not sure which to use"
+        raise ValueError(msg)
+    if not matched:
+        msg = f"Prefix '{selected_prefix}' is not defined for dataset '{dataset}'"
+        raise ValueError(msg)
+    return matched[0]
+
+
+def resolve_prefix(
+    prefix: Prefix, selected_prefix: str | None = None, dataset: str | None = None
+) -> str | None:
+    """
+    The prefix to use for the files of a dataset.
+
+    Args:
+        prefix (Prefix): A prefix or a list of named prefixes.
+        selected_prefix (str | None): Name of the prefix to use, the first one
+            if not given. Ignored for a plain string prefix.
+        dataset (str | None): The name of the dataset, for error messages.
+
+    Returns:
+        str | None: The prefix, or None if there is none.
+    Raises:
+        ValueError: If the prefix is malformed or the selected one is not
+            defined exactly once.
+    """
+    if not prefix:
+        return None
+    if isinstance(prefix, str):
+        return prefix
+    choices = _prefix_choices(prefix, dataset)
+    return choices[_select_prefix(choices, selected_prefix, dataset)][1]
 
 
 def apply_prefix(
@@ -166,6 +948,9 @@ def apply_prefix(
     """
     Apply a prefix to a list of files.
 
+    The prefix is resolved once and substituted for ``{prefix}`` in all
+    files; ``str.format`` is only used for files with other braces.
+
     Args:
         prefix (str | None): The prefix to be applied.
         files (list[str]): The list of files.
@@ -175,31 +960,126 @@ def apply_prefix(
     Returns:
         list[str]: The list of files with the prefix applied.
     """
-    if not prefix:
+    prefix_str = resolve_prefix(prefix, selected_prefix, dataset)
+    if prefix_str is None:
         return files
 
-    prefix_str = str(prefix)
-    if isinstance(prefix, list):
-        if not all(isinstance(p, dict) and len(p) == 1 for p in prefix):  # type: ignore[redundant-expr]
-            msg = "'prefix' is a list, but not all elements are single-length dicts"
-            raise ValueError(msg)
-        prefix_list = [next(iter(p.items())) for p in prefix]
-
-        if selected_prefix:
-            matched = [v for p, v in prefix_list if p == selected_prefix]
-            if len(matched) > 1:
-                msg = f"Prefix '{selected_prefix}' is defined {len(matched)} times, not sure which to use"
-                raise ValueError(msg)
-            if not matched:
-                msg = (
-                    f"Prefix '{selected_prefix}' is not defined for dataset '{dataset}'"
-                )
-                raise ValueError(msg)
-            prefix_str = matched[0]
-        else:
-            prefix_str = prefix_list[0][1]
-    elif not isinstance(prefix, str):
-        msg = f"'prefix' for dataset '{dataset}' is type {type(prefix)}. Need a string or a list of single-length dicts"  # type: ignore[unreachable]
-        raise ValueError(msg)
+    result = [file.replace(PREFIX_PLACEHOLDER, prefix_str) for file in files]
+    joined = "\0".join(result)
+    if "{" in joined or "}" in joined:
+        # escaped braces or other fields: leave them to str.format
+        return [file.format(prefix=prefix_str) for file in files]
+    return result
+
+
+class PrefixedFiles(Sequence[str]):
+    """
+    Files of a dataset kept as (prefix, suffix) pairs, so that switching to
+    another of the dataset's prefixes (see select) takes constant time and
+    creates no new strings. A file is only joined with the prefix when it is
+    accessed; use ``list`` to get all of them.
+    """
+
+    __slots__ = ("_choices", "_index", "_kinds", "_suffixes")
+
+    def __init__(
+        self,
+        choices: list[tuple[str | None, str]],
+        index: int | None,
+        suffixes: list[str],
+        kinds: bytes,
+    ) -> None:
+        self._choices = choices
+        self._index = index
+        self._suffixes = suffixes
+        self._kinds = kinds
+
+    @property
+    def prefix(self) -> str | None:
+        """The selected prefix"""
+        return self._choices[self._index][1] if self._index is not None else None
+
+    @property
+    def prefix_names(self) -> list[str | None]:
+        """Names of the prefixes that can be selected"""
+        return [name for name, _ in self._choices]
+
+    def select(self, selected_prefix: str) -> PrefixedFiles:
+        """The same files with another of the dataset's prefixes"""
+        index = _select_prefix(self._choices, selected_prefix, None)
+        return PrefixedFiles(self._choices, index, self._suffixes, self._kinds)
+
+    def pairs(self) -> Iterator[tuple[int | None, str]]:
+        """
+        The index of the selected prefix (None for files without a prefix)
+        and the rest of each file. Files using the prefix in another way than
+        at the start are given as their template.
+        """
+        for kind, suffix in zip(self._kinds, self._suffixes):
+            yield (self._index if kind != _LITERAL else None), suffix
+
+    def _join(self, kind: int, suffix: str, prefix: str | None) -> str:
+        if kind == _LITERAL or prefix is None:
+            return suffix if kind != _PREFIXED else PREFIX_PLACEHOLDER + suffix
+        if kind == _PREFIXED:
+            return prefix + suffix
+        return suffix.format(prefix=prefix)
 
-    return [file.format(prefix=prefix_str) for file in files]
+    def __len__(self) -> int:
+        return len(self._suffixes)
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[str]: ...
+
+    def __getitem__(self, index: int | slice) -> str | list[str]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self._join(self._kinds[index], self._suffixes[index], self.prefix)
+
+    def __iter__(self) -> Iterator[str]:
+        prefix = self.prefix
+        if prefix is not None and self._kinds.count(_PREFIXED) == len(self._kinds):
+            return (prefix + suffix for suffix in self._suffixes)
+        return (
+            self._join(kind, suffix, prefix)
+            for kind, suffix in zip(self._kinds, self._suffixes)
+        )
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(prefix={self.prefix!r}, files={len(self)})"
+
+
+def split_prefix(
+    prefix: Prefix,
+    files: list[str],
+    selected_prefix: str | None = None,
+    dataset: str | None = None,
+) -> PrefixedFiles:
+    """
+    Same as apply_prefix, but keeping the prefix apart from the files (see
+    PrefixedFiles) so that another prefix can be selected cheaply.
+    """
+    choices = _prefix_choices(prefix, dataset) if prefix else []
+    index = None
+    if choices:
+        index = (
+            0
+            if isinstance(prefix, str)
+            else _select_prefix(choices, selected_prefix, dataset)
+        )
+    suffixes = []
+    kinds = bytearray(len(files))
+    start = len(PREFIX_PLACEHOLDER)
+    for i, file in enumerate(files):
+        suffix = file[start:] if file.startswith(PREFIX_PLACEHOLDER) else None
+        if suffix is not None and "{" not in suffix and "}" not in suffix:
+            kinds[i] = _PREFIXED
+            suffixes.append(suffix)
+        else:
+            if "{" in file or "}" in file:
+                kinds[i] = _TEMPLATE
+            suffixes.append(file)
+    return PrefixedFiles(choices, index, suffixes, bytes(kinds))
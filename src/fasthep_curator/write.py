@@ -1,27 +1,67 @@
 from __future__ import annotations
 
+import errno
 import importlib
 import itertools
 import logging
-import operator
 import os
-from collections import defaultdict
+import re
+import tempfile
+import time
+from collections import Counter, defaultdict
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from concurrent.futures import Executor
 from pathlib import Path
-from types import SimpleNamespace
-from typing import Any
+from typing import Any, Callable
 
 import yaml
 
 from . import read
+from .branches import BranchCatalogue
 from .catalogues import get_file_list_expander, known_expanders
+from .catalogues.cache import FileInfoCache
+from .catalogues.inspection import DEFAULT_CONCURRENCY
+from .metrics import CurationStats, LatencyReport
 
 logger = logging.getLogger(__name__)
 
 
+def _catalogue_dumper(base: type[yaml.Dumper]) -> type[yaml.Dumper]:
+    # https://stackoverflow.com/questions/25108581/python-yaml-dump-bad-indentation
+    class MyDumper(base):  # type: ignore[valid-type,misc]
+        """Custom YAML dumper to avoid using block style for lists."""
+
+        # def increase_indent(self, flow=False, indentless=False):
+        #     return super().increase_indent(flow, indentless)
+
+        # disable aliases and anchors, see https://github.com/yaml/pyyaml/issues/103
+        def ignore_aliases(self, _: Any) -> bool:
+            return True
+
+    MyDumper.add_representer(FlowList, _represent_flow_list)
+    return MyDumper
+
+
+class FlowList(list[Any]):
+    """List written in flow style, e.g. ``[100, 202]``, to keep long lists of
+    numbers compact."""
+
+
+def _represent_flow_list(dumper: yaml.Dumper, data: FlowList) -> yaml.Node:
+    return dumper.represent_sequence("tag:yaml.org,2002:seq", data, flow_style=True)
+
+
+#: use libyaml for emitting when PyYAML was built with it; the output is identical
+CatalogueDumper = _catalogue_dumper(getattr(yaml, "CDumper", yaml.Dumper))
+
+
 __all__ = [
     "add_meta",
+    "consolidate",
+    "encode_files",
     "known_expanders",
     "prepare_file_list",
+    "prepare_file_list_async",
     "process_user_function",
     "write_yaml",
 ]
@@ -38,24 +78,428 @@ def prepare_file_list(
     confirm_tree: bool = True,
     ignore_inaccessible: bool = False,
     include_branches: bool = False,
+    jobs: int = 1,
+    executor: str | Executor = "thread",
+    cache: FileInfoCache | str | None = None,
+    previous: str | None = None,
+    stats: CurationStats | None = None,
+    latency: LatencyReport | None = None,
+    per_file_entries: bool = False,
+    cluster_boundaries: bool = False,
+    branch_schemas: bool = False,
 ) -> dict[str, Any]:
     """
     Expands all globs in the file lists and creates a dataframe similar to those from a DAS query
+
+    Files are inspected ``jobs`` at a time using a "thread" or "process" pool,
+    or submitted to ``executor`` if it is an existing Executor (e.g. to share
+    one pool across datasets); the resulting file list keeps the order of the expanded globs. If ``cache``
+    is a FileInfoCache or the path of one, unchanged files are not reopened;
+    pass an instance to e.g. limit its size with ``max_entries``.
+
+    If ``previous`` is the path of an existing catalogue that already contains
+    this dataset, only files that are not recorded there are inspected and the
+    recorded totals are updated (see ``write_yaml(..., update=True)``).
+
+    If ``stats`` is given, the time spent in and the number of items handled
+    by each stage are added to it. ``latency`` records how long each file took
+    to open and inspect, to find slow files and storage endpoints.
+
+    With ``per_file_entries`` the number of entries of each file is stored as
+    ``file_entries``, a list parallel to ``files`` (one list per tree if there
+    are several), see read.entries_per_file. ``cluster_boundaries`` likewise
+    stores ``file_clusters``, the entries at which all baskets of each file
+    start, so that partitioning can split files at those boundaries.
+
+    With ``branch_schemas`` (which implies ``include_branches``) the branches
+    of each file are stored compactly as ``branch_schemas`` (see
+    branches.BranchCatalogue), to find e.g. the files lacking a branch with
+    read.files_without_branch.
+    """
+    # a new expander per expansion, which may keep e.g. directory listings
+    expander = get_file_list_expander(expander_name)()
+    include_branches = include_branches or branch_schemas
+
+    # stream paths into the inspection as the globs produce them, unless the
+    # whole list is needed up front to compare with a previous catalogue
+    expanded = expander.iter_expand_file_list(files, prefix)
+    if stats is None:
+        paths = _iter_normalised_paths(expanded, expander.realpath)
+    else:
+        paths = _iter_timed_paths(expanded, expander.realpath, stats)
+    previous_data = _load_previous(previous, dataset)
+    full_list: list[str] = []
+    kept = None
+    if previous_data is not None:
+        full_list = list(paths)
+        kept = _plan_update(
+            previous_data,
+            full_list,
+            tree_name,
+            no_empty_files or confirm_tree,
+            include_branches,
+            per_file_entries,
+            cluster_boundaries,
+            branch_schemas,
+        )
+        paths = iter(
+            full_list if kept is None else [f for f in full_list if f not in kept]
+        )
+    file_entries: dict[str, list[int]] | None = {} if per_file_entries else None
+    file_clusters: dict[str, Any] | None = {} if cluster_boundaries else None
+    schemas: dict[str, BranchCatalogue] | None = {} if branch_schemas else None
+    checked = expander.check_files(
+        paths,
+        tree_name,
+        disallow_empty=no_empty_files,
+        list_branches=include_branches,
+        confirm_tree=confirm_tree,
+        ignore_inaccessible=ignore_inaccessible,
+        jobs=jobs,
+        executor=executor,
+        cache=cache,
+        stats=stats,
+        latency=latency,
+        file_entries=file_entries,
+        file_clusters=file_clusters,
+        branch_schemas=schemas,
+    )
+    if previous_data is not None and kept is not None:
+        checked = _merge_update(
+            previous_data,
+            kept,
+            full_list,
+            tree_name,
+            *checked,
+            file_entries,
+            file_clusters,
+            schemas,
+        )
+    full_list, numentries, branches = checked
+    # full_list = [str(f) for f in full_list]
+
+    return _build_file_list(
+        full_list,
+        numentries,
+        branches,
+        dataset,
+        eventtype,
+        tree_name,
+        prefix,
+        file_entries,
+        file_clusters,
+        schemas,
+    )
+
+
+async def prepare_file_list_async(
+    files: list[str],
+    dataset: str,
+    eventtype: str,
+    tree_name: str | list[str],
+    expander_name: str = "xrootd",
+    prefix: str | None = None,
+    no_empty_files: bool = True,
+    confirm_tree: bool = True,
+    ignore_inaccessible: bool = False,
+    include_branches: bool = False,
+    limit: int = DEFAULT_CONCURRENCY,
+    cache: FileInfoCache | str | None = None,
+    previous: str | None = None,
+    stats: CurationStats | None = None,
+    latency: LatencyReport | None = None,
+    per_file_entries: bool = False,
+    cluster_boundaries: bool = False,
+    branch_schemas: bool = False,
+) -> dict[str, Any]:
     """
-    expander = get_file_list_expander(expander_name)
+    Asynchronous version of prepare_file_list for use inside a running event loop.
 
-    full_list = expander.expand_file_list(files, prefix=prefix)
-    full_list = [os.path.realpath(f) if ":" not in f else f for f in full_list]
-    full_list, numentries, branches = expander.check_files(
+    Globs and file opens run in worker threads, with at most ``limit`` of each
+    in flight at once. The result is identical to that of prepare_file_list.
+    """
+    # a new expander per expansion, which may keep e.g. directory listings
+    expander = get_file_list_expander(expander_name)()
+    include_branches = include_branches or branch_schemas
+    stats = stats if stats is not None else CurationStats()
+
+    with stats.stage("glob") as stage:
+        full_list = await expander.expand_file_list_async(
+            files, prefix=prefix, limit=limit
+        )
+        stage.count += len(full_list)
+    with stats.stage("realpath") as stage:
+        full_list = _normalise_paths(full_list, expander.realpath)
+        stage.count += len(full_list)
+    previous_data = _load_previous(previous, dataset)
+    kept = _plan_update(
+        previous_data,
         full_list,
         tree_name,
+        no_empty_files or confirm_tree,
+        include_branches,
+        per_file_entries,
+        cluster_boundaries,
+        branch_schemas,
+    )
+    file_entries: dict[str, list[int]] | None = {} if per_file_entries else None
+    file_clusters: dict[str, Any] | None = {} if cluster_boundaries else None
+    schemas: dict[str, BranchCatalogue] | None = {} if branch_schemas else None
+    checked = await expander.check_files_async(
+        full_list if kept is None else [f for f in full_list if f not in kept],
+        tree_name,
         disallow_empty=no_empty_files,
         list_branches=include_branches,
         confirm_tree=confirm_tree,
         ignore_inaccessible=ignore_inaccessible,
+        limit=limit,
+        cache=cache,
+        stats=stats,
+        latency=latency,
+        file_entries=file_entries,
+        file_clusters=file_clusters,
+        branch_schemas=schemas,
     )
-    # full_list = [str(f) for f in full_list]
+    if previous_data is not None and kept is not None:
+        checked = _merge_update(
+            previous_data,
+            kept,
+            full_list,
+            tree_name,
+            *checked,
+            file_entries,
+            file_clusters,
+            schemas,
+        )
+    full_list, numentries, branches = checked
+
+    return _build_file_list(
+        full_list,
+        numentries,
+        branches,
+        dataset,
+        eventtype,
+        tree_name,
+        prefix,
+        file_entries,
+        file_clusters,
+        schemas,
+    )
+
+
+def _normalise_paths(
+    files: list[str], realpath: Callable[[str], str] = os.path.realpath
+) -> list[str]:
+    return list(_iter_normalised_paths(files, realpath))
+
+
+def _iter_normalised_paths(
+    files: Iterable[str], realpath: Callable[[str], str] = os.path.realpath
+) -> Iterator[str]:
+    return (realpath(f) if ":" not in f else f for f in files)
+
+
+def _iter_timed_paths(
+    files: Iterable[str], realpath: Callable[[str], str], stats: CurationStats
+) -> Iterator[str]:
+    """
+    Same as _iter_normalised_paths, booking the time spent expanding and
+    resolving paths to the "glob" and "realpath" stages of ``stats``
+    """
+    resolve = stats["realpath"]
+    for path in stats.timed_iter("glob", files):
+        if ":" in path:
+            yield path
+            continue
+        start = time.perf_counter()
+        resolved = realpath(path)
+        resolve.add(time.perf_counter() - start, 1)
+        yield resolved
+
+
+def _tree_names(tree_name: str | list[str]) -> list[str]:
+    return [tree_name] if isinstance(tree_name, str) else list(tree_name)
+
+
+def _load_previous(previous: str | None, dataset: str) -> dict[str, Any] | None:
+    if previous is None or not Path(previous).exists():
+        return None
+    for data in read.from_yaml(previous, expand_prefix=False):
+        if data.name == dataset:
+            return read.as_dict(data)
+    return None
+
+
+def _plan_update(
+    previous_data: dict[str, Any] | None,
+    full_list: list[str],
+    tree_name: str | list[str],
+    totals_only: bool,
+    include_branches: bool,
+    per_file_entries: bool = False,
+    cluster_boundaries: bool = False,
+    branch_schemas: bool = False,
+) -> set[str] | None:
+    """
+    Work out which of the expanded files are already recorded in the previous
+    catalogue entry and can be reused without inspection. Returns None if
+    everything needs to be inspected again.
+    """
+    if previous_data is None:
+        return None
+    tree_names = _tree_names(tree_name)
+    nevents = previous_data.get("nevents")
+    if len(tree_names) > 1:
+        nevents = (
+            next(iter(nevents.values()), None) if isinstance(nevents, dict) else None
+        )
+    recorded_totals = isinstance(nevents, int)
+    if (
+        previous_data.get("tree")
+        != (tree_names[0] if len(tree_names) == 1 else tree_name)
+        or recorded_totals != totals_only
+        or include_branches != ("branches" in previous_data)
+        or per_file_entries != ("file_entries" in previous_data)
+        or cluster_boundaries != ("file_clusters" in previous_data)
+        or branch_schemas != ("branch_schemas" in previous_data)
+    ):
+        logger.info(
+            "Previous entry was curated with different options, redoing all files"
+        )
+        return None
+
+    recorded = read.apply_prefix(previous_data.get("prefix"), previous_data["files"])
+    current = set(full_list)
+    removed = [f for f in recorded if f not in current]
+    # totals are reduced by the recorded contribution of each removed file
+    if removed and (
+        (totals_only and not per_file_entries)
+        or (include_branches and not branch_schemas)
+    ):
+        logger.warning(
+            "%d file(s) were removed but their contributions to the totals are"
+            " not recorded, redoing all files",
+            len(removed),
+        )
+        return None
+    return current.intersection(recorded)
+
+
+def _merge_update(
+    previous_data: dict[str, Any],
+    kept: set[str],
+    full_list: list[str],
+    tree_name: str | list[str],
+    checked_files: list[str],
+    numentries: dict[str, Any] | int,
+    branches: dict[str, Any],
+    file_entries: dict[str, list[int]] | None = None,
+    file_clusters: dict[str, Any] | None = None,
+    branch_schemas: dict[str, BranchCatalogue] | None = None,
+) -> tuple[list[str], dict[str, Any] | int, dict[str, Any]]:
+    """
+    Combine the previous catalogue entry with the results for the newly
+    checked files. ``file_entries``, ``file_clusters`` and ``branch_schemas``
+    are updated in place to cover all files.
 
+    The recorded entries and branches of files that no longer exist are
+    subtracted from the totals; _plan_update makes sure they are known.
+    """
+    checked = set(checked_files)
+    files = [f for f in full_list if f in kept or f in checked]
+
+    tree_names = _tree_names(tree_name)
+    if len(tree_names) == 1:
+        previous_entries = {tree_names[0]: previous_data["nevents"]}
+        new_entries = {tree_names[0]: numentries}
+    else:
+        previous_entries = previous_data["nevents"]
+        new_entries = numentries  # type: ignore[assignment]
+
+    recorded = read.apply_prefix(previous_data.get("prefix"), previous_data["files"])
+    removed = [i for i, f in enumerate(recorded) if f not in kept]
+    merged: dict[str, Any] = {}
+    for tree in tree_names:
+        old, new = previous_entries[tree], new_entries[tree]
+        if isinstance(new, dict):
+            merged[tree] = {f: n for f, n in old.items() if f in kept}
+            merged[tree].update(new)
+        else:
+            if removed:
+                entries = _previous_per_file(previous_data, "file_entries", tree_names)
+                old -= sum(entries[tree][i] for i in removed)
+            merged[tree] = old + new
+
+    previous_schemas = {
+        tree: BranchCatalogue.from_dict(schemas)
+        for tree, schemas in previous_data.get("branch_schemas", {}).items()
+    }
+    merged_branches: dict[str, Any] = {}
+    for tree in tree_names:
+        counts = Counter(previous_data.get("branches", {}).get(tree, {}))
+        if removed and tree in previous_schemas:
+            # count the branches of the removed files once per schema
+            schemas = previous_schemas[tree]
+            for schema, nfiles in Counter(schemas.files[i] for i in removed).items():
+                counts.subtract(dict.fromkeys(schemas.schema(schema), nfiles))
+            counts = +counts
+        counts.update(branches.get(tree, {}))
+        if counts or tree in branches:
+            merged_branches[tree] = dict(counts)
+
+    for key, per_file in (
+        ("file_entries", file_entries),
+        ("file_clusters", file_clusters),
+    ):
+        if per_file is None:
+            continue
+        previous_values = _previous_per_file(previous_data, key, tree_names)
+        for tree in tree_names:
+            by_file = dict(zip(recorded, previous_values[tree]))
+            by_file.update(zip(checked_files, per_file[tree]))
+            per_file[tree] = [by_file[f] for f in files]
+    if branch_schemas is not None:
+        for tree in tree_names:
+            new_schemas = branch_schemas[tree]
+            branches_by_file = {
+                path: previous_schemas[tree].file_branches(index)
+                for index, path in enumerate(recorded)
+            }
+            branches_by_file.update(
+                (path, new_schemas.file_branches(index))
+                for index, path in enumerate(checked_files)
+            )
+            branch_schemas[tree] = BranchCatalogue.from_files(
+                branches_by_file[f] for f in files
+            )
+
+    if len(merged) == 1:
+        return files, next(iter(merged.values())), merged_branches
+    return files, merged, merged_branches
+
+
+def _previous_per_file(
+    previous_data: dict[str, Any], key: str, tree_names: list[str]
+) -> dict[str, list[Any]]:
+    """The per-file values recorded under ``key``, by tree"""
+    values = previous_data[key]
+    if len(tree_names) == 1:
+        return {tree_names[0]: values}
+    return dict(values)
+
+
+def _build_file_list(
+    full_list: list[str],
+    numentries: dict[str, Any] | int,
+    branches: dict[str, Any],
+    dataset: str,
+    eventtype: str,
+    tree_name: str | list[str],
+    prefix: str | None,
+    file_entries: dict[str, list[int]] | None = None,
+    file_clusters: dict[str, Any] | None = None,
+    branch_schemas: dict[str, BranchCatalogue] | None = None,
+) -> dict[str, Any]:
     data: dict[str, Any] = {}
     if prefix:
         full_list = [
@@ -71,71 +515,126 @@ def prepare_file_list(
     data["tree"] = tree_name[0] if len(tree_name) == 1 else tree_name
     if branches:
         data["branches"] = branches
+    if branch_schemas is not None:
+        data["branch_schemas"] = {
+            tree: schemas.to_dict() for tree, schemas in branch_schemas.items()
+        }
+    for key, per_file in (
+        ("file_entries", file_entries),
+        ("file_clusters", file_clusters),
+    ):
+        if per_file is not None:
+            data[key] = (
+                next(iter(per_file.values())) if len(per_file) == 1 else per_file
+            )
 
     return data
 
 
-def select_default(values: list[Any]) -> Any | None:
-    groups_by_value = itertools.groupby(sorted(values))
-    groups = [(group, len(list(items))) for group, items in groups_by_value]
-    groups_with_multiple_items = [group for group in groups if group[1] > 1]
-    if not groups_with_multiple_items:
+#: tags keeping the canonical forms of different container types apart
+_LIST, _TUPLE, _DICT, _UNHASHABLE = object(), object(), object(), object()
+
+
+def _canonical(value: Any) -> Any:
+    """
+    Hashable stand-in for ``value``: values that compare equal have equal
+    stand-ins, also for (nested) lists and dicts.
+    """
+    if isinstance(value, list):
+        items = tuple(value)
+        try:
+            # fast path for lists of plain values, e.g. file names
+            hash(items)
+        except TypeError:
+            items = tuple(map(_canonical, value))
+        return _LIST, items
+    if isinstance(value, dict):
+        return _DICT, frozenset((k, _canonical(v)) for k, v in value.items())
+    if isinstance(value, (set, frozenset)):
+        return frozenset(map(_canonical, value))
+    try:
+        hash(value)
+    except TypeError:
+        if isinstance(value, tuple):
+            return _TUPLE, tuple(map(_canonical, value))
+        # no way of telling which of these are equal, treat them all as distinct
+        return _UNHASHABLE, id(value)
+    return value
+
+
+def _value_ids(values: list[Any]) -> list[int]:
+    """
+    Number the distinct values; equal values get the same number
+    """
+    ids: dict[Any, int] = {}
+    return [ids.setdefault(_canonical(value), len(ids)) for value in values]
+
+
+def _most_common(ids: list[int]) -> int | None:
+    """
+    Position of the first occurrence of the id that occurs most often, if it
+    occurs more than once and no other id occurs as often
+    """
+    counts = Counter(ids)
+    most_common = max(counts.values(), default=0)
+    if most_common < 2:
         return None
-    most_common, item_count = max(
-        groups_with_multiple_items, key=operator.itemgetter(1)
-    )
-    count = 0
-    for group in groups_with_multiple_items:
-        if group[1] == item_count:
-            count += 1
-            if count > 1:
-                is_unique = False
-                break
-    else:
-        is_unique = count == 1
-    if not is_unique:
+    winners = [i for i, count in counts.items() if count == most_common]
+    if len(winners) > 1:
         return None
-    return most_common
+    return ids.index(winners[0])
+
+
+def select_default(values: list[Any]) -> Any | None:
+    index = _most_common(_value_ids(values))
+    return values[index] if index is not None else None
 
 
 def prepare_contents(
-    datasets: list[dict[str, Any]] | list[SimpleNamespace],
+    datasets: Sequence[Mapping[str, Any] | read.Dataset],
     no_defaults_in_output: bool = False,
 ) -> dict[str, Any]:
-    datasets = [
-        vars(data) if isinstance(data, read.Dataset) else data for data in datasets
+    settings = [
+        data if isinstance(data, dict) else read.as_dict(data) for data in datasets
     ]
-    for d in datasets:
+    for d in settings:
         if "associates" in d:
             del d["associates"]
 
     if no_defaults_in_output:
         # do not group common settings together in default block
-        return {"datasets": datasets}
+        return {"datasets": settings}
 
     # build the default properties
     values = defaultdict(list)
-    for data in datasets:
+    for data in settings:
         for k, v in data.items():
             values[k].append(v)
 
     defaults = {}
+    # ids of the values of each default key, to drop values equal to the
+    # default without comparing them again
+    value_ids: dict[str, tuple[list[int], int]] = {}
     for key, vals in values.items():
         if key == "name":
             continue
-        is_in_all_datasets = len(vals) == len(datasets)
+        is_in_all_datasets = len(vals) == len(settings)
         if not is_in_all_datasets:
             continue
-        new_default = select_default(vals)
-        if new_default:
-            defaults[key] = new_default
+        ids = _value_ids(vals)
+        index = _most_common(ids)
+        if index is not None and vals[index]:
+            defaults[key] = vals[index]
+            value_ids[key] = (ids, ids[index])
 
     cleaned_datasets = []
-    for data in datasets:
+    for position, data in enumerate(settings):
         new_data = {}
         for key, val in data.items():
-            if key in defaults and val == defaults[key]:
-                continue
+            if key in value_ids:
+                ids, default_id = value_ids[key]
+                if ids[position] == default_id:
+                    continue
             new_data[key] = val
         cleaned_datasets.append(new_data)
 
@@ -146,39 +645,300 @@ def prepare_contents(
 
 
 def write_yaml(
-    dataset: SimpleNamespace,
+    dataset: read.Dataset | Mapping[str, Any],
     out_file: str,
     append: bool = True,
     no_defaults_in_output: bool = False,
+    update: bool = False,
+    stats: CurationStats | None = None,
+    compress_files: bool = False,
+) -> str:
+    """
+    Write a dataset to a catalogue, returning the YAML that was written.
+
+    If ``out_file`` is a directory (or ends with a path separator), the
+    dataset is written to a new shard file in it, which read.from_yaml merges
+    on load. Adding a dataset then takes the same time however large the
+    catalogue is, whereas appending to a single file re-reads and re-writes
+    all datasets in it (see also consolidate). With ``update``, the shard or
+    entry of a dataset with the same name is replaced.
+
+    With ``compress_files`` the file lists are written in compressed form
+    (see encode_files), which read expands again when they are accessed.
+
+    Raises:
+        RuntimeError: If ``append`` is False for a catalogue directory, whose
+            existing shards would have to be removed first.
+    """
+    stats = stats if stats is not None else CurationStats()
+    with stats.stage("write_yaml", count=1):
+        if _is_catalogue_dir(out_file):
+            if not append:
+                msg = (
+                    f"Cannot overwrite the catalogue directory {out_file}"
+                    " (append=False), remove its shards first"
+                )
+                raise RuntimeError(msg)
+            return _write_shard(dataset, Path(out_file), update, compress_files)
+        return _write_yaml(
+            dataset, out_file, append, no_defaults_in_output, update, compress_files
+        )
+
+
+def consolidate(
+    catalogue_dir: str,
+    out_file: str,
+    no_defaults_in_output: bool = False,
+    compress_files: bool = False,
+) -> str:
+    """
+    Combine a sharded catalogue directory into a single catalogue file, with
+    the common settings of all datasets moved to the defaults
+    """
+    datasets = read.from_yaml(catalogue_dir, expand_prefix=False)
+    contents = prepare_contents(datasets, no_defaults_in_output=no_defaults_in_output)
+    yaml_contents = _dump_contents(contents, compress_files)
+    with Path(out_file).open("w", encoding="utf-8") as out:
+        out.write(yaml_contents)
+    return yaml_contents
+
+
+def _is_catalogue_dir(out_file: str) -> bool:
+    return Path(out_file).is_dir() or out_file.endswith(("/", os.sep))
+
+
+def _shard_suffix(name: str) -> str:
+    return "_" + re.sub(r"[^\w.-]+", "_", name) + ".yml"
+
+
+def _write_shard(
+    dataset: Any, directory: Path, update: bool, compress_files: bool = False
+) -> str:
+    data = dataset if isinstance(dataset, dict) else read.as_dict(dataset)
+    yaml_contents = _dump_contents({"datasets": [data]}, compress_files)
+    directory.mkdir(parents=True, exist_ok=True)
+    suffix = _shard_suffix(data["name"])
+
+    if update:
+        for shard in read.catalogue_shards(directory):
+            if shard.name.endswith(suffix) and any(
+                d.name == data["name"] for d in read.from_yaml(str(shard))
+            ):
+                _replace_file(shard, yaml_contents)
+                return yaml_contents
+
+    index = _next_shard_index(directory)
+    with tempfile.NamedTemporaryFile(
+        "w", dir=directory, prefix=".", suffix=".tmp", delete=False, encoding="utf-8"
+    ) as f:
+        f.write(yaml_contents)
+    try:
+        # publishing fails if the name is taken, e.g. by a concurrent writer
+        while not _publish(Path(f.name), directory / f"{index:06d}{suffix}"):
+            index += 1
+    finally:
+        Path(f.name).unlink(missing_ok=True)
+    _replace_file(directory / _NEXT_SHARD, f"{index + 1}\n")
+    return yaml_contents
+
+
+#: hidden file in a catalogue directory holding the index of the next shard
+_NEXT_SHARD = ".next_shard"
+
+
+def _next_shard_index(directory: Path) -> int:
+    """
+    Index for a new shard, from the hint left by the previous write so that
+    the directory is only listed if there is none. Taken names are skipped
+    when publishing, so a stale hint only costs a few attempts.
+    """
+    try:
+        return int((directory / _NEXT_SHARD).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        shards = read.catalogue_shards(directory)
+        return max((_shard_index(shard) for shard in shards), default=-1) + 1
+
+
+def _publish(temporary: Path, target: Path) -> bool:
+    """
+    Give a written file its final name unless that is taken, returning False
+    if it is
+    """
+    try:
+        os.link(temporary, target)
+        return True
+    except FileExistsError:
+        return False
+    except OSError as error:
+        if error.errno not in _NO_HARD_LINKS:
+            raise
+    # without hard links, claim the name first and then move the content over
+    # it; readers skip the empty shard in between (see read.catalogue_shards)
+    try:
+        os.close(os.open(target, os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+    except FileExistsError:
+        return False
+    temporary.replace(target)
+    return True
+
+
+#: errors from os.link on file systems that do not support hard links
+_NO_HARD_LINKS = frozenset(
+    {errno.EPERM, errno.EACCES, errno.ENOTSUP, errno.EOPNOTSUPP, errno.EXDEV}
+)
+
+
+def _shard_index(shard: Path) -> int:
+    prefix = shard.name.split("_", 1)[0]
+    return int(prefix) if prefix.isdigit() else -1
+
+
+def _replace_file(path: Path, text: str) -> None:
+    with tempfile.NamedTemporaryFile(
+        "w", dir=path.parent, prefix=".", suffix=".tmp", delete=False, encoding="utf-8"
+    ) as f:
+        f.write(text)
+    Path(f.name).replace(path)
+
+
+def _write_yaml(
+    dataset: read.Dataset | Mapping[str, Any],
+    out_file: str,
+    append: bool,
+    no_defaults_in_output: bool,
+    update: bool,
+    compress_files: bool = False,
 ) -> str:
     if Path(out_file).exists() and append:
-        datasets = read.from_yaml(out_file, expand_prefix=False)
-        datasets.append(dataset)
+        datasets: list[Any] = read.from_yaml(out_file, expand_prefix=False)
+        name = dataset["name"] if isinstance(dataset, Mapping) else dataset.name
+        existing = [i for i, data in enumerate(datasets) if data.name == name]
+        if update and existing:
+            # replace the previous entry in place, e.g. after incremental curation
+            datasets[existing[0]] = dataset
+        else:
+            datasets.append(dataset)
         contents = prepare_contents(
             datasets, no_defaults_in_output=no_defaults_in_output
         )
     else:
         contents = {}
-        contents["datasets"] = [dataset]
-
-    # https://stackoverflow.com/questions/25108581/python-yaml-dump-bad-indentation
-    class MyDumper(yaml.Dumper):
-        """Custom YAML dumper to avoid using block style for lists."""
-
-        # def increase_indent(self, flow=False, indentless=False):
-        #     return super().increase_indent(flow, indentless)
-
-        # disable aliases and anchors, see https://github.com/yaml/pyyaml/issues/103
-        def ignore_aliases(self, _: Any) -> bool:
-            return True
+        contents["datasets"] = [
+            dataset if isinstance(dataset, dict) else read.as_dict(dataset)
+        ]
 
-    yaml_contents = yaml.dump(contents, Dumper=MyDumper, default_flow_style=False)
+    yaml_contents = _dump_contents(contents, compress_files)
     with Path(out_file).open("w", encoding="utf-8") as out:
         out.write(yaml_contents)
 
     return yaml_contents
 
 
+def _dump_contents(contents: dict[str, Any], compress_files: bool = False) -> str:
+    contents = dict(contents)
+    contents["datasets"] = [
+        _compact_per_file(d, compress_files) for d in contents["datasets"]
+    ]
+    if "defaults" in contents:
+        contents["defaults"] = _compact_per_file(contents["defaults"], compress_files)
+    return yaml.dump(contents, Dumper=CatalogueDumper, default_flow_style=False)
+
+
+def _compact_per_file(data: Any, compress_files: bool = False) -> Any:
+    if not isinstance(data, dict):
+        return data
+    compact = dict(data)
+    if compress_files and isinstance(data.get("files"), list):
+        compact["files"] = encode_files(data["files"])
+    if "file_entries" in data:
+        compact["file_entries"] = _map_trees(FlowList, data["file_entries"])
+    if "file_clusters" in data:
+        # one (short) list of boundaries per line
+        compact["file_clusters"] = _map_trees(
+            lambda clusters: [FlowList(c) for c in clusters], data["file_clusters"]
+        )
+    if "branch_schemas" in data:
+        compact["branch_schemas"] = {
+            tree: {**schemas, "files": FlowList(schemas["files"])}
+            for tree, schemas in data["branch_schemas"].items()
+        }
+    return compact
+
+
+#: splits a file name into the text before, the digits of and the text after
+#: its last number
+_NUMBERED_NAME = re.compile(r"^(.*?)(\d+)(\D*)$")
+#: shortest run of consecutively numbered files that is written as a range
+_MIN_RANGE = 3
+
+
+def encode_files(files: list[str]) -> list[dict[str, Any]]:
+    """
+    Compressed form of a file list, expanded again by read.expand_files.
+
+    Consecutive files in the same directory are listed by name under that
+    directory, and runs of consecutively numbered names such as
+    ``tree_1.root`` to ``tree_9999.root`` are written as a single range. The
+    order of the files is kept.
+    """
+    entries: list[dict[str, Any]] = []
+    for directory, paths in itertools.groupby(files, key=_directory):
+        names = [path[len(directory) :] for path in paths]
+        literal: list[str] = []
+        start = 0
+        while start < len(names):
+            run = _numbered_run(names, start)
+            if run is None:
+                literal.append(names[start])
+                start += 1
+                continue
+            if literal:
+                entries.append({"directory": directory, "names": literal})
+                literal = []
+            name, first, width, length = run
+            entry: dict[str, Any] = {
+                "directory": directory,
+                "name": name,
+                "range": FlowList([first, first + length]),
+            }
+            if width:
+                entry["width"] = width
+            entries.append(entry)
+            start += length
+        if literal:
+            entries.append({"directory": directory, "names": literal})
+    return entries
+
+
+def _directory(path: str) -> str:
+    head, separator, _ = path.rpartition("/")
+    return head + separator
+
+
+def _numbered_run(names: list[str], start: int) -> tuple[str, int, int, int] | None:
+    match = _NUMBERED_NAME.match(names[start])
+    if match is None or "{index}" in names[start]:
+        return None
+    head, digits, tail = match.groups()
+    first = int(digits)
+    width = len(digits) if digits.startswith("0") and len(digits) > 1 else 0
+    end = start + 1
+    while (
+        end < len(names)
+        and names[end] == f"{head}{str(first + end - start).zfill(width)}{tail}"
+    ):
+        end += 1
+    if end - start < _MIN_RANGE:
+        return None
+    return f"{head}{{index}}{tail}", first, width, end - start
+
+
+def _map_trees(func: Callable[[Any], Any], values: Any) -> Any:
+    if isinstance(values, dict):
+        return {tree: func(per_tree) for tree, per_tree in values.items()}
+    return func(values)
+
+
 def add_meta(dataset: dict[str, Any], meta: list[tuple[Any, Any]]) -> None:
     for key, value in meta:
         if key in dataset:
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import pytest
+
+from fasthep_curator.catalogues import cache as fc_cache
+from fasthep_curator.catalogues import inspection
+from fasthep_curator.catalogues.cache import FileInfoCache, file_signature
+from fasthep_curator.catalogues.common import check_entries_uproot
+from fasthep_curator.write import prepare_file_list
+
+
+@pytest.fixture
+def local_files(tmp_path, all_dummy_files):
+    files = []
+    for path in all_dummy_files:
+        target = tmp_path / path.name
+        shutil.copy(path, target)
+        files.append(str(target))
+    return files
+
+
+def test_file_signature(local_files):
+    signature = file_signature(local_files[0])
+    assert signature is not None
+    assert signature[0] == Path(local_files[0]).stat().st_size
+    assert file_signature(local_files[0] + ".missing") is None
+
+
+def test_cache_hit(tmp_path, local_files, opened):
+    cache_file = tmp_path / "cache.sqlite"
+    first = check_entries_uproot(
+        local_files,
+        "events",
+        disallow_empty=False,
+        list_branches=True,
+        confirm_tree=False,
+        cache=str(cache_file),
+    )
+    assert len(opened) == len(local_files)
+
+    second = check_entries_uproot(
+        local_files,
+        "events",
+        disallow_empty=False,
+        list_branches=True,
+        confirm_tree=False,
+        cache=str(cache_file),
+    )
+    assert len(opened) == len(local_files)
+    assert second == first
+
+
+def test_cache_invalidated_by_mtime(tmp_path, local_files, opened):
+    with FileInfoCache(tmp_path / "cache.sqlite") as cache:
+        inspection.inspect_files(local_files, ["events"], cache=cache)
+        stat = Path(local_files[0]).stat()
+        os.utime(local_files[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        inspection.inspect_files(local_files, ["events"], cache=cache)
+    assert opened[len(local_files) :] == [local_files[0]]
+
+
+def test_reused_cache_sees_changes(tmp_path, local_files, opened):
+    with FileInfoCache(tmp_path / "cache.sqlite") as cache:
+        inspection.inspect_files(local_files, ["events"], cache=cache)
+        # only hits, so nothing is stored in between
+        inspection.inspect_files(local_files, ["events"], cache=cache)
+        assert len(opened) == len(local_files)
+
+        stat = Path(local_files[0]).stat()
+        os.utime(local_files[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        inspection.inspect_files(local_files, ["events"], cache=cache)
+    assert opened[len(local_files) :] == [local_files[0]]
+
+
+def test_cache_needs_branches_and_trees(tmp_path, local_files, opened):
+    with FileInfoCache(tmp_path / "cache.sqlite") as cache:
+        inspection.inspect_files(local_files, ["events"], cache=cache)
+        assert len(cache.lookup(local_files, ["events"])) == len(local_files)
+        assert not cache.lookup(local_files, ["events"], list_branches=True)
+        assert not cache.lookup(local_files, ["events", "other"])
+
+        infos = inspection.inspect_files(
+            local_files, ["events"], list_branches=True, cache=cache
+        )
+        assert infos[0].trees["events"].branches == ("ev",)
+        hits = cache.lookup(local_files, ["events"], list_branches=True)
+        assert hits[local_files[0]].trees["events"].branches == ("ev",)
+    assert len(opened) == 2 * len(local_files)
+
+
+def test_cache_eviction(tmp_path, local_files):
+    with FileInfoCache(tmp_path / "cache.sqlite", max_entries=2) as cache:
+        inspection.inspect_files(local_files, ["events"], cache=cache)
+        assert len(cache) == 2
+        cache.clear()
+        assert len(cache) == 0
+
+
+def test_cache_signatures_off_event_loop(tmp_path, local_files, monkeypatch):
+    threads = set()
+    original = fc_cache.file_signature
+
+    def recording_signature(
+        path: str, stat: fc_cache.StatFunction | None = None
+    ) -> fc_cache.Signature | None:
+        threads.add(threading.get_ident())
+        return original(path, stat)
+
+    monkeypatch.setattr(fc_cache, "file_signature", recording_signature)
+    with FileInfoCache(tmp_path / "cache.sqlite") as cache:
+
+        async def inspect() -> int:
+            loop_thread = threading.get_ident()
+            await inspection.inspect_files_async(local_files, ["events"], cache=cache)
+            await inspection.inspect_files_async(local_files, ["events"], cache=cache)
+            return loop_thread
+
+        loop_thread = asyncio.run(inspect())
+        assert len(cache) == len(local_files)
+    assert threads
+    assert loop_thread not in threads
+
+
+def test_cache_instance_in_prepare_file_list(tmp_path, local_files):
+    with FileInfoCache(tmp_path / "cache.sqlite", max_entries=2) as cache:
+        prepare_file_list(
+            local_files,
+            "data",
+            "mc",
+            "events",
+            expander_name="local",
+            confirm_tree=False,
+            jobs=2,
+            cache=cache,
+        )
+        assert len(cache) == 2
@@ -1,15 +1,21 @@
 from __future__ import annotations
 
+import asyncio
 import glob
+from typing import Any
 
 import pytest
 from pytest_lazy_fixtures import lf
 
 from fasthep_curator.catalogues.common import (
+    Expander,
+    LocalGlobExpander,
     check_entries_uproot,
     expand_file_list_generic,
+    iter_expand_file_list,
     uproot_num_entries,
 )
+from fasthep_curator.read import Prefix
 
 
 def test_expand_file_list_generic():
@@ -95,3 +101,40 @@ def test_num_entries_empty(input_files, expected):
     assert isinstance(numentries, dict)
     assert isinstance(branches, dict)
     assert len(branches) == 1
+
+
+def test_iter_expand_file_list(dummy_file_dir):
+    files = [str(dummy_file_dir / "events_*.root"), str(dummy_file_dir / "*.root")]
+
+    result = iter_expand_file_list(files, None, glob=glob.iglob)
+
+    assert not isinstance(result, list)
+    assert next(result).endswith(".root")
+    assert len(list(result)) == 5
+    assert list(LocalGlobExpander.iter_expand_file_list(files)) == (
+        expand_file_list_generic(files, None, glob=glob.glob)
+    )
+
+
+class LegacyExpander(Expander):
+    @staticmethod
+    def check_setup() -> bool:
+        return True
+
+    @staticmethod
+    def expand_file_list(files: list[str], prefix: Prefix = None) -> list[str]:
+        return [f"{prefix}/{name}" if prefix else name for name in files]
+
+    @staticmethod
+    def check_files(
+        files: list[str], tree_name: str, disallow_empty: bool
+    ) -> tuple[list[str], dict[str, int] | int, dict[str, Any]]:
+        return files, len(files), {"tree": tree_name, "empty": disallow_empty}
+
+
+def test_check_files_async_without_limit():
+    # expanders whose check_files predates the asynchronous API
+    result = asyncio.run(
+        LegacyExpander.check_files_async(["a.root"], "events", True, limit=4)
+    )
+    assert result == (["a.root"], 1, {"tree": "events", "empty": True})
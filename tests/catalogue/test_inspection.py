@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+import uproot
+
+from fasthep_curator.catalogues import inspection
+from fasthep_curator.catalogues.cache import FileInfoCache
+from fasthep_curator.catalogues.common import check_entries_uproot
+
+
+def test_inspect_file(dummy_file_100):
+    info = inspection.inspect_file(
+        str(dummy_file_100), ["events", "other"], list_branches=True
+    )
+    assert info.path == str(dummy_file_100)
+    assert info.trees["events"].exists
+    assert info.entries("events") == 100
+    assert info.trees["events"].branches == ("ev",)
+    assert not info.trees["other"].exists
+    assert info.entries("other") == 0
+
+
+def test_inspect_file_no_tree(dummy_file_no_tree):
+    info = inspection.inspect_file(str(dummy_file_no_tree), ["events"])
+    assert not info.trees["events"].exists
+    assert info.trees["events"].branches == ()
+
+
+def test_check_entries_opens_each_file_once(opened, all_dummy_files):
+    files = [str(f) for f in all_dummy_files]
+    good_files, numentries, branches = check_entries_uproot(
+        files,
+        "events",
+        disallow_empty=True,
+        confirm_tree=False,
+        list_branches=True,
+    )
+    assert sorted(opened) == sorted(files)
+    assert good_files == [files[0], files[1]]
+    assert numentries == 302
+    assert branches == {"events": {"ev": 1}}
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_inspect_files_parallel(all_dummy_files, executor):
+    files = [str(f) for f in all_dummy_files] * 3
+    serial = inspection.inspect_files(files, ["events"], list_branches=True)
+    parallel = inspection.inspect_files(
+        files, ["events"], list_branches=True, jobs=4, executor=executor
+    )
+    assert [info.path for info in parallel] == files
+    assert parallel == serial
+
+
+def test_inspect_files_existing_executor(all_dummy_files):
+    files = [str(f) for f in all_dummy_files]
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        infos = inspection.inspect_files(files, ["events"], executor=pool)
+    assert [info.entries("events") for info in infos] == [100, 202, 0, 0]
+
+
+def test_get_executor():
+    with pytest.raises(RuntimeError) as e:
+        inspection.get_executor("gobbledy gook", 2)
+    assert "Unknown executor" in str(e)
+
+
+def test_inspect_files_async_overlaps(monkeypatch, dummy_file_100):
+    delay = 0.2
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+    original_open = uproot.open
+
+    def slow_open(path, *args, **kwargs):
+        nonlocal in_flight, max_in_flight
+        with lock:
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+        time.sleep(delay)
+        with lock:
+            in_flight -= 1
+        return original_open(path, *args, **kwargs)
+
+    monkeypatch.setattr(inspection.uproot, "open", slow_open)
+
+    files = [str(dummy_file_100)] * 8
+    start = time.perf_counter()
+    infos = asyncio.run(inspection.inspect_files_async(files, ["events"], limit=4))
+    elapsed = time.perf_counter() - start
+
+    assert [info.entries("events") for info in infos] == [100] * 8
+    assert max_in_flight == 4
+    assert elapsed < len(files) * delay / 2
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_iter_inspect_files_streams(monkeypatch, all_dummy_files, jobs):
+    events: list[str] = []
+    original_open = uproot.open
+
+    def logging_open(path, *args, **kwargs):
+        events.append("open")
+        return original_open(path, *args, **kwargs)
+
+    monkeypatch.setattr(inspection.uproot, "open", logging_open)
+
+    def paths() -> Iterator[str]:
+        for path in [str(f) for f in all_dummy_files] * 5:
+            events.append("glob")
+            yield path
+
+    infos = inspection.iter_inspect_files(paths(), ["events"], jobs=jobs)
+    first = next(infos)
+    assert first.entries("events") == 100
+    assert len(list(infos)) == 19
+    # inspection started well before the expansion was exhausted
+    assert events.index("open") < len(events) - events[::-1].index("glob") - 1
+
+
+@pytest.fixture
+def clustered_file(tmp_path):
+    path = tmp_path / "clustered.root"
+    with uproot.recreate(path) as f:
+        f.mktree("events", {"ev": "int64", "pt": "float64"})
+        for _ in range(4):
+            f["events"].extend({"ev": np.arange(25), "pt": np.ones(25)})
+    return str(path)
+
+
+def test_inspect_file_clusters(clustered_file, dummy_file_202, tmp_path):
+    info = inspection.inspect_file(clustered_file, ["events"], list_clusters=True)
+    assert info.trees["events"].clusters == (0, 25, 50, 75, 100)
+    assert (
+        inspection.inspect_file(clustered_file, ["events"]).trees["events"].clusters
+        == ()
+    )
+
+    # a tree without branches is a single cluster
+    info = inspection.inspect_file(str(dummy_file_202), ["events"], list_clusters=True)
+    assert info.trees["events"].clusters == (0, 202)
+
+    with FileInfoCache(tmp_path / "cache.sqlite") as cache:
+        inspection.inspect_files([clustered_file], ["events"], cache=cache)
+        assert not cache.lookup([clustered_file], ["events"], list_clusters=True)
+        inspection.inspect_files(
+            [clustered_file], ["events"], cache=cache, list_clusters=True
+        )
+        hits = cache.lookup([clustered_file], ["events"], list_clusters=True)
+        assert hits[clustered_file].trees["events"].clusters == (0, 25, 50, 75, 100)
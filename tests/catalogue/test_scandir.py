@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import asyncio
+import glob
+import os
+
+import pytest
+
+from fasthep_curator.catalogues import scandir
+from fasthep_curator.catalogues.cache import file_signature
+from fasthep_curator.catalogues.scandir import ScandirExpander, ScandirGlob
+
+
+@pytest.fixture
+def file_tree(tmp_path, monkeypatch):
+    for directory in ["a/x", "a/y", "b/x", ".hidden"]:
+        (tmp_path / directory).mkdir(parents=True)
+        for name in ["one.root", "two.root", ".three.root", "four.txt"]:
+            (tmp_path / directory / name).touch()
+    (tmp_path / "link").symlink_to(tmp_path / "a")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [
+        "*/*/*.root",
+        "a/*/one.root",
+        "*/x/",
+        "*",
+        ".*",
+        "a/x/.*.root",
+        "a/x/two.root",
+        "a/x/missing.root",
+        "missing/*",
+        "*/*/[ot]*.root",
+        "link/x/*.root",
+    ],
+)
+def test_scandir_glob_matches_glob(file_tree, pattern):
+    relative = ScandirGlob().glob(pattern)
+    assert sorted(relative) == sorted(glob.glob(pattern))
+
+    absolute = str(file_tree / pattern)
+    assert sorted(ScandirGlob().glob(absolute)) == sorted(glob.glob(absolute))
+
+
+@pytest.mark.usefixtures("file_tree")
+def test_scandir_glob_lists_each_directory_once(monkeypatch):
+    listed: list[str] = []
+    original_scandir = os.scandir
+
+    def counting_scandir(path):
+        listed.append(path)
+        return original_scandir(path)
+
+    monkeypatch.setattr(scandir.os, "scandir", counting_scandir)
+
+    scandir_glob = ScandirGlob()
+    patterns = ["a/*/*.root", "a/x/*.txt", "a/*/two.root", "*/x/one.root"]
+    for pattern in patterns:
+        scandir_glob.glob(pattern)
+    assert len(listed) == len(set(listed))
+
+    for path in scandir_glob.glob("*/*/*.root"):
+        assert scandir_glob.stat(path) == os.stat(path)
+        assert scandir_glob.realpath(path) == os.path.realpath(path)
+    assert len(listed) == len(set(listed))
+
+
+def test_scandir_expander(file_tree):
+    files = ["*/x/*.root", "a/*/*.root", "link/y/one.root"]
+    expected = [path for pattern in files for path in glob.glob(pattern)]
+
+    result = ScandirExpander.expand_file_list(files)
+    assert sorted(result) == sorted(expected)
+    expander = ScandirExpander()
+    result = list(expander.iter_expand_file_list(files))
+    assert sorted(result) == sorted(expected)
+    assert [expander.realpath(path) for path in result] == [
+        os.path.realpath(path) for path in result
+    ]
+    assert ScandirExpander.expand_file_list(["*.root"], prefix=str(file_tree / "a/x"))
+
+
+@pytest.mark.usefixtures("file_tree")
+def test_scandir_expansion_shares_listings(monkeypatch):
+    files = ["a/*/*.root", "a/x/*.root", "*/x/one.root"]
+    expected = [path for pattern in files for path in glob.glob(pattern)]
+    listed: list[str] = []
+    original_scandir = os.scandir
+
+    def counting_scandir(path):
+        listed.append(path)
+        return original_scandir(path)
+
+    monkeypatch.setattr(scandir.os, "scandir", counting_scandir)
+
+    expander = ScandirExpander()
+    result = asyncio.run(expander.expand_file_list_async(files, limit=2))
+    assert sorted(result) == sorted(expected)
+    paths = [expander.realpath(path) for path in result]
+    assert len(listed) == len(set(listed))
+
+    # the file cache stats the files through the same listings
+    stat = expander._glob.stat
+    assert all(file_signature(path, stat) == file_signature(path) for path in paths)
+    assert len(listed) == len(set(listed))
+
+    checked = {}
+    monkeypatch.setattr(
+        scandir, "check_entries_uproot", lambda *_, **kwargs: checked.update(kwargs)
+    )
+    expander.check_files(paths, "events", False)
+    assert checked["stat"] == stat
+    assert ScandirExpander()._glob is not expander._glob
@@ -2,8 +2,12 @@ from __future__ import annotations
 
 import os
 from pathlib import Path
+from typing import Any
 
 import pytest
+import uproot
+
+from fasthep_curator.catalogues import inspection
 
 
 @pytest.fixture
@@ -106,3 +110,17 @@ def all_dummy_files(
         dummy_file_empty,
         dummy_file_no_tree,
     ]
+
+
+@pytest.fixture
+def opened(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    """The paths of the files opened by the inspection, in order"""
+    paths: list[str] = []
+    original_open = uproot.open
+
+    def counting_open(path: Any, *args: Any, **kwargs: Any) -> Any:
+        paths.append(str(path))
+        return original_open(path, *args, **kwargs)
+
+    monkeypatch.setattr(inspection.uproot, "open", counting_open)
+    return paths
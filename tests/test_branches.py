@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from fasthep_curator.branches import BranchCatalogue, share_branches
+
+
+def test_branch_catalogue():
+    catalogue = BranchCatalogue.from_files(
+        [("pt", "eta"), ("pt", "eta"), ("eta", "pt"), ("pt",), ()]
+    )
+    assert len(catalogue) == 5
+    assert catalogue.names == ["pt", "eta"]
+    assert len(catalogue.schemas) == 3
+    assert catalogue.files.tolist() == [0, 0, 0, 1, 2]
+    assert catalogue.file_branches(2) == ("pt", "eta")
+    assert catalogue.counts() == {"pt": 4, "eta": 3}
+    assert catalogue.files_with("eta") == [0, 1, 2]
+    assert catalogue.files_without("eta") == [3, 4]
+    assert catalogue.files_without("phi") == [0, 1, 2, 3, 4]
+
+    data = catalogue.to_dict()
+    assert data == {
+        "names": ["pt", "eta"],
+        "schemas": ["3", "1", "0"],
+        "files": data["files"],
+    }
+    restored = BranchCatalogue.from_dict(data)
+    assert restored.counts() == catalogue.counts()
+    assert restored.files_without("eta") == [3, 4]
+    assert restored.add(("eta", "pt")) == 0
+
+
+def test_share_branches():
+    # names read from different files are different objects
+    first = share_branches(["PT".lower(), "eta"])
+    second = share_branches(("PT".lower(), "eta"))
+    assert first is second
+    assert first == ("pt", "eta")
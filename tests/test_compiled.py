@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+from fasthep_curator import compiled
+from fasthep_curator import read as fc_read
+
+
+def test_compiled_from_yaml(yaml_config_2, tmp_path, monkeypatch):
+    cache_dir = tmp_path / "compiled"
+    expected = fc_read.from_yaml(yaml_config_2)
+
+    first = fc_read.from_yaml(yaml_config_2, compiled_cache=cache_dir)
+    assert first == expected
+    assert len(list(cache_dir.iterdir())) == 1
+
+    with monkeypatch.context() as m:
+        m.setattr(fc_read.yaml, "load", None)
+        second = fc_read.from_yaml(yaml_config_2, compiled_cache=cache_dir)
+    assert second == expected
+    assert [d.name for d in second] == ["one", "two"]
+
+    # different options are compiled separately
+    fc_read.from_yaml(yaml_config_2, compiled_cache=cache_dir, expand_prefix=False)
+    assert len(list(cache_dir.iterdir())) == 2
+
+
+def test_compiled_invalidated_by_import(yaml_config_2, yaml_config_1, tmp_path):
+    cache_dir = tmp_path / "compiled"
+    fc_read.from_yaml(yaml_config_2, compiled_cache=cache_dir)
+
+    imported = Path(yaml_config_1)
+    imported.write_text(
+        imported.read_text().replace("eventtype: mc", "eventtype: data")
+    )
+
+    datasets = fc_read.from_yaml(yaml_config_2, compiled_cache=cache_dir)
+    assert datasets[0].eventtype == "data"
+
+
+def test_compiled_survives_touch(yaml_config_2, yaml_config_1, tmp_path, monkeypatch):
+    cache_dir = tmp_path / "compiled"
+    expected = fc_read.from_yaml(yaml_config_2, compiled_cache=cache_dir)
+    monkeypatch.setattr(fc_read.yaml, "load", None)
+
+    stat = Path(yaml_config_1).stat()
+    os.utime(yaml_config_1, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert fc_read.from_yaml(yaml_config_2, compiled_cache=cache_dir) == expected
+
+
+def test_load_corrupt(tmp_path):
+    path = compiled.cache_file(tmp_path, "anything")
+    assert compiled.load(path) is None
+    path.write_bytes(b"not a pickle")
+    assert compiled.load(path) is None
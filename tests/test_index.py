@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any
+
+import pytest
+import yaml
+
+from fasthep_curator import read as fc_read
+from fasthep_curator import write as fc_write
+from fasthep_curator.index import CatalogueIndex
+
+
+@pytest.fixture
+def catalogue(tmp_path):
+    for i in range(3):
+        (tmp_path / f"part_{i}.yml").write_text(
+            yaml.safe_dump(
+                {
+                    "defaults": {"tree": "Events"},
+                    "datasets": [
+                        {
+                            "name": f"data_{i}",
+                            "eventtype": "data",
+                            "files": [f"{{prefix}}/data_{i}.root"],
+                            "campaign": "2018",
+                        },
+                        {
+                            "name": f"mc_{i}",
+                            "eventtype": "mc",
+                            "files": [f"mc_{i}.root"],
+                        },
+                    ],
+                }
+            )
+        )
+    main = tmp_path / "catalogue.yml"
+    main.write_text(
+        "import:\n"
+        + "".join(f'  - "{{this_dir}}/part_{i}.yml"\n' for i in range(3))
+        + "datasets:\n  - name: local\n    eventtype: mc\n"
+    )
+    return str(main)
+
+
+def test_find(catalogue):
+    index = CatalogueIndex.from_yaml(catalogue, prefix="root://host/")
+    datasets = fc_read.from_yaml(catalogue, prefix="root://host/")
+    assert len(index) == len(datasets) == 7
+    assert [d.name for d in index.find()] == [d.name for d in datasets]
+
+    (dataset,) = index.find(name="data_1")
+    assert fc_read.as_dict(dataset) == fc_read.as_dict(datasets[2])
+    assert dataset.files == ["root://host//data_1.root"]
+    assert index["local"].tree == "Events"
+    assert "mc_2" in index
+    assert "missing" not in index
+    assert ["mc_2"] not in index
+    assert {"name": "mc_2"} not in index
+    with pytest.raises(KeyError):
+        index["missing"]
+
+    assert [d.name for d in index.find(eventtype="mc")] == [
+        "mc_0",
+        "mc_1",
+        "mc_2",
+        "local",
+    ]
+    assert [d.name for d in index.find(eventtype="data", campaign="2018")] == [
+        "data_0",
+        "data_1",
+        "data_2",
+    ]
+    assert index.find(eventtype="mc", campaign="2018") == []
+    assert index.find(unknown=1) == []
+    assert "campaign" in index.fields()
+    assert sorted(index.distinct("eventtype")) == ["data", "mc"]
+
+
+def test_find_by_type():
+    index = CatalogueIndex.from_config(
+        {
+            "datasets": [
+                {"name": "flag", "skim": True},
+                {"name": "one", "skim": 1},
+                {"name": "float", "skim": 1.0},
+            ]
+        }
+    )
+    assert [d.name for d in index.find(skim=True)] == ["flag"]
+    assert [d.name for d in index.find(skim=1)] == ["one"]
+    assert [d.name for d in index.find(skim=1.0)] == ["float"]
+    assert index.distinct("skim") == [True, 1, 1.0]
+    assert [type(value) for value in index.distinct("skim")] == [bool, int, float]
+
+
+def test_find_reads_only_needed_files(catalogue, tmp_path, monkeypatch):
+    cache_dir = tmp_path / "compiled"
+    CatalogueIndex.from_yaml(catalogue, compiled_cache=cache_dir)
+
+    fc_read.clear_parse_cache()
+    loaded: list[str] = []
+    load = fc_read._load_yaml_config
+
+    def recording_load(path: str) -> dict[str, Any]:
+        loaded.append(path)
+        return load(path)
+
+    monkeypatch.setattr(fc_read, "_load_yaml_config", recording_load)
+    index = CatalogueIndex.from_yaml(catalogue, compiled_cache=cache_dir)
+    assert loaded == []
+    assert index.sources(name="mc_1") == [str(tmp_path / "part_1.yml")]
+
+    assert index["mc_1"].files == ["mc_1.root"]
+    assert index["data_1"].eventtype == "data"
+    assert loaded == [str(tmp_path / "part_1.yml")]
+
+
+def test_index_invalidated(catalogue, tmp_path):
+    cache_dir = tmp_path / "compiled"
+    CatalogueIndex.from_yaml(catalogue, compiled_cache=cache_dir)
+    part = Path(tmp_path / "part_2.yml")
+    part.write_text(part.read_text().replace("mc_2", "mc_new"))
+
+    index = CatalogueIndex.from_yaml(catalogue, compiled_cache=cache_dir)
+    assert "mc_new" in index
+    assert "mc_2" not in index
+
+
+def test_sharded_index(tmp_path):
+    directory = tmp_path / "catalogue"
+    directory.mkdir()
+    for name in ["one", "two"]:
+        fc_write.write_yaml({"name": name, "eventtype": "mc"}, str(directory) + "/")
+    index = CatalogueIndex.from_yaml(str(directory))
+    assert [d.name for d in index.find(eventtype="mc")] == ["one", "two"]
+
+
+def test_from_config():
+    index = CatalogueIndex.from_config(
+        {"defaults": {"eventtype": "mc"}, "datasets": ["one", {"name": "two"}]}
+    )
+    assert [d.name for d in index.find(eventtype="mc")] == ["one", "two"]
+    assert index.sources() == []
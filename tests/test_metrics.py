@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+import fasthep_curator.write as fc_write
+from fasthep_curator.catalogues.common import (
+    check_entries_uproot,
+    check_entries_uproot_async,
+)
+from fasthep_curator.metrics import STAGES, CurationStats, LatencyReport
+
+
+def test_stage_and_timed_iter():
+    stats = CurationStats()
+    with stats.stage("write_yaml", count=2):
+        pass
+    assert stats["write_yaml"].count == 2
+    assert stats["write_yaml"].seconds > 0
+
+    assert list(stats.timed_iter("glob", "abc")) == ["a", "b", "c"]
+    assert stats["glob"].count == 3
+
+
+def test_prepare_file_list_stats(dummy_file_dir, tmp_path):
+    files = [str(dummy_file_dir / "*.root")]
+    stats = CurationStats()
+    data = fc_write.prepare_file_list(
+        files,
+        "data",
+        "mc",
+        tree_name="events",
+        expander_name="local",
+        confirm_tree=False,
+        include_branches=True,
+        stats=stats,
+    )
+    assert data == fc_write.prepare_file_list(
+        files,
+        "data",
+        "mc",
+        tree_name="events",
+        expander_name="local",
+        confirm_tree=False,
+        include_branches=True,
+    )
+    fc_write.write_yaml(data, str(tmp_path / "out.yml"), stats=stats)
+
+    assert stats["glob"].count == 4
+    assert stats["realpath"].count == 4
+    assert stats.files == stats.files_opened == 4
+    # no-tree.root has no tree to list branches for
+    assert stats["branches"].count == 3
+    assert stats.bytes_read > 0
+    assert stats.files_per_second > 0
+    assert stats["write_yaml"].count == 1
+    assert all(stats[name].seconds > 0 for name in STAGES)
+
+    exported = json.loads(stats.to_json())
+    assert exported["stages"]["glob"]["count"] == 4
+    assert exported["bytes_read"] == stats.bytes_read
+
+
+def test_prepare_file_list_async_stats(dummy_file_dir):
+    files = [str(dummy_file_dir / "*.root")]
+    stats = CurationStats()
+    asyncio.run(
+        fc_write.prepare_file_list_async(
+            files, "data", "mc", "events", "local", confirm_tree=False, stats=stats
+        )
+    )
+    assert stats["glob"].count == stats.files == 4
+
+
+def test_prometheus(tmp_path):
+    stats = CurationStats()
+    stats["check_entries"].add(2.0, 10)
+    stats.bytes_read = 1024
+    text = stats.to_prometheus(labels={"dataset": 'd"1'})
+    lines = text.splitlines()
+    assert "# TYPE fasthep_curator_stage_seconds gauge" in lines
+    assert (
+        'fasthep_curator_stage_items{dataset="d\\"1",stage="check_entries"} 10' in lines
+    )
+    assert 'fasthep_curator_files_per_second{dataset="d\\"1"} 5.0' in lines
+
+    path = tmp_path / "curator.prom"
+    stats.write_prometheus(path)
+    assert "fasthep_curator_bytes_read 1024\n" in path.read_text()
+    stats.write_json(tmp_path / "curator.json")
+    assert json.loads((tmp_path / "curator.json").read_text())["files"] == 10
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_cached_files_not_counted_as_opened(dummy_file_dir, tmp_path, cached):
+    files = [str(dummy_file_dir / "events_*.root")]
+    cache = str(tmp_path / "cache.sqlite")
+    if cached:
+        fc_write.prepare_file_list(files, "data", "mc", "events", "local", cache=cache)
+    stats = CurationStats()
+    fc_write.prepare_file_list(
+        files, "data", "mc", "events", "local", cache=cache, stats=stats
+    )
+    assert stats.files == 2
+    assert stats.files_opened == (0 if cached else 2)
+
+
+def _info(path: str, open_seconds: float, read_seconds: float = 0.0) -> SimpleNamespace:
+    return SimpleNamespace(
+        path=path, open_seconds=open_seconds, read_seconds=read_seconds
+    )
+
+
+def test_latency_report():
+    report = LatencyReport(slowest=2, buckets=[0.1, 1.0])
+    report.add_file_infos(
+        [
+            _info("root://fast.site:1094//store/a.root", 0.02, 0.01),
+            _info("root://slow.site:1094//store/b.root", 3.0, 1.0),
+            _info("root://slow.site:1094//store/c.root", 0.5),
+            _info("root://fast.site:1094//store/d.root", 0.05),
+            _info("root://fast.site:1094//store/cached.root", 0.0),
+        ]
+    )
+    assert report.files == 4
+    assert report.histogram() == [(0.1, 2), (1.0, 3), (math.inf, 4)]
+    assert [latency.path for latency in report.slowest_files()] == [
+        "root://slow.site:1094//store/b.root",
+        "root://slow.site:1094//store/c.root",
+    ]
+    assert report.slowest_files()[0].open_seconds == 3.0
+    endpoints = report.slowest_endpoints()
+    assert [name for name, _ in endpoints] == [
+        "root://slow.site:1094",
+        "root://fast.site:1094",
+    ]
+    assert endpoints[0][1].max_seconds == 4.0
+    assert "root://slow.site:1094//store/b.root" in report.format()
+
+    lines = report.to_prometheus().splitlines()
+    assert 'fasthep_curator_file_latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert "fasthep_curator_file_latency_seconds_count 4" in lines
+    json.dumps(report.to_dict())
+
+
+def test_check_entries_latency(dummy_file_dir):
+    files = [str(dummy_file_dir / "events_*.root")]
+    report = LatencyReport(slowest=1)
+    fc_write.prepare_file_list(files, "data", "mc", "events", "local", latency=report)
+    assert report.files == 2
+    assert len(report.slowest_files()) == 1
+    (endpoint,) = report.endpoints
+    assert Path(endpoint).is_mount()
+    assert report.endpoints[endpoint].files == 2
+
+
+def test_check_entries_latency_failure(dummy_file_dir, tmp_path):
+    broken = tmp_path / "broken.root"
+    broken.write_bytes(b"not a ROOT file")
+    files = [str(dummy_file_dir / "events_100.root"), str(broken)]
+    report = LatencyReport()
+    with pytest.raises(OSError, match=r"broken\.root"):
+        check_entries_uproot(files, "events", False, latency=report)
+    assert report.files == 2
+    assert report.failures == 1
+    assert {latency.path for latency in report.slowest_files()} == set(files)
+    assert "1 failed" in report.format()
+    assert "fasthep_curator_file_failures_total 1" in report.to_prometheus()
+
+    report = LatencyReport()
+    with pytest.raises(OSError, match=r"broken\.root"):
+        asyncio.run(
+            check_entries_uproot_async(files[1:], "events", False, latency=report)
+        )
+    assert report.failures == report.files == 1
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import pytest
+
+from fasthep_curator import partition as fc_partition
+from fasthep_curator import read as fc_read
+from fasthep_curator.partition import FileRange
+
+
+@pytest.fixture
+def dataset():
+    return fc_read.Dataset(
+        name="data",
+        tree="events",
+        files=["a.root", "b.root", "c.root", "d.root", "e.root"],
+        file_entries=[250, 30, 40, 0, 50],
+    )
+
+
+def test_partition_by_events(dataset):
+    units = fc_partition.partition(dataset, events_per_unit=100)
+    assert [unit.ranges for unit in units] == [
+        [FileRange("a.root", 0, 83)],
+        [FileRange("a.root", 83, 166)],
+        [FileRange("a.root", 166, 250)],
+        [FileRange("b.root", 0, 30), FileRange("c.root", 0, 40)],
+        [FileRange("e.root", 0, 50)],
+    ]
+    assert sum(unit.entries for unit in units) == 370
+
+
+def test_partition_by_files(dataset):
+    units = fc_partition.partition(dataset, files_per_unit=2)
+    assert [[r.path for r in unit.ranges] for unit in units] == [
+        ["a.root", "b.root"],
+        ["c.root", "e.root"],
+    ]
+
+    units = fc_partition.partition(dataset, events_per_unit=1000, files_per_unit=3)
+    assert [unit.nfiles for unit in units] == [3, 1]
+
+
+def test_partition_snaps_to_clusters(dataset):
+    dataset.file_clusters = [[0, 100, 200, 250], [0, 30], [0, 40], [0], [0, 50]]
+    units = fc_partition.partition(dataset, events_per_unit=100)
+    assert [unit.ranges for unit in units[:3]] == [
+        [FileRange("a.root", 0, 100)],
+        [FileRange("a.root", 100, 200)],
+        [FileRange("a.root", 200, 250)],
+    ]
+    assert sum(unit.entries for unit in units) == 370
+
+    units = fc_partition.partition(dataset, events_per_unit=100, snap_to_clusters=False)
+    assert units[0].ranges == [FileRange("a.root", 0, 83)]
+
+
+def test_partition_errors(dataset):
+    with pytest.raises(RuntimeError, match="at least one"):
+        fc_partition.partition(dataset)
+    with pytest.raises(RuntimeError, match="positive"):
+        fc_partition.partition(dataset, events_per_unit=0)
+    with pytest.raises(RuntimeError, match="No per-file entries"):
+        fc_partition.partition(
+            fc_read.Dataset(name="x", files=["a.root"], nevents=10),
+            events_per_unit=10,
+        )
+
+
+def test_balance(dataset):
+    units = fc_partition.partition(dataset, events_per_unit=100)
+    assigned = fc_partition.balance(units, 2)
+    loads = sorted(sum(unit.entries for unit in worker) for worker in assigned)
+    assert loads == [166, 204]
+    assert sorted(u.entries for worker in assigned for u in worker) == sorted(
+        u.entries for u in units
+    )
+
+    assert fc_partition.balance(units, 10)[-1] == []
+    with pytest.raises(RuntimeError):
+        fc_partition.balance(units, 0)
@@ -1,5 +1,10 @@
 from __future__ import annotations
 
+import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
 import pytest
 
 from fasthep_curator import read as fc_read
@@ -47,6 +52,48 @@ def test_from_dict():
     assert config["three"] == 333
 
 
+def test_shared_defaults():
+    defaults = {"eventtype": "mc", "branches": {"pt": 3}}
+    first = fc_read.from_string("one", defaults)
+    second = fc_read.from_dict({"name": "two", "eventtype": "data"}, defaults)
+    assert first.maps[1] is second.maps[1]
+    assert second["eventtype"] == "data"
+    assert first.to_dict() == {"name": "one", "eventtype": "mc", "branches": {"pt": 3}}
+
+    # overrides only change the dataset itself
+    first["eventtype"] = "data"
+    assert fc_read.from_string("three", defaults)["eventtype"] == "mc"
+    with pytest.raises(TypeError, match="cannot be modified"):
+        first.maps[1]["eventtype"] = "data"
+
+    # changed defaults get a new layer
+    defaults["eventtype"] = "signal"
+    assert fc_read.from_string("four", defaults)["eventtype"] == "signal"
+    assert second.maps[1]["eventtype"] == "mc"
+
+    layer = pickle.loads(pickle.dumps(first.maps[1]))
+    assert layer == first.maps[1]
+    assert isinstance(layer, fc_read.FrozenDefaults)
+
+
+def test_shared_defaults_threads():
+    # threads creating datasets from their own defaults do not evict each
+    # other's layer
+    barrier = threading.Barrier(2)
+
+    def create(eventtype):
+        defaults = {"eventtype": eventtype}
+        layers = []
+        for i in range(20):
+            barrier.wait()
+            layers.append(fc_read.from_string(str(i), defaults).maps[1])
+        return layers
+
+    with ThreadPoolExecutor(2) as pool:
+        for layers in pool.map(create, ["mc", "data"]):
+            assert all(layer is layers[0] for layer in layers)
+
+
 def test_empty_yaml_config(empty_yaml_config: str):
     with pytest.raises(RuntimeError) as e:
         fc_read.from_yaml(empty_yaml_config)
@@ -101,3 +148,305 @@ def test_apply_prefix():
     with pytest.raises(ValueError) as e:  # noqa: PT011
         fc_read.apply_prefix(prefix, files, "default", dataset)
     assert "defined 2 times" in str(e)
+
+
+def test_apply_prefix_braces():
+    files = ["{prefix}one", "{{literal}}/{prefix}two"]
+    assert fc_read.apply_prefix("p/", files) == ["p/one", "{literal}/p/two"]
+    with pytest.raises(KeyError):
+        fc_read.apply_prefix("p/", ["{prefix}{other}"])
+
+
+def test_split_prefix():
+    prefix = [{"default": "a/"}, {"mirror": "b/"}]
+    files = ["{prefix}one", "two", "{{x}}{prefix}three"]
+    prefixed = fc_read.split_prefix(prefix, files, dataset="data")
+    assert list(prefixed) == fc_read.apply_prefix(prefix, files)
+    assert prefixed.prefix_names == ["default", "mirror"]
+    assert list(prefixed.pairs()) == [(0, "one"), (None, "two"), (0, files[2])]
+
+    mirror = prefixed.select("mirror")
+    assert mirror.prefix == "b/"
+    assert list(mirror) == fc_read.apply_prefix(prefix, files, "mirror")
+    assert mirror[0] == "b/one"
+    assert mirror[-2:] == ["two", "{x}b/three"]
+    assert mirror._suffixes is prefixed._suffixes
+    with pytest.raises(ValueError, match="not defined"):
+        prefixed.select("missing")
+
+    unprefixed = fc_read.split_prefix(None, files)
+    assert list(unprefixed) == files
+
+    dataset = fc_read.LazyDataset(
+        {"name": "lazy", "files": files}, prefix=prefix, selected_prefix="mirror"
+    )
+    assert list(dataset.prefixed_files()) == dataset.files
+    assert dataset.prefixed_files("default")[0] == "a/one"
+
+
+def test_dataset():
+    dataset = fc_read.Dataset(name="data", eventtype="mc", campaign="2018")
+    assert not hasattr(dataset, "__weakref__")
+    assert dataset.name == "data"
+    assert dataset.campaign == "2018"
+    assert vars(dataset) == {"name": "data", "eventtype": "mc", "campaign": "2018"}
+    with pytest.raises(AttributeError):
+        _ = dataset.files
+
+    dataset.files = ["a.root"]
+    dataset.generator = "pythia"
+    del dataset.campaign
+    assert dataset.to_dict() == {
+        "name": "data",
+        "eventtype": "mc",
+        "files": ["a.root"],
+        "generator": "pythia",
+    }
+    with pytest.raises(AttributeError):
+        del dataset.campaign
+
+    restored = pickle.loads(pickle.dumps(dataset))
+    assert restored == dataset
+    assert restored != fc_read.Dataset(name="data")
+    assert repr(restored).startswith("Dataset(name='data'")
+
+    # vars returns a copy
+    vars(dataset)["name"] = "changed"
+    assert dataset.name == "data"
+
+
+def test_dataset_private_settings(tmp_path):
+    dataset = fc_read.Dataset(name="data", _note="hi")
+    assert dataset._note == "hi"
+    dataset._other = 1
+    assert dataset.to_dict() == {"name": "data", "_note": "hi", "_other": 1}
+    del dataset._other
+    assert pickle.loads(pickle.dumps(dataset)) == dataset
+
+    catalogue = tmp_path / "catalogue.yml"
+    catalogue.write_text(
+        "defaults: {_origin: test}\ndatasets:\n  - {name: one, _note: hi}\n"
+    )
+    (loaded,) = fc_read.from_yaml(str(catalogue))
+    assert loaded._note == "hi"
+    assert loaded._origin == "test"
+    assert loaded.to_dict() == {"name": "one", "_note": "hi", "_origin": "test"}
+
+
+def test_lazy_dataset():
+    defaults = {"eventtype": "mc", "files": ["{prefix}default"]}
+    dataset = fc_read.LazyDataset(
+        {"name": "lazy", "files": ["{prefix}one", "two"]}, defaults, prefix="p/"
+    )
+    assert isinstance(dataset, fc_read.Dataset)
+    assert vars(dataset) == {"name": "lazy"}
+
+    assert dataset.eventtype == "mc"
+    assert dataset.files == ["p/one", "two"]
+    assert dataset.files is dataset.files
+    assert vars(dataset) == {
+        "name": "lazy",
+        "eventtype": "mc",
+        "files": ["p/one", "two"],
+    }
+    with pytest.raises(AttributeError):
+        _ = dataset.nevents
+
+    from_defaults = fc_read.LazyDataset({"name": "other"}, defaults, prefix="p/")
+    assert from_defaults.to_dict() == {
+        "eventtype": "mc",
+        "files": ["p/default"],
+        "name": "other",
+    }
+
+    restored = pickle.loads(pickle.dumps(from_defaults))
+    assert restored == from_defaults
+    assert vars(restored) == from_defaults.to_dict()
+
+
+def test_from_yaml_lazy_defaults(tmp_path):
+    content = """
+    defaults:
+      eventtype: mc
+      tree: events
+    datasets:
+      - name: one
+        files: ["{prefix}one"]
+      - name: two
+        eventtype: data
+        files: ["{prefix}two"]
+      - three
+    """
+    config = tmp_path / "lazy.yml"
+    config.write_text(content)
+
+    datasets = fc_read.from_yaml(str(config), prefix="a/")
+    assert [d.name for d in datasets] == ["one", "two", "three"]
+    assert "eventtype" not in vars(datasets[0])
+    assert [d.eventtype for d in datasets] == ["mc", "data", "mc"]
+    assert datasets[1].files == ["a/two"]
+    assert datasets[2].to_dict() == {
+        "eventtype": "mc",
+        "tree": "events",
+        "name": "three",
+    }
+
+
+@pytest.fixture
+def nested_imports(tmp_path):
+    files = {
+        "main.yml": """
+        import: ["{this_dir}/a.yml", "{this_dir}/b.yml"]
+        defaults: {tree: main}
+        datasets: [main]
+        """,
+        "a.yml": """
+        import: ["{this_dir}/c.yml"]
+        defaults: {eventtype: mc}
+        datasets: [a1, {name: a2, tree: own}]
+        """,
+        "b.yml": """
+        import: ["{this_dir}/c.yml", "{this_dir}/d.yml"]
+        defaults: {eventtype: data}
+        datasets: [b1]
+        """,
+        "c.yml": """
+        defaults: {tree: c}
+        datasets: [c1]
+        """,
+        "d.yml": "datasets: [d1]",
+    }
+    for name, content in files.items():
+        (tmp_path / name).write_text(content)
+    return tmp_path
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_concurrent_imports(nested_imports, jobs, monkeypatch):
+    fc_read.clear_parse_cache()
+    loaded: list[str] = []
+    load = fc_read._load_yaml_config
+
+    def recording_load(path: str) -> dict[str, Any]:
+        loaded.append(path)
+        return load(path)
+
+    monkeypatch.setattr(fc_read, "_load_yaml_config", recording_load)
+    datasets = fc_read.from_yaml(str(nested_imports / "main.yml"), jobs=jobs)
+    assert [(d.name, d.tree, getattr(d, "eventtype", None)) for d in datasets] == [
+        ("c1", "c", "mc"),
+        ("a1", "c", "mc"),
+        ("a2", "own", "mc"),
+        ("d1", "c", "data"),
+        ("b1", "c", "data"),
+        ("main", "c", "data"),
+    ]
+    assert len(loaded) == len(set(loaded)) == 5
+
+    # parsed files are reused by other catalogues
+    fc_read.from_yaml(str(nested_imports / "b.yml"), jobs=jobs)
+    assert len(loaded) == 5
+
+
+def test_parse_cache_copies(tmp_path, monkeypatch):
+    fc_read.clear_parse_cache()
+    (tmp_path / "part.yml").write_text(
+        "datasets:\n  - {name: one, files: [a.root], branches: {Events: {x: 1}}}\n"
+    )
+    main = tmp_path / "main.yml"
+    main.write_text('import: ["{this_dir}/part.yml"]\n')
+    (dataset,) = fc_read.from_yaml(str(main))
+    dataset.files.append("b.root")
+    dataset.branches["Events"]["y"] = 1
+    (reloaded,) = fc_read.from_yaml(str(main))
+    assert reloaded.files == ["a.root"]
+    assert reloaded.branches == {"Events": {"x": 1}}
+
+    # a changed file replaces its entry, and only the latest files are kept
+    monkeypatch.setattr(fc_read, "MAX_PARSED_FILES", 2)
+    main.write_text('import: ["{this_dir}/part.yml"]\ndatasets: [two]\n')
+    assert [d.name for d in fc_read.from_yaml(str(main))] == ["one", "two"]
+    assert len(fc_read._parsed_files) == 2
+    (tmp_path / "other.yml").write_text("datasets: [three]\n")
+    fc_read.from_yaml(str(tmp_path / "other.yml"))
+    assert str(main.resolve()) not in fc_read._parsed_files
+
+    # nor more than the allowed size
+    monkeypatch.setattr(fc_read, "MAX_PARSED_BYTES", 1)
+    (tmp_path / "large.yml").write_text("datasets: [four]\n")
+    fc_read.from_yaml(str(tmp_path / "large.yml"))
+    assert fc_read._parsed_files == {}
+    assert fc_read._parsed_bytes == 0
+
+
+def test_no_pool_without_imports(tmp_path, monkeypatch):
+    catalogue = tmp_path / "catalogue.yml"
+    catalogue.write_text("datasets:\n  - name: one\n")
+    monkeypatch.setattr(fc_read, "ThreadPoolExecutor", None)
+    assert [d.name for d in fc_read.from_yaml(str(catalogue), jobs=4)] == ["one"]
+
+
+def test_concurrent_imports_missing_file(nested_imports):
+    (nested_imports / "d.yml").unlink()
+    with pytest.raises(FileNotFoundError):
+        fc_read.from_yaml(str(nested_imports / "main.yml"))
+
+
+def test_entries_per_file():
+    dataset = fc_read.Dataset(name="a", tree="events", file_entries=[1, 2])
+    assert fc_read.entries_per_file(dataset).tolist() == [1, 2]
+    assert fc_read.entries_per_file(dataset).dtype == "int64"
+
+    dataset = fc_read.Dataset(
+        name="b", tree=["one", "two"], file_entries={"one": [1], "two": [3]}
+    )
+    assert fc_read.entries_per_file(dataset, "two").tolist() == [3]
+    with pytest.raises(RuntimeError, match="tree 'None'"):
+        fc_read.entries_per_file(dataset)
+
+    # per-file counts recorded when empty files are allowed, keyed by path
+    dataset = fc_read.Dataset(
+        name="c", tree="events", files=["y", "x"], nevents={"x": 5, "y": 0}
+    )
+    assert fc_read.entries_per_file(dataset).tolist() == [0, 5]
+
+    dataset = fc_read.Dataset(
+        name="c", tree="events", files=["x", "z"], nevents={"x": 5, "y": 0}
+    )
+    with pytest.raises(RuntimeError, match="file 'z'"):
+        fc_read.entries_per_file(dataset)
+
+    dataset = fc_read.LazyDataset(
+        {
+            "name": "e",
+            "tree": ["one", "two"],
+            "files": ["{prefix}/b.root", "{prefix}/a.root"],
+            "nevents": {
+                "one": {"root://host//a.root": 1, "root://host//b.root": 2},
+                "two": {"root://host//a.root": 3, "root://host//b.root": 4},
+            },
+        },
+        prefix="root://host/",
+    )
+    assert fc_read.entries_per_file(dataset, "two").tolist() == [4, 3]
+
+    dataset = fc_read.Dataset(name="d", tree=["one", "two"], nevents={"one": 5})
+    with pytest.raises(RuntimeError, match="No per-file entries"):
+        fc_read.entries_per_file(dataset)
+
+
+def test_expand_files():
+    files = ["a.root", {"directory": "/d/", "names": ["b.root"]}]
+    files.append({"directory": "/d/", "name": "t_{index}.root", "range": [9, 11]})
+    files.append({"name": "{index}", "range": [1, 3], "width": 3})
+    assert fc_read.expand_files(files) == [
+        "a.root",
+        "/d/b.root",
+        "/d/t_9.root",
+        "/d/t_10.root",
+        "001",
+        "002",
+    ]
+    assert fc_read.expand_files(["x"]) == ["x"]
+    with pytest.raises(RuntimeError, match="Invalid entry"):
+        fc_read.expand_files([{"directory": "/d/"}])
@@ -1,11 +1,21 @@
 from __future__ import annotations
 
+import asyncio
+import errno
+import itertools
+import logging
+import random
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Any
 
 import pytest
+import yaml
 
 import fasthep_curator.catalogues as cat
 import fasthep_curator.write as fc_write
+from fasthep_curator import read as fc_read
 
 
 def test_select_default():
@@ -22,6 +32,37 @@ def test_select_default():
     assert default is None
 
 
+def test_select_default_mixed_types():
+    shared = ["{prefix}/a.root", "{prefix}/b.root"]
+    values = [{"one": 1}, shared, 3, list(shared), {"one": 1}, list(shared)]
+    default = fc_write.select_default(values)
+    assert default == shared
+    assert default is shared
+
+    assert fc_write.select_default([{"a": [1]}, {"a": [1]}, "x"]) == {"a": [1]}
+    assert fc_write.select_default([[1], (1,), [1.0]]) == [1]
+    assert fc_write.select_default([{"a": 1}, {"a": 2}, None]) is None
+
+
+def test_select_default_matches_sorting():
+    def reference(values: list[int]) -> int | None:
+        groups = [
+            (group, len(list(items)))
+            for group, items in itertools.groupby(sorted(values))
+        ]
+        groups = [group for group in groups if group[1] > 1]
+        if not groups:
+            return None
+        most_common = max(count for _, count in groups)
+        winners = [group for group, count in groups if count == most_common]
+        return winners[0] if len(winners) == 1 else None
+
+    rng = random.Random(42)
+    for _ in range(200):
+        values = [rng.randint(0, 5) for _ in range(rng.randint(0, 10))]
+        assert fc_write.select_default(values) == reference(values)
+
+
 def test_add_meta():
     dataset = {"one": 1, "two": "2"}
     fc_write.add_meta(dataset, [("three", 3), ("4", "four")])
@@ -56,7 +97,27 @@ def test_prepare_contents():
     assert all("a" in d for d in contents["datasets"])
 
 
-@pytest.mark.parametrize("expand", ["xrootd", "local"])
+def test_prepare_contents_nested_values():
+    shared = [f"{{prefix}}/tree_{i}.root" for i in range(10)]
+    datasets: list[dict[str, Any]] = [
+        {"name": "a", "files": list(shared), "nevents": {"x": 1}, "tree": "events"},
+        {"name": "b", "files": list(shared), "nevents": 5, "tree": "events"},
+        {"name": "c", "files": ["other.root"], "nevents": {"x": 1}, "tree": "t"},
+    ]
+    contents = fc_write.prepare_contents(datasets)
+    assert contents["defaults"] == {
+        "files": shared,
+        "nevents": {"x": 1},
+        "tree": "events",
+    }
+    assert contents["datasets"] == [
+        {"name": "a"},
+        {"name": "b", "nevents": 5},
+        {"name": "c", "files": ["other.root"], "tree": "t"},
+    ]
+
+
+@pytest.mark.parametrize("expand", ["xrootd", "local", "scandir"])
 @pytest.mark.parametrize("prefix", [None, str(Path.cwd())])
 @pytest.mark.parametrize(
     ("nfiles", "nevents", "empty"), [(2, 302, True), (4, 302, False)]
@@ -109,6 +170,441 @@ def test_prepare_file_list_confirm_trees(dummy_file_dir, empty, expand):
     assert "events" in str(e)
 
 
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_prepare_file_list_parallel(dummy_file_dir, executor):
+    files = [str(dummy_file_dir / "*.root")]
+    serial = fc_write.prepare_file_list(
+        files,
+        "data",
+        "mc",
+        tree_name="events",
+        expander_name="local",
+        confirm_tree=False,
+        include_branches=True,
+    )
+    parallel = fc_write.prepare_file_list(
+        files,
+        "data",
+        "mc",
+        tree_name="events",
+        expander_name="local",
+        confirm_tree=False,
+        include_branches=True,
+        jobs=4,
+        executor=executor,
+    )
+    assert parallel == serial
+
+
+def test_prepare_file_list_existing_executor(dummy_file_dir):
+    files = [str(dummy_file_dir / "*.root")]
+    with ThreadPoolExecutor(2) as pool:
+        shared = fc_write.prepare_file_list(
+            files, "data", "mc", "events", "local", confirm_tree=False, executor=pool
+        )
+        assert fc_write.prepare_file_list(
+            files, "data", "mc", "events", "local", confirm_tree=False, executor=pool
+        )
+    assert shared == fc_write.prepare_file_list(
+        files, "data", "mc", "events", "local", confirm_tree=False
+    )
+
+
+@pytest.mark.parametrize("expand", ["xrootd", "local"])
+@pytest.mark.parametrize("empty", [True, False])
+def test_prepare_file_list_async(dummy_file_dir, expand, empty):
+    files = [str(dummy_file_dir / "*.root"), str(dummy_file_dir / "events_*.root")]
+    kwargs = {
+        "tree_name": "events",
+        "expander_name": expand,
+        "confirm_tree": False,
+        "include_branches": True,
+        "no_empty_files": empty,
+    }
+    expected = fc_write.prepare_file_list(files, "data", "mc", **kwargs)
+    result = asyncio.run(
+        fc_write.prepare_file_list_async(files, "data", "mc", limit=2, **kwargs)
+    )
+    assert result == expected
+
+
+@pytest.fixture
+def curation_dir(tmp_path, dummy_file_100, dummy_file_202):
+    directory = tmp_path / "data"
+    directory.mkdir()
+    shutil.copy(dummy_file_100, directory / "events_100.root")
+    shutil.copy(dummy_file_202, directory / "events_202.root")
+    return directory
+
+
+@pytest.mark.parametrize("empty", [True, False])
+def test_prepare_file_list_incremental(tmp_path, curation_dir, opened, empty):
+    out_file = str(tmp_path / "catalogue.yml")
+    kwargs = {
+        "tree_name": "events",
+        "expander_name": "local",
+        "confirm_tree": False,
+        "no_empty_files": empty,
+        "include_branches": True,
+        "prefix": str(curation_dir),
+    }
+    files = ["*.root"]
+    fc_write.write_yaml(
+        fc_write.prepare_file_list(files, "data", "mc", **kwargs), out_file
+    )
+    assert len(opened) == 2
+
+    shutil.copy(curation_dir / "events_100.root", curation_dir / "events_300.root")
+    updated = fc_write.prepare_file_list(
+        files, "data", "mc", previous=out_file, **kwargs
+    )
+    assert opened[2:] == [str(curation_dir / "events_300.root")]
+    assert updated == fc_write.prepare_file_list(files, "data", "mc", **kwargs)
+    assert updated["nfiles"] == 3
+
+    fc_write.write_yaml(updated, out_file, update=True)
+    datasets = fc_read.from_yaml(out_file)
+    assert len(datasets) == 1
+    assert datasets[0].nfiles == 3
+
+
+def test_prepare_file_list_incremental_removed(tmp_path, curation_dir, opened, caplog):
+    out_file = str(tmp_path / "catalogue.yml")
+    kwargs: dict[str, Any] = {
+        "tree_name": "events",
+        "expander_name": "local",
+        "confirm_tree": False,
+        "no_empty_files": False,
+    }
+    files = [str(curation_dir / "*.root")]
+    fc_write.write_yaml(
+        fc_write.prepare_file_list(files, "data", "mc", **kwargs), out_file
+    )
+    (curation_dir / "events_100.root").unlink()
+
+    updated = fc_write.prepare_file_list(
+        files, "data", "mc", previous=out_file, **kwargs
+    )
+    assert len(opened) == 2
+    assert updated["nfiles"] == 1
+    assert updated["nevents"] == {str(curation_dir / "events_202.root"): 202}
+
+    # totals cannot be reduced without per-file information
+    kwargs["no_empty_files"] = True
+    out_file = str(tmp_path / "totals.yml")
+    fc_write.write_yaml(
+        fc_write.prepare_file_list(files, "totals", "mc", **kwargs), out_file
+    )
+    shutil.copy(curation_dir / "events_202.root", curation_dir / "events_100.root")
+    fc_write.write_yaml(
+        fc_write.prepare_file_list(files, "totals", "mc", **kwargs),
+        out_file,
+        update=True,
+    )
+    (curation_dir / "events_100.root").unlink()
+    opened.clear()
+    with caplog.at_level(logging.WARNING, logger=fc_write.logger.name):
+        updated = fc_write.prepare_file_list(
+            files, "totals", "mc", previous=out_file, **kwargs
+        )
+    assert "redoing all files" in caplog.text
+    assert len(opened) == 1
+    assert updated["nevents"] == 202
+
+    # with the entries of each file recorded they are subtracted instead
+    kwargs["per_file_entries"] = True
+    shutil.copy(curation_dir / "events_202.root", curation_dir / "events_100.root")
+    out_file = str(tmp_path / "per_file.yml")
+    fc_write.write_yaml(
+        fc_write.prepare_file_list(files, "totals", "mc", **kwargs), out_file
+    )
+    (curation_dir / "events_100.root").unlink()
+    opened.clear()
+    updated = fc_write.prepare_file_list(
+        files, "totals", "mc", previous=out_file, **kwargs
+    )
+    assert opened == []
+    assert updated == fc_write.prepare_file_list(files, "totals", "mc", **kwargs)
+    assert updated["nevents"] == 202
+
+
+@pytest.mark.parametrize("empty", [True, False])
+def test_prepare_file_list_per_file_entries(tmp_path, curation_dir, empty):
+    out_file = tmp_path / "catalogue.yml"
+    kwargs = {
+        "tree_name": "events",
+        "expander_name": "local",
+        "confirm_tree": False,
+        "no_empty_files": empty,
+        "prefix": str(curation_dir),
+    }
+    files = ["events_*.root"]
+    data = fc_write.prepare_file_list(
+        files, "data", "mc", per_file_entries=True, **kwargs
+    )
+    expected = {"{prefix}/events_100.root": 100, "{prefix}/events_202.root": 202}
+    assert dict(zip(data["files"], data["file_entries"])) == expected
+    assert (
+        data["nevents"]
+        == (fc_write.prepare_file_list(files, "data", "mc", **kwargs)["nevents"])
+    )
+
+    fc_write.write_yaml(data, str(out_file))
+    assert f"file_entries: {data['file_entries']}" in out_file.read_text()
+    (dataset,) = fc_read.from_yaml(str(out_file))
+    assert fc_read.entries_per_file(dataset).tolist() == data["file_entries"]
+
+    # the incremental update keeps the entries parallel to the files
+    shutil.copy(curation_dir / "events_100.root", curation_dir / "events_000.root")
+    updated = fc_write.prepare_file_list(
+        files, "data", "mc", previous=str(out_file), per_file_entries=True, **kwargs
+    )
+    expected["{prefix}/events_000.root"] = 100
+    assert dict(zip(updated["files"], updated["file_entries"])) == expected
+
+
+def test_prepare_file_list_cluster_boundaries(tmp_path, curation_dir):
+    out_file = tmp_path / "catalogue.yml"
+    data = fc_write.prepare_file_list(
+        [str(curation_dir / "events_*.root")],
+        "data",
+        "mc",
+        "events",
+        "local",
+        per_file_entries=True,
+        cluster_boundaries=True,
+    )
+    clusters = dict(zip(data["files"], data["file_clusters"]))
+    assert clusters[str(curation_dir / "events_100.root")] == [0, 100]
+    assert clusters[str(curation_dir / "events_202.root")] == [0, 202]
+
+    fc_write.write_yaml(data, str(out_file))
+    (dataset,) = fc_read.from_yaml(str(out_file))
+    boundaries = fc_read.cluster_boundaries(dataset)
+    assert [b.tolist() for b in boundaries] == data["file_clusters"]
+
+
+def test_prepare_file_list_branch_schemas(tmp_path, curation_dir, opened):
+    out_file = tmp_path / "catalogue.yml"
+    kwargs: dict[str, Any] = {
+        "tree_name": "events",
+        "expander_name": "local",
+        "no_empty_files": False,
+        "prefix": str(curation_dir),
+    }
+    files = ["events_*.root"]
+    data = fc_write.prepare_file_list(
+        files, "data", "mc", branch_schemas=True, **kwargs
+    )
+    assert data["branches"] == {"events": {"ev": 1}}
+    assert sorted(data["branch_schemas"]["events"]["schemas"]) == ["0", "1"]
+
+    fc_write.write_yaml(data, str(out_file))
+    (dataset,) = fc_read.from_yaml(str(out_file), prefix=str(curation_dir))
+    assert fc_read.files_without_branch(dataset, "ev") == [
+        str(curation_dir / "events_202.root")
+    ]
+    catalogue = fc_read.branch_catalogue(dataset)
+    assert catalogue.counts() == {"ev": 1}
+    with pytest.raises(RuntimeError, match="No branch schemas"):
+        fc_read.branch_catalogue(fc_read.Dataset(name="x"))
+
+    # the incremental update keeps the schemas parallel to the files
+    shutil.copy(curation_dir / "events_202.root", curation_dir / "events_000.root")
+    updated = fc_write.prepare_file_list(
+        files, "data", "mc", previous=str(out_file), branch_schemas=True, **kwargs
+    )
+    assert updated == fc_write.prepare_file_list(
+        files, "data", "mc", branch_schemas=True, **kwargs
+    )
+    assert len(updated["branch_schemas"]["events"]["files"]) == 3
+
+    # removed files are subtracted using their schemas, without a full redo
+    kwargs.update(branch_schemas=True, per_file_entries=True)
+    out_file = tmp_path / "per_file.yml"
+    fc_write.write_yaml(
+        fc_write.prepare_file_list(files, "data", "mc", **kwargs), str(out_file)
+    )
+    (curation_dir / "events_100.root").unlink()
+    opened.clear()
+    updated = fc_write.prepare_file_list(
+        files, "data", "mc", previous=str(out_file), **kwargs
+    )
+    assert opened == []
+    assert updated == fc_write.prepare_file_list(files, "data", "mc", **kwargs)
+    assert updated["branches"] == {"events": {}}
+
+
+@pytest.mark.parametrize("out", ["catalogue.yml", "catalogue/"])
+def test_write_yaml_layered_config(tmp_path, out):
+    out_file = str(tmp_path / out)
+    defaults = {"eventtype": "mc", "tree": "events"}
+    for name in ["one", "two"]:
+        dataset = fc_read.from_dict({"name": name, "files": [f"{name}.root"]}, defaults)
+        assert "!!python" not in fc_write.write_yaml(dataset, out_file)
+
+    datasets = fc_read.from_yaml(out_file)
+    assert [fc_read.as_dict(d) for d in datasets] == [
+        {"name": "one", "eventtype": "mc", "tree": "events", "files": ["one.root"]},
+        {"name": "two", "eventtype": "mc", "tree": "events", "files": ["two.root"]},
+    ]
+
+
+def test_write_yaml_sharded(tmp_path, monkeypatch):
+    catalogue_dir = tmp_path / "catalogue"
+    datasets = [
+        {"name": f"data/{i}", "eventtype": "mc", "files": [f"{i}.root"], "nevents": i}
+        for i in range(3)
+    ]
+    fc_write.write_yaml(datasets[0], f"{catalogue_dir}/")
+    assert catalogue_dir.is_dir()
+
+    # appending to a shard directory does not read the existing shards
+    with monkeypatch.context() as m:
+        m.setattr(fc_write.read, "from_yaml", None)
+        for data in datasets[1:]:
+            fc_write.write_yaml(data, str(catalogue_dir))
+    assert [p.name for p in fc_read.catalogue_shards(catalogue_dir)] == [
+        "000000_data_0.yml",
+        "000001_data_1.yml",
+        "000002_data_2.yml",
+    ]
+    # only the hint for the next shard is left behind
+    assert [p.name for p in catalogue_dir.glob(".*")] == [".next_shard"]
+
+    loaded = fc_read.from_yaml(str(catalogue_dir))
+    assert [fc_read.as_dict(d) for d in loaded] == datasets
+
+    fc_write.write_yaml(dict(datasets[1], nevents=10), str(catalogue_dir), update=True)
+    loaded = fc_read.from_yaml(str(catalogue_dir))
+    assert [d.nevents for d in loaded] == [0, 10, 2]
+
+    with pytest.raises(RuntimeError, match="append=False"):
+        fc_write.write_yaml(datasets[0], str(catalogue_dir), append=False)
+
+    out_file = tmp_path / "combined.yml"
+    fc_write.consolidate(str(catalogue_dir), str(out_file))
+    assert fc_read.from_yaml(str(out_file)) == loaded
+    assert "defaults" in yaml.safe_load(out_file.read_text())
+
+
+def test_write_yaml_sharded_without_listing(tmp_path, monkeypatch):
+    catalogue_dir = tmp_path / "catalogue"
+    fc_write.write_yaml({"name": "one"}, f"{catalogue_dir}/")
+    (catalogue_dir / "000001_two.yml").write_text("datasets: [taken]\n")
+
+    # appends use the hint instead of listing the directory, skipping taken names
+    with monkeypatch.context() as m:
+        m.setattr(fc_write.read, "catalogue_shards", None)
+        fc_write.write_yaml({"name": "two"}, str(catalogue_dir))
+    names = [p.name for p in fc_read.catalogue_shards(catalogue_dir)]
+    assert names == ["000000_one.yml", "000001_two.yml", "000002_two.yml"]
+
+    # without the hint the directory is listed once
+    (catalogue_dir / ".next_shard").unlink()
+    fc_write.write_yaml({"name": "three"}, str(catalogue_dir))
+    assert fc_read.catalogue_shards(catalogue_dir)[-1].name == "000003_three.yml"
+
+
+def test_write_yaml_sharded_without_hard_links(tmp_path, monkeypatch):
+    def link(*_):
+        raise PermissionError(errno.EPERM, "Operation not permitted")
+
+    catalogue_dir = tmp_path / "catalogue"
+    monkeypatch.setattr(fc_write.os, "link", link)
+    for name in ["one", "two"]:
+        fc_write.write_yaml({"name": name}, f"{catalogue_dir}/")
+    (catalogue_dir / ".next_shard").unlink()
+    # an empty shard is a name claimed by another writer
+    (catalogue_dir / "000002_three.yml").touch()
+    fc_write.write_yaml({"name": "three"}, str(catalogue_dir))
+
+    assert [d.name for d in fc_read.from_yaml(str(catalogue_dir))] == [
+        "one",
+        "two",
+        "three",
+    ]
+    assert fc_read.catalogue_shards(catalogue_dir)[-1].name == "000003_three.yml"
+    (catalogue_dir / "000002_three.yml").unlink()
+    assert [p.name for p in catalogue_dir.glob(".*")] == [".next_shard"]
+
+
+def test_from_yaml_sharded_compiled(tmp_path):
+    catalogue_dir = tmp_path / "catalogue"
+    cache_dir = tmp_path / "compiled"
+    fc_write.write_yaml({"name": "one", "files": ["a"]}, f"{catalogue_dir}/")
+    assert len(fc_read.from_yaml(str(catalogue_dir), compiled_cache=cache_dir)) == 1
+
+    fc_write.write_yaml({"name": "two", "files": ["b"]}, str(catalogue_dir))
+    datasets = fc_read.from_yaml(str(catalogue_dir), compiled_cache=cache_dir)
+    assert [d.name for d in datasets] == ["one", "two"]
+
+
+@pytest.mark.parametrize(
+    "files",
+    [
+        [],
+        ["a.root"],
+        ["/a.root", "/b.root"],
+        [f"root://host//store/tree_{i}.root" for i in range(1, 12)],
+        [f"/data/run_{i:04d}.root" for i in (7, 8, 9, 10, 11, 13)],
+        ["/x/f_1.root", "/x/f_2.root", "/y/f_3.root", "/x/f_3.root", "/x/other"],
+        ["{prefix}/d/t_8.root", "{prefix}/d/t_9.root", "{prefix}/d/t_10.root"],
+        ["/d/09.root", "/d/10.root", "/d/011.root", "/d/{index}_1", "/d/{index}_2"],
+    ],
+)
+def test_encode_files_round_trip(files):
+    encoded = fc_write.encode_files(files)
+    assert all(isinstance(entry, dict) for entry in encoded)
+    assert fc_read.expand_files(encoded) == files
+
+
+def test_write_yaml_compressed_files(tmp_path):
+    files = [f"{{prefix}}/store/mc/tree_{i}.root" for i in range(1, 10000)]
+    files.append("{prefix}/store/mc/extra.root")
+    data = {"name": "data", "files": files, "nfiles": 10000}
+    compressed, plain = tmp_path / "compressed.yml", tmp_path / "plain.yml"
+    fc_write.write_yaml(dict(data), str(compressed), compress_files=True)
+    fc_write.write_yaml(dict(data), str(plain))
+    assert compressed.stat().st_size * 100 < plain.stat().st_size
+
+    (dataset,) = fc_read.from_yaml(str(compressed), prefix="root://host/")
+    assert (
+        dataset.files == fc_read.from_yaml(str(plain), prefix="root://host/")[0].files
+    )
+    assert dataset.files[0] == "root://host//store/mc/tree_1.root"
+
+    # appending keeps the other datasets compressed
+    fc_write.write_yaml(
+        {"name": "other", "files": ["a.root"]}, str(compressed), compress_files=True
+    )
+    datasets = fc_read.from_yaml(str(compressed), expand_prefix=False)
+    assert datasets[0].files == files
+    assert "tree_{index}.root" in compressed.read_text()
+
+
+def test_catalogue_dumper_matches_pure_python():
+    shared = ["{prefix}/one.root", "{prefix}/two.root"]
+    contents = {
+        "defaults": {"tree": "events", "prefix": [{"default": "root://host//"}]},
+        "datasets": [
+            {"name": "a", "files": shared, "nevents": 10, "text": "x " * 100},
+            {"name": "b", "files": shared, "branches": {"events": {"é": 2}}},
+        ],
+    }
+    pure = yaml.dump(
+        contents,
+        Dumper=fc_write._catalogue_dumper(yaml.Dumper),
+        default_flow_style=False,
+    )
+    assert "&id" not in pure
+    assert (
+        yaml.dump(contents, Dumper=fc_write.CatalogueDumper, default_flow_style=False)
+        == pure
+    )
+    assert yaml.load(pure, Loader=fc_read.SafeLoader) == yaml.safe_load(pure)
+
+
 def test_get_file_list_expander():
     xrootd = fc_write.get_file_list_expander("xrootd")
     assert xrootd is cat.XrootdExpander
@@ -116,6 +612,9 @@ def test_get_file_list_expander():
     local = fc_write.get_file_list_expander("local")
     assert local is cat.LocalGlobExpander
 
+    scandir = fc_write.get_file_list_expander("scandir")
+    assert scandir is cat.ScandirExpander
+
     with pytest.raises(RuntimeError) as e:
         fc_write.get_file_list_expander("gobbledy gook")
     assert "Unknown catalogue" in str(e)